@@ -1,9 +1,19 @@
 import gzip
 import rdflib
+import numpy as np
 import pandas as pd
 import random
+import argparse
+import os
 from collections import defaultdict
 
+import nt_stream
+import tree_cache
+import wup_matrix
+from mesh_tree import MeshTree
+from pair_sampler import PairSampler, StratifiedPairSampler, parse_strata
+from pair_parquet import ParquetPairWriter, preview_pairs
+
 # --- 配置 ---
 LOCAL_NT_FILE = "nt_data/mesh2026.nt.gz"
 OUTPUT_CSV_FILE = "mesh_dataset.csv"
@@ -121,6 +131,50 @@ def extract_data_from_graph(g):
             print(f"    '{str(desc)}' -> {list(terms)[:3]}...")
             count += 1
 
+    return integrate_tree_number_terms(tree_number_to_descriptor, descriptor_to_terms)
+
+def extract_data_from_nt_stream(nt_file, workers=1):
+    """
+    串流模式: 逐行讀取 N-Triples，只保留 treeNumber 與 rdfs:label 三元組，
+    產生與 extract_data_from_graph 相同的三個對應表，不需要建立完整的 rdflib.Graph。
+    workers > 1 時會將未壓縮的 .nt 檔案切成多個區段，由多個行程平行解析。
+    """
+    print(f"--- 步驟 1+2: 串流解析 RDF 檔案並提取資料 ---")
+    if workers > 1 and nt_file.endswith(".gz"):
+        decompressed_file = nt_file[:-len(".gz")]
+        if os.path.exists(decompressed_file):
+            print(f"平行解析需要未壓縮的檔案，改用 {decompressed_file}。")
+            nt_file = decompressed_file
+        else:
+            print(f"找不到解壓縮後的 {decompressed_file} (請先執行 download.py)，改用單一行程串流解析。")
+            workers = 1
+    print(f"正在串流解析 {nt_file} (行程數: {workers})...")
+    try:
+        if workers > 1:
+            raw_tree_number_to_descriptor, raw_descriptor_labels, line_count = nt_stream.parallel_stream_mesh_nt(nt_file, workers)
+        else:
+            raw_tree_number_to_descriptor, raw_descriptor_labels, line_count = nt_stream.stream_mesh_nt(nt_file)
+    except Exception as e:
+        print(f"串流解析 RDF 檔案時發生錯誤: {e}")
+        raise
+    print(f"解析完成。總掃描行數: {line_count}")
+    return build_maps_from_raw_triples(raw_tree_number_to_descriptor, raw_descriptor_labels)
+
+def build_maps_from_raw_triples(raw_tree_number_to_descriptor, raw_descriptor_labels):
+    """將串流解析得到的原始字串對應表轉成與 rdflib 模式相同的型別 (URIRef、前處理後的術語)。"""
+    tree_number_to_descriptor = defaultdict(list)
+    for tn, uris in raw_tree_number_to_descriptor.items():
+        tree_number_to_descriptor[tn].extend(rdflib.URIRef(u) for u in uris)
+    print(f"找到 {len(tree_number_to_descriptor)} 個唯一的 TreeNumbers 對應到 Descriptors。")
+
+    descriptor_to_terms = defaultdict(set)
+    for desc_uri, labels in raw_descriptor_labels.items():
+        descriptor_to_terms[rdflib.URIRef(desc_uri)].update(preprocess_term(label) for label in labels)
+    print(f"找到 {len(descriptor_to_terms)} 個具有關聯術語的 Descriptors。")
+
+    return integrate_tree_number_terms(tree_number_to_descriptor, descriptor_to_terms)
+
+def integrate_tree_number_terms(tree_number_to_descriptor, descriptor_to_terms):
     # 整合: TreeNumber 到 (Descriptor URI, Terms)
     tree_number_to_all_terms = defaultdict(set)
     tree_number_to_descriptor_uri_map = {} # 追蹤每個 TreeNumber 的一個主要 descriptor URI
@@ -143,7 +197,7 @@ def extract_data_from_graph(g):
     
     return tree_number_to_all_terms, tree_number_to_descriptor_uri_map, descriptor_to_terms
 
-def build_disease_tree(tree_number_to_all_terms, tree_number_to_descriptor_uri_map, descriptor_to_terms, g):
+def build_disease_tree(tree_number_to_all_terms, tree_number_to_descriptor_uri_map, descriptor_to_terms, g=None):
     print("\n--- 步驟 3: 建立 'Diseases [C]' 樹狀結構 ---")
     
     # 1. 從資料中獲取所有以 'C' 開頭的顯式樹狀編號
@@ -184,9 +238,13 @@ def build_disease_tree(tree_number_to_all_terms, tree_number_to_descriptor_uri_m
     descriptors_labels_added = 0
     for tn, node in nodes.items():
         if node.descriptor_uri:
-            # 嘗試從 descriptor 的 rdfs:label 取得術語
-            for label in g.objects(node.descriptor_uri, RDFS.label):
-                node.terms.add(preprocess_term(str(label)))
+            # 嘗試從 descriptor 的 rdfs:label 取得術語 (串流模式沒有 g，改用已前處理的 descriptor_to_terms)
+            if g is not None:
+                labels = (preprocess_term(str(label)) for label in g.objects(node.descriptor_uri, RDFS.label))
+            else:
+                labels = descriptor_to_terms.get(node.descriptor_uri, ())
+            for label in labels:
+                node.terms.add(label)
                 descriptors_labels_added += 1
                 break # We only need one
     if descriptors_labels_added > 0:
@@ -233,6 +291,36 @@ def build_disease_tree(tree_number_to_all_terms, tree_number_to_descriptor_uri_m
 
     return nodes.get('C'), nodes
 
+def nodes_from_tree_arrays(tree_arrays):
+    """由 tree_cache.flatten_tree 格式的陣列重建 MeshNode 物件，回傳 (根節點, 節點字典)。"""
+    term_table = tree_arrays["term_table"]
+    term_offsets = tree_arrays["term_offsets"]
+    term_ids = tree_arrays["term_ids"]
+    ordered_nodes = []
+    for i, (tn, uri) in enumerate(zip(tree_arrays["tree_numbers"], tree_arrays["descriptor_uris"])):
+        terms = [term_table[t] for t in term_ids[term_offsets[i]:term_offsets[i + 1]]]
+        node = MeshNode(tn, rdflib.URIRef(uri) if uri else None, terms)
+        node.depth = int(tree_arrays["depths"][i])
+        ordered_nodes.append(node)
+    # 陣列中父節點一定排在子節點之前
+    for node, parent_index in zip(ordered_nodes, tree_arrays["parents"]):
+        if parent_index >= 0:
+            ordered_nodes[parent_index].add_child(node)
+    nodes = {node.tree_number: node for node in ordered_nodes}
+    return nodes.get('C'), nodes
+
+def load_cached_disease_tree(cache_file=tree_cache.DEFAULT_TREE_CACHE_FILE, nt_file=None):
+    """
+    從快取載入 'Diseases [C]' 樹，供 create_dataset.py 以外的程式使用。
+
+    若提供 nt_file，會檢查快取是否由同一份來源檔案與相同程式版本產生；不符時回傳 (None, None)。
+    """
+    cache_key = tree_cache.compute_cache_key(nt_file, cache_file) if nt_file else None
+    tree_arrays = tree_cache.load_tree_cache(cache_file, cache_key)
+    if tree_arrays is None:
+        return None, None
+    return nodes_from_tree_arrays(tree_arrays)
+
 def print_subtree_info(node, level=0):
     """遞迴地印出一個節點及其所有子節點的詳細資訊。"""
     indent = "  " * level
@@ -350,12 +438,70 @@ def preprocess_term(term):
     # 轉小寫並去除多餘空白
     return term.lower().strip()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="解析 MeSH 'Diseases [C]' 樹並產生 WUP 相似度資料集")
+    parser.add_argument("--nt-file", default=LOCAL_NT_FILE, help="MeSH N-Triples 檔案 (.nt 或 .nt.gz)")
+    parser.add_argument("--stream", action="store_true",
+                        help="串流模式: 逐行讀取並只保留需要的三元組，不建立完整的 rdflib.Graph")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="平行解析的行程數 (大於 1 時自動使用串流模式，需要未壓縮的 .nt 檔案)")
+    parser.add_argument("--tree-cache", default=tree_cache.DEFAULT_TREE_CACHE_FILE,
+                        help="'Diseases [C]' 樹狀結構快取檔路徑")
+    parser.add_argument("--rebuild", action="store_true", help="刪除既有快取並重新解析 RDF 建立樹狀結構")
+    parser.add_argument("--no-cache", action="store_true", help="不讀取也不寫入樹狀結構快取")
+    parser.add_argument("--wup-matrix", metavar="NPY_FILE",
+                        help="計算所有節點兩兩之間的 WUP 相似度矩陣並寫入記憶體映射檔案 (取代取樣流程)")
+    parser.add_argument("--wup-matrix-dtype", choices=wup_matrix.SUPPORTED_DTYPES, default="float16",
+                        help="相似度矩陣的儲存型別 (uint8 為 round(sim * 255) 量化)")
+    parser.add_argument("--wup-matrix-upper", action="store_true", help="只儲存上三角 (含對角線)")
+    parser.add_argument("--wup-matrix-block-size", type=int, default=256, help="每個區塊計算的列數")
+    parser.add_argument("--no-resume", action="store_true", help="忽略既有進度，從頭計算相似度矩陣")
+    parser.add_argument("--samples", type=int, default=SAMPLING_QUANTITY, help="要產生的術語配對數量")
+    parser.add_argument("--sampler", choices=("loop", "vectorized"), default="loop",
+                        help="取樣方式: loop 為逐次嘗試的原始迴圈，vectorized 為 NumPy 批次取樣")
+    parser.add_argument("--seed", type=int, default=None, help="取樣用的亂數種子 (指定後結果可重現)")
+    parser.add_argument("--output", default=OUTPUT_CSV_FILE,
+                        help="輸出檔案；副檔名為 .parquet 時以 Parquet (字典編碼術語、float32 相似度) 逐批寫出")
+    parser.add_argument("--with-tree-numbers", action="store_true",
+                        help="Parquet 輸出額外儲存兩個術語的來源 tree number (僅 vectorized / 分層取樣)")
+    parser.add_argument("--strata", metavar="DEPTH:COUNT,...",
+                        help="依 LCS 深度分層取樣，例如 '1:50000,2:50000,3:50000,4:50000' (會忽略 --samples 與 --sampler)")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+
     # --- 第 1 部分: 資料處理與樹狀結構 ---
-    g = parse_mesh_rdf(LOCAL_NT_FILE)
-    tree_number_to_all_terms, tree_number_to_descriptor_uri_map, descriptor_to_terms = extract_data_from_graph(g)
+    disease_root, all_disease_nodes = None, None
+    cache_key = None
+    if not args.no_cache:
+        print(f"--- 檢查樹狀結構快取: {args.tree_cache} ---")
+        # --rebuild 時不沿用舊快取中的雜湊
+        cache_key = tree_cache.compute_cache_key(args.nt_file, None if args.rebuild else args.tree_cache)
+        if args.rebuild:
+            if tree_cache.invalidate_tree_cache(args.tree_cache):
+                print("已刪除既有快取，將重新建立。")
+        else:
+            tree_arrays = tree_cache.load_tree_cache(args.tree_cache, cache_key)
+            if tree_arrays is not None:
+                disease_root, all_disease_nodes = nodes_from_tree_arrays(tree_arrays)
+                print(f"已從快取載入 {len(all_disease_nodes)} 個節點，略過 RDF 解析。")
+            else:
+                print("快取不存在或已失效 (來源檔案或程式版本不同)，將重新建立。")
+
+    if disease_root is None:
+        if args.stream or args.workers > 1:
+            g = None
+            tree_number_to_all_terms, tree_number_to_descriptor_uri_map, descriptor_to_terms = extract_data_from_nt_stream(args.nt_file, args.workers)
+        else:
+            g = parse_mesh_rdf(args.nt_file)
+            tree_number_to_all_terms, tree_number_to_descriptor_uri_map, descriptor_to_terms = extract_data_from_graph(g)
 
-    disease_root, all_disease_nodes = build_disease_tree(tree_number_to_all_terms, tree_number_to_descriptor_uri_map, descriptor_to_terms, g)
+        disease_root, all_disease_nodes = build_disease_tree(tree_number_to_all_terms, tree_number_to_descriptor_uri_map, descriptor_to_terms, g)
+
+        if disease_root and cache_key is not None:
+            tree_cache.save_tree_cache(args.tree_cache, tree_cache.flatten_tree(all_disease_nodes), cache_key)
+            print(f"已將樹狀結構寫入快取: {args.tree_cache}")
 
     if not disease_root:
         print("建立 'Diseases [C]' 樹失敗。正在結束程式。")
@@ -389,9 +535,22 @@ def main():
     else:
         print("在資料中找不到 C21 節點。")
 
+    # --- 完整相似度矩陣模式 ---
+    if args.wup_matrix:
+        print(f"\n--- 步驟 5: 計算完整的 WUP 相似度矩陣 ({total_nodes} x {total_nodes}) ---")
+        wup_matrix.export_wup_matrix(
+            MeshTree.from_nodes(all_disease_nodes),
+            args.wup_matrix,
+            dtype=args.wup_matrix_dtype,
+            upper_triangle=args.wup_matrix_upper,
+            block_size=args.wup_matrix_block_size,
+            resume=not args.no_resume,
+        )
+        return
 
     # --- 第 2 部分: 取樣與相似度計算 ---
-    print(f"\n--- 步驟 5: 為 CSV 檔案產生 {SAMPLING_QUANTITY} 個樣本 ---")
+    sampling_quantity = args.samples
+    print(f"\n--- 步驟 5: 為 CSV 檔案產生 {sampling_quantity} 個樣本 ---")
     
     valid_sampling_nodes = [node for node in all_disease_nodes.values() if node.terms and len(node.terms) > 0]
     print(f"找到 {len(valid_sampling_nodes)} 個可用於取樣的節點。")
@@ -399,14 +558,114 @@ def main():
         print("沒有足夠的節點來進行取樣。正在結束程式。")
         return
 
+    use_mesh_tree = bool(args.strata) or args.sampler == "vectorized"
+    mesh_tree = MeshTree.from_nodes(all_disease_nodes) if use_mesh_tree else None
+
+    writer = None
+    if args.output.endswith(".parquet"):
+        if args.with_tree_numbers and not use_mesh_tree:
+            print("警告: 原始迴圈取樣器不支援 --with-tree-numbers，將只輸出術語與相似度。")
+        tree_numbers = mesh_tree.tree_numbers if (use_mesh_tree and args.with_tree_numbers) else None
+        writer = ParquetPairWriter(args.output, mesh_tree.term_table if use_mesh_tree else [], tree_numbers)
+
+    # 向量化 / 分層取樣搭配 Parquet 輸出時，每批配對直接寫入 writer，不在記憶體中建立完整的 DataFrame
+    if args.strata:
+        df = sample_pairs_stratified(mesh_tree, parse_strata(args.strata), args.seed, writer)
+    elif args.sampler == "vectorized":
+        df = sample_pairs_vectorized(mesh_tree, sampling_quantity, args.seed, writer)
+    else:
+        if args.seed is not None:
+            random.seed(args.seed)
+        df = pd.DataFrame(sample_pairs_with_loop(valid_sampling_nodes, sampling_quantity))
+        if writer:
+            writer.write_dataframe(df)
+
+    if writer:
+        writer.close()
+        num_samples = writer.rows_written
+        head = preview_pairs(args.output)
+    else:
+        df.to_csv(args.output, index=False)
+        num_samples = len(df)
+        head = df.head()
+    print(f"\n--- 步驟 6: 輸出 ---")
+    print(f"已產生 {num_samples} 個樣本並儲存至 {args.output}")
+    print("輸出檔案的前 5 列:")
+    print(head)
+
+def sample_pairs_vectorized(tree, sampling_quantity, seed=None, writer=None):
+    """
+    以 PairSampler 批次取樣，回傳與原始迴圈相同欄位的 DataFrame。
+
+    提供 writer (ParquetPairWriter) 時每批配對直接寫入 writer 且不保留在記憶體中，回傳 None。
+    """
+    print("開始向量化取樣過程...")
+    result = PairSampler(tree, seed).sample(sampling_quantity, batch_callback=_streaming_callback(tree, writer),
+                                            keep_pairs=writer is None)
+    print("取樣完成。")
+    if result["num_samples"] < sampling_quantity:
+        print(f"警告: 在 {result['attempts']} 次嘗試後，只能產生 {result['num_samples']} 個唯一樣本（要求為 {sampling_quantity}）。")
+
+    return sampled_pairs_to_dataframe(tree, result) if writer is None else None
+
+def sample_pairs_stratified(tree, strata, seed=None, writer=None):
+    """以 StratifiedPairSampler 依 LCS 深度分層取樣；回傳值與 writer 的用法同 sample_pairs_vectorized。"""
+    print(f"開始分層取樣過程 (LCS 深度: 目標數量 = {strata})...")
+    result = StratifiedPairSampler(tree, seed).sample_strata(strata, batch_callback=_streaming_callback(tree, writer),
+                                                             keep_pairs=writer is None)
+    print("取樣完成。")
+    total_target = sum(strata.values())
+    if result["num_samples"] < total_target:
+        print(f"警告: 只能產生 {result['num_samples']} 個唯一樣本（要求為 {total_target}）。")
+    return sampled_pairs_to_dataframe(tree, result) if writer is None else None
+
+def _streaming_callback(tree, writer):
+    # 逐批寫入 writer，並與非串流模式一樣詳細記錄最先產生的 20 個樣本
+    if writer is None:
+        return None
+    logged = 0
+
+    def callback(batch):
+        nonlocal logged
+        if logged < 20:
+            logged += log_sampled_pairs(tree, batch, 20 - logged, start=logged)
+        writer.write_batch(batch)
+    return callback
+
+def log_sampled_pairs(tree, pairs, limit=20, start=0):
+    """詳細記錄 pairs (取樣器的 id 陣列) 中前 limit 個樣本，回傳記錄的數量。"""
+    count = min(limit, len(pairs["term_a"]))
+    for k in range(count):
+        tn1 = tree.tree_numbers[pairs["node_a"][k]]
+        tn2 = tree.tree_numbers[pairs["node_b"][k]]
+        wup_similarity(tn1, tn2, log_example=True)
+        print(f"  - 樣本 #{start + k + 1}:")
+        print(f"    - Node1: '{tn1}' | Term: '{tree.term_table[pairs['term_a'][k]]}'")
+        print(f"    - Node2: '{tn2}' | Term: '{tree.term_table[pairs['term_b'][k]]}'")
+    return count
+
+def sampled_pairs_to_dataframe(tree, result):
+    """將取樣器回傳的 id 陣列轉成 word_i / word_j / wup_similarity 的 DataFrame，並印出前 20 個樣本。"""
+    # 詳細記錄前 20 個樣本
+    log_sampled_pairs(tree, result)
+
+    term_table = np.array(tree.term_table, dtype=object)
+    return pd.DataFrame({
+        "word_i": term_table[result["term_a"]],
+        "word_j": term_table[result["term_b"]],
+        "wup_similarity": result["wup_similarity"],
+    })
+
+def sample_pairs_with_loop(valid_sampling_nodes, sampling_quantity):
+    """原始的逐次嘗試取樣迴圈，回傳 [{word_i, word_j, wup_similarity}, ...]。"""
     sampled_pairs_data = []
     seen_term_pairs = set() # 用於確保 (term_i, term_j) 的組合是唯一的
 
     attempts = 0
-    max_attempts = SAMPLING_QUANTITY * 20 # 防止因唯一配對稀少而導致無限迴圈
+    max_attempts = sampling_quantity * 20 # 防止因唯一配對稀少而導致無限迴圈
 
     print("開始取樣過程...")
-    while len(sampled_pairs_data) < SAMPLING_QUANTITY and attempts < max_attempts:
+    while len(sampled_pairs_data) < sampling_quantity and attempts < max_attempts:
         attempts += 1
         
         # 修改：允許重複取樣節點
@@ -442,18 +701,13 @@ def main():
         seen_term_pairs.add(current_term_pair)
         
         if (len(sampled_pairs_data) % 100000 == 0) and not log_this_sample:
-            print(f"  已產生 {len(sampled_pairs_data)}/{SAMPLING_QUANTITY} 個樣本...")
+            print(f"  已產生 {len(sampled_pairs_data)}/{sampling_quantity} 個樣本...")
 
     print("取樣完成。")
-    if len(sampled_pairs_data) < SAMPLING_QUANTITY:
-        print(f"警告: 在 {attempts} 次嘗試後，只能產生 {len(sampled_pairs_data)} 個唯一樣本（要求為 {SAMPLING_QUANTITY}）。")
+    if len(sampled_pairs_data) < sampling_quantity:
+        print(f"警告: 在 {attempts} 次嘗試後，只能產生 {len(sampled_pairs_data)} 個唯一樣本（要求為 {sampling_quantity}）。")
 
-    df = pd.DataFrame(sampled_pairs_data)
-    df.to_csv(OUTPUT_CSV_FILE, index=False)
-    print(f"\n--- 步驟 6: 輸出 ---")
-    print(f"已產生 {len(df)} 個樣本並儲存至 {OUTPUT_CSV_FILE}")
-    print("輸出檔案的前 5 列:")
-    print(df.head())
+    return sampled_pairs_data
 
 if __name__ == "__main__":
     main()
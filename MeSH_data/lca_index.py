@@ -0,0 +1,159 @@
+import argparse
+import time
+
+import numpy as np
+
+from mesh_tree import MeshTree
+import tree_cache
+
+class LCAIndex:
+    """
+    以 Euler tour + sparse table 建立的最低共同上層 (LCA/LCS) 索引。
+
+    前處理 O(n log n)，之後每次查詢 LCS 與 Wu-Palmer 相似度都是 O(1)，
+    適合計算所有疾病節點兩兩之間的相似度矩陣。
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self._build_euler_tour()
+        self._build_sparse_table()
+
+    def _build_euler_tour(self):
+        tree = self.tree
+        root = tree.root if tree.root is not None else int(np.flatnonzero(tree.parents < 0)[0])
+        euler_nodes = []
+        first_visit = np.full(len(tree), -1, dtype=np.int32)
+        # 以堆疊模擬遞迴：(節點, 下一個要拜訪的子節點位置)
+        stack = [(root, int(tree.child_offsets[root]))]
+        first_visit[root] = 0
+        euler_nodes.append(root)
+        while stack:
+            node_id, child_pos = stack[-1]
+            if child_pos < tree.child_offsets[node_id + 1]:
+                stack[-1] = (node_id, child_pos + 1)
+                child_id = int(tree.child_ids[child_pos])
+                first_visit[child_id] = len(euler_nodes)
+                euler_nodes.append(child_id)
+                stack.append((child_id, int(tree.child_offsets[child_id])))
+            else:
+                stack.pop()
+                if stack:
+                    euler_nodes.append(stack[-1][0])
+        self.euler_nodes = np.array(euler_nodes, dtype=np.int32)
+        self.euler_depths = tree.depths[self.euler_nodes]
+        self.first_visit = first_visit
+
+    def _build_sparse_table(self):
+        # sparse_table[k][i] = euler 區間 [i, i + 2^k) 中深度最小的位置
+        length = len(self.euler_nodes)
+        levels = [np.arange(length, dtype=np.int32)]
+        span = 1
+        while span * 2 <= length:
+            previous = levels[-1]
+            left = previous[:length - span * 2 + 1]
+            right = previous[span:span + len(left)]
+            levels.append(np.where(self.euler_depths[left] <= self.euler_depths[right], left, right).astype(np.int32))
+            span *= 2
+        self.sparse_table = levels
+        self._log2 = np.zeros(length + 1, dtype=np.int32)
+        self._log2[2:] = np.floor(np.log2(np.arange(2, length + 1))).astype(np.int32)
+
+    def lca(self, node_a, node_b):
+        """回傳兩個節點 (id 或 tree number) 的 LCA 節點 id。"""
+        left = self.first_visit[self.tree.node_id(node_a)]
+        right = self.first_visit[self.tree.node_id(node_b)]
+        if left > right:
+            left, right = right, left
+        level = self._log2[right - left + 1]
+        candidate_a = self.sparse_table[level][left]
+        candidate_b = self.sparse_table[level][right - (1 << level) + 1]
+        best = candidate_a if self.euler_depths[candidate_a] <= self.euler_depths[candidate_b] else candidate_b
+        return int(self.euler_nodes[best])
+
+    def lca_batch(self, nodes_a, nodes_b):
+        """向量化版本的 lca，回傳 LCA 節點 id 陣列。"""
+        ids_a = self.tree._as_node_ids(nodes_a)
+        ids_b = self.tree._as_node_ids(nodes_b)
+        first_a = self.first_visit[ids_a]
+        first_b = self.first_visit[ids_b]
+        left = np.minimum(first_a, first_b)
+        right = np.maximum(first_a, first_b)
+        levels = self._log2[right - left + 1]
+        best = np.empty(len(left), dtype=np.int32)
+        # 依查詢區間長度所屬的層分組，每層各做一次向量化查表
+        for level in np.unique(levels):
+            mask = levels == level
+            candidate_a = self.sparse_table[level][left[mask]]
+            candidate_b = self.sparse_table[level][right[mask] - (1 << int(level)) + 1]
+            best[mask] = np.where(self.euler_depths[candidate_a] <= self.euler_depths[candidate_b], candidate_a, candidate_b)
+        return self.euler_nodes[best]
+
+    def lcs(self, tn1, tn2):
+        """回傳 (LCS tree number, LCS 深度)，與 get_lcs_path_and_depth 相同。"""
+        lcs_id = self.lca(tn1, tn2)
+        return self.tree.tree_numbers[lcs_id], int(self.tree.depths[lcs_id])
+
+    def wup_similarity(self, tn1, tn2):
+        """O(1) 的 Wu-Palmer 相似度，結果與 create_dataset.wup_similarity 相同。"""
+        id1 = self.tree.node_id(tn1)
+        id2 = self.tree.node_id(tn2)
+        if id1 == id2:
+            return 1.0
+        depth_lcs = int(self.tree.depths[self.lca(id1, id2)])
+        return (2.0 * depth_lcs) / (int(self.tree.depths[id1]) + int(self.tree.depths[id2]))
+
+    def wup_similarity_batch(self, nodes_a, nodes_b):
+        ids_a = self.tree._as_node_ids(nodes_a)
+        ids_b = self.tree._as_node_ids(nodes_b)
+        lcs_depths = self.tree.depths[self.lca_batch(ids_a, ids_b)].astype(np.float64)
+        similarity = (2.0 * lcs_depths) / (self.tree.depths[ids_a].astype(np.float64) + self.tree.depths[ids_b])
+        similarity[ids_a == ids_b] = 1.0
+        return similarity
+
+def benchmark_lca(tree, scalar_lcs_fn, num_pairs=200000, seed=42):
+    """比較 get_lcs_path_and_depth (scalar_lcs_fn)、LCAIndex 逐對查詢與批次查詢的速度，並確認結果一致。"""
+    rng = np.random.default_rng(seed)
+    ids_a = rng.integers(0, len(tree), num_pairs)
+    ids_b = rng.integers(0, len(tree), num_pairs)
+    tns_a = [tree.tree_numbers[i] for i in ids_a]
+    tns_b = [tree.tree_numbers[i] for i in ids_b]
+
+    start_time = time.perf_counter()
+    index = LCAIndex(tree)
+    build_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    expected = [scalar_lcs_fn(a, b)[1] for a, b in zip(tns_a, tns_b)]
+    scalar_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    single = [index.lcs(a, b)[1] for a, b in zip(tns_a, tns_b)]
+    single_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    batch = tree.depths[index.lca_batch(ids_a, ids_b)]
+    batch_time = time.perf_counter() - start_time
+
+    mismatches = int(np.count_nonzero(np.array(expected) != batch)) + sum(e != s for e, s in zip(expected, single))
+    print(f"--- LCA 索引效能比較 ({len(tree)} 個節點, {num_pairs:,} 組配對) ---")
+    print(f"  索引建立時間: {build_time:.3f} 秒")
+    print(f"  get_lcs_path_and_depth: {scalar_time:.3f} 秒 ({num_pairs / scalar_time:,.0f} 組/秒)")
+    print(f"  LCAIndex.lcs (逐對):    {single_time:.3f} 秒 ({num_pairs / single_time:,.0f} 組/秒)")
+    print(f"  LCAIndex.lca_batch:     {batch_time:.3f} 秒 ({num_pairs / max(batch_time, 1e-9):,.0f} 組/秒)")
+    print(f"  結果不一致的配對數: {mismatches}")
+    return {"build": build_time, "scalar": scalar_time, "single": single_time, "batch": batch_time, "mismatches": mismatches}
+
+if __name__ == "__main__":
+    from create_dataset import get_lcs_path_and_depth
+
+    parser = argparse.ArgumentParser(description="LCA 索引與 get_lcs_path_and_depth 的效能比較")
+    parser.add_argument("--tree-cache", default=tree_cache.DEFAULT_TREE_CACHE_FILE,
+                        help="create_dataset.py 產生的樹狀結構快取")
+    parser.add_argument("--pairs", type=int, default=200000)
+    args = parser.parse_args()
+
+    mesh_tree = MeshTree.from_cache(args.tree_cache)
+    if mesh_tree is None:
+        raise SystemExit(f"找不到樹狀結構快取 {args.tree_cache}，請先執行 create_dataset.py。")
+    benchmark_lca(mesh_tree, get_lcs_path_and_depth, args.pairs)
@@ -0,0 +1,207 @@
+import numpy as np
+
+import tree_cache
+
+class MeshTree:
+    """
+    以 NumPy 陣列儲存的 'Diseases [C]' 樹，取代每個節點一個 MeshNode 物件的表示法。
+
+    節點以整數 id 表示 (依深度、tree number 排序，父節點必定排在子節點之前)：
+        - parents: 父節點 id (根節點為 -1)
+        - depths: get_depth 規則下的深度
+        - child_offsets / child_ids: 子節點的 CSR 索引 (同一父節點的子節點依 tree number 排序)
+        - term_table + term_offsets / term_ids: 共用 (interned) 的術語表與每個節點術語的 CSR 索引
+    所有存取方法都接受節點 id 或 tree number 字串。
+    """
+
+    def __init__(self, tree_numbers, parents, depths, descriptor_uris, term_table, term_offsets, term_ids):
+        self.tree_numbers = list(tree_numbers)
+        self.parents = np.asarray(parents, dtype=np.int32)
+        self.depths = np.asarray(depths, dtype=np.int16)
+        self.descriptor_uris = list(descriptor_uris)
+        self.term_table = list(term_table)
+        self.term_offsets = np.asarray(term_offsets, dtype=np.int32)
+        self.term_ids = np.asarray(term_ids, dtype=np.int32)
+        self._build_children()
+        self._build_index()
+        self._build_ancestor_paths()
+
+    @classmethod
+    def from_arrays(cls, tree_arrays):
+        """由 tree_cache.flatten_tree / load_tree_cache 格式的陣列建立。"""
+        return cls(
+            tree_arrays["tree_numbers"],
+            tree_arrays["parents"],
+            tree_arrays["depths"],
+            tree_arrays["descriptor_uris"],
+            tree_arrays["term_table"],
+            tree_arrays["term_offsets"],
+            tree_arrays["term_ids"],
+        )
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        """由 build_disease_tree 回傳的 {tree_number: MeshNode} 建立。"""
+        return cls.from_arrays(tree_cache.flatten_tree(nodes))
+
+    @classmethod
+    def from_cache(cls, cache_file=tree_cache.DEFAULT_TREE_CACHE_FILE, cache_key=None):
+        """由樹狀結構快取建立；快取不存在或失效時回傳 None。"""
+        tree_arrays = tree_cache.load_tree_cache(cache_file, cache_key)
+        return cls.from_arrays(tree_arrays) if tree_arrays is not None else None
+
+    def to_arrays(self):
+        return {
+            "tree_numbers": self.tree_numbers,
+            "parents": self.parents,
+            "depths": self.depths,
+            "descriptor_uris": self.descriptor_uris,
+            "term_table": self.term_table,
+            "term_offsets": self.term_offsets,
+            "term_ids": self.term_ids,
+        }
+
+    def _build_children(self):
+        has_parent = self.parents >= 0
+        child_counts = np.bincount(self.parents[has_parent], minlength=len(self.parents))
+        self.child_offsets = np.zeros(len(self.parents) + 1, dtype=np.int32)
+        np.cumsum(child_counts, out=self.child_offsets[1:])
+        # 穩定排序：同一父節點的子節點維持原本 (tree number) 的順序
+        child_order = np.argsort(self.parents, kind='stable')
+        self.child_ids = child_order[np.count_nonzero(~has_parent):].astype(np.int32)
+
+    def _build_ancestor_paths(self):
+        # ancestor_paths[i, k] = 節點 i 在深度 k+1 的祖先 id (最後一個有效欄位就是 i 本身)，不足處填 -1。
+        # 在 'C' 樹中節點深度恰好等於根到該節點的路徑長度，因此 LCS 深度 = 兩條路徑的共同前綴長度。
+        max_depth = int(self.depths.max()) if len(self.depths) else 0
+        self.ancestor_paths = np.full((len(self.parents), max_depth), -1, dtype=np.int32)
+        for node_id, parent_id in enumerate(self.parents):
+            if parent_id >= 0:
+                self.ancestor_paths[node_id] = self.ancestor_paths[parent_id]
+            self.ancestor_paths[node_id, self.depths[node_id] - 1] = node_id
+
+    def _build_index(self):
+        self._index = {tn: i for i, tn in enumerate(self.tree_numbers)}
+
+    # tree number 索引可由 tree_numbers 重建，不需要跟著 pickle 傳給 worker 行程
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_index()
+
+    def __len__(self):
+        return len(self.tree_numbers)
+
+    def __contains__(self, tree_number):
+        return tree_number in self._index
+
+    def __repr__(self):
+        return f"MeshTree(nodes={len(self)}, terms={len(self.term_table)})"
+
+    def node_id(self, node):
+        """將 tree number 轉成節點 id；傳入的已經是 id 則原樣回傳。"""
+        if isinstance(node, str):
+            return self._index[node]
+        return int(node)
+
+    def node_ids(self, tree_numbers):
+        return np.fromiter((self._index[tn] for tn in tree_numbers), dtype=np.int32, count=len(tree_numbers))
+
+    @property
+    def root(self):
+        return self._index.get('C')
+
+    def tree_number(self, node):
+        return self.tree_numbers[self.node_id(node)]
+
+    def parent(self, node):
+        """父節點 id；根節點回傳 None。"""
+        parent_id = int(self.parents[self.node_id(node)])
+        return parent_id if parent_id >= 0 else None
+
+    def children(self, node):
+        node_id = self.node_id(node)
+        return self.child_ids[self.child_offsets[node_id]:self.child_offsets[node_id + 1]]
+
+    def depth(self, node):
+        return int(self.depths[self.node_id(node)])
+
+    def descriptor_uri(self, node):
+        return self.descriptor_uris[self.node_id(node)] or None
+
+    def term_ids_of(self, node):
+        node_id = self.node_id(node)
+        return self.term_ids[self.term_offsets[node_id]:self.term_offsets[node_id + 1]]
+
+    def terms(self, node):
+        return [self.term_table[t] for t in self.term_ids_of(node)]
+
+    def term_counts(self):
+        return np.diff(self.term_offsets)
+
+    def print_subtree_info(self, node, level=0):
+        """遞迴地印出一個節點及其所有子節點的詳細資訊 (輸出格式與 create_dataset.print_subtree_info 相同)。"""
+        node_id = self.node_id(node)
+        indent = "  " * level
+        parent_id = self.parent(node_id)
+        parent_tn = self.tree_numbers[parent_id] if parent_id is not None else "None"
+        terms = set(self.terms(node_id))
+
+        print(f"{indent}--- Node: {self.tree_numbers[node_id]} ---")
+        print(f"{indent}  - 深度 (Depth): {self.depth(node_id)}")
+        print(f"{indent}  - 父節點 (Parent): {parent_tn}")
+        print(f"{indent}  - 子節點數量 (Children): {len(self.children(node_id))}")
+        print(f"{indent}  - 描述符 URI (Descriptor): {self.descriptor_uri(node_id)}")
+        print(f"{indent}  - 術語 (Terms): {terms if terms else '{}'}")
+
+        for child_id in self.children(node_id):
+            self.print_subtree_info(child_id, level + 1)
+
+    # --- 批次 Wu-Palmer 相似度 ---
+
+    def _as_node_ids(self, nodes):
+        nodes = np.asarray(nodes)
+        if np.issubdtype(nodes.dtype, np.integer):
+            return nodes.astype(np.int64, copy=False)
+        return self.node_ids(nodes.tolist()).astype(np.int64)
+
+    def lcs_depth_batch(self, nodes_a, nodes_b, chunk_size=1_000_000):
+        """
+        以向量化的祖先路徑前綴比較，計算多組節點的最低共同上層 (LCS) 深度。
+
+        Args:
+            nodes_a, nodes_b: 等長的節點 id 陣列或 tree number 陣列。
+        Returns:
+            np.ndarray (int16): 每一組的 LCS 深度，與 get_lcs_path_and_depth 的深度相同。
+        """
+        ids_a = self._as_node_ids(nodes_a)
+        ids_b = self._as_node_ids(nodes_b)
+        lcs_depths = np.empty(len(ids_a), dtype=np.int16)
+        for start in range(0, len(ids_a), chunk_size):
+            paths_a = self.ancestor_paths[ids_a[start:start + chunk_size]]
+            paths_b = self.ancestor_paths[ids_b[start:start + chunk_size]]
+            same = (paths_a == paths_b) & (paths_a >= 0)
+            # 共同前綴長度：第一個不相同位置之前的 True 數量
+            lcs_depths[start:start + chunk_size] = np.logical_and.accumulate(same, axis=1).sum(axis=1)
+        return lcs_depths
+
+    def wup_similarity_batch(self, nodes_a, nodes_b, chunk_size=1_000_000):
+        """
+        批次計算 Wu-Palmer 相似度，結果與逐對呼叫 create_dataset.wup_similarity 完全相同。
+
+        Args:
+            nodes_a, nodes_b: 等長的節點 id 陣列或 tree number 陣列 (tree number 必須存在於樹中)。
+        Returns:
+            np.ndarray (float64): 2 * depth(LCS) / (depth(a) + depth(b))；相同節點為 1.0。
+        """
+        ids_a = self._as_node_ids(nodes_a)
+        ids_b = self._as_node_ids(nodes_b)
+        lcs_depths = self.lcs_depth_batch(ids_a, ids_b, chunk_size).astype(np.float64)
+        depth_sums = self.depths[ids_a].astype(np.float64) + self.depths[ids_b]
+        similarity = np.divide(2.0 * lcs_depths, depth_sums, out=np.zeros(len(ids_a)), where=lcs_depths > 0)
+        similarity[ids_a == ids_b] = 1.0
+        return similarity
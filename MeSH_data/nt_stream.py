@@ -0,0 +1,220 @@
+import argparse
+import gzip
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 只保留 create_dataset.py 實際會用到的述詞
+TREE_NUMBER_PREDICATE = "http://id.nlm.nih.gov/mesh/vocab#treeNumber"
+LABEL_PREDICATE = "http://www.w3.org/2000/01/rdf-schema#label"
+
+_TREE_NUMBER_TOKEN = f"<{TREE_NUMBER_PREDICATE}>"
+_LABEL_TOKEN = f"<{LABEL_PREDICATE}>"
+
+# N-Triples 字串常值的跳脫字元 (\" \\ \n \uXXXX \UXXXXXXXX ...)
+_ESCAPE_RE = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|[tbnrf"\'\\])')
+_SIMPLE_ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+def _replace_escape(match):
+    esc = match.group(1)
+    if esc[0] in 'uU':
+        return chr(int(esc[1:], 16))
+    return _SIMPLE_ESCAPES[esc]
+
+def unescape_literal(lexical):
+    """將 N-Triples 字串常值中的跳脫字元還原 (與 rdflib 的 str(Literal) 結果相同)。"""
+    if '\\' not in lexical:
+        return lexical
+    return _ESCAPE_RE.sub(_replace_escape, lexical)
+
+def is_descriptor_uri(uri):
+    """判斷 URI 是否為 Descriptor (例如 .../mesh/2026/D000001)。"""
+    local_name = uri.rsplit('/', 1)[-1]
+    return local_name[:1] == 'D' and local_name[1:].isdigit()
+
+def _split_subject(line):
+    # 主詞必須是 IRI；空白節點與註解行都略過
+    if not line.startswith('<'):
+        return None, None
+    end = line.find('> ')
+    if end < 0:
+        return None, None
+    return line[1:end], line[end + 2:]
+
+def parse_relevant_line(line):
+    """
+    解析單行 N-Triples，只處理 treeNumber 與 rdfs:label 兩種述詞。
+
+    Returns:
+        ('treeNumber', 主詞 URI, tree number) 或 ('label', 主詞 URI, 標籤字串)；
+        其他述詞回傳 None。
+    """
+    if _TREE_NUMBER_TOKEN in line:
+        subject, rest = _split_subject(line)
+        if subject is None or not rest.startswith(_TREE_NUMBER_TOKEN):
+            return None
+        obj = rest[len(_TREE_NUMBER_TOKEN):].strip()
+        if not obj.startswith('<'):
+            return None
+        tree_number_uri = obj[1:obj.index('>')]
+        return 'treeNumber', subject, tree_number_uri.split('/')[-1]
+
+    if _LABEL_TOKEN in line:
+        subject, rest = _split_subject(line)
+        if subject is None or not rest.startswith(_LABEL_TOKEN):
+            return None
+        obj = rest[len(_LABEL_TOKEN):].strip()
+        if not obj.startswith('"'):
+            return None
+        closing_quote = obj.rfind('"')
+        if closing_quote <= 0:
+            return None
+        return 'label', subject, unescape_literal(obj[1:closing_quote])
+
+    return None
+
+def collect_relevant_triples(lines):
+    """
+    逐行掃描 N-Triples，只收集需要的三元組。
+
+    記憶體只與 Descriptor 數量相關 (約數萬筆)，與檔案中的三元組總數無關。
+
+    Returns:
+        tuple: (tree_number_to_descriptor, descriptor_labels, line_count)
+            - tree_number_to_descriptor: dict[str, list[str]]，TreeNumber -> Descriptor URI 列表
+            - descriptor_labels: dict[str, list[str]]，Descriptor URI -> 原始 rdfs:label 列表
+    """
+    tree_number_to_descriptor = {}
+    descriptor_labels = {}
+    line_count = 0
+    for line in lines:
+        line_count += 1
+        parsed = parse_relevant_line(line)
+        if parsed is None:
+            continue
+        kind, subject, value = parsed
+        if kind == 'treeNumber':
+            tree_number_to_descriptor.setdefault(value, []).append(subject)
+        elif is_descriptor_uri(subject):
+            descriptor_labels.setdefault(subject, []).append(value)
+    return tree_number_to_descriptor, descriptor_labels, line_count
+
+def open_nt(nt_file):
+    """以文字模式開啟 .nt 或 .nt.gz 檔案。"""
+    if nt_file.endswith(".gz"):
+        return gzip.open(nt_file, 'rt', encoding='utf-8')
+    return open(nt_file, 'r', encoding='utf-8')
+
+def stream_mesh_nt(nt_file):
+    """
+    以串流方式讀取 MeSH N-Triples 檔案，不建立 rdflib.Graph。
+
+    Returns:
+        tuple: (tree_number_to_descriptor, descriptor_labels, line_count)，
+        其中 descriptor_labels 只保留擁有 TreeNumber 的 Descriptor。
+    """
+    with open_nt(nt_file) as f:
+        tree_number_to_descriptor, descriptor_labels, line_count = collect_relevant_triples(f)
+    return tree_number_to_descriptor, _keep_descriptors_with_tree_number(tree_number_to_descriptor, descriptor_labels), line_count
+
+def _keep_descriptors_with_tree_number(tree_number_to_descriptor, descriptor_labels):
+    descriptors_with_tn = {desc for descs in tree_number_to_descriptor.values() for desc in descs}
+    return {desc: labels for desc, labels in descriptor_labels.items() if desc in descriptors_with_tn}
+
+# --- 多行程平行解析 (僅支援未壓縮的 .nt 檔案) ---
+
+def compute_line_aligned_chunks(nt_file, num_chunks):
+    """
+    將檔案切成 num_chunks 個位元組區段，每個區段的邊界都對齊到行首。
+
+    Returns:
+        list[tuple[int, int]]: [(start, end), ...]，涵蓋整個檔案且互不重疊。
+    """
+    file_size = os.path.getsize(nt_file)
+    if file_size == 0:
+        return []
+    num_chunks = max(1, min(num_chunks, file_size))
+    boundaries = [0]
+    with open(nt_file, 'rb') as f:
+        for i in range(1, num_chunks):
+            target = max(file_size * i // num_chunks, boundaries[-1])
+            f.seek(target)
+            # 從目標位置往後找到下一個換行，讓下一個區段從完整的一行開始
+            f.readline()
+            boundaries.append(min(f.tell(), file_size))
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+def _iter_lines_in_range(f, start, end):
+    f.seek(start)
+    position = start
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode('utf-8')
+
+def _collect_chunk(task):
+    nt_file, start, end = task
+    with open(nt_file, 'rb') as f:
+        return collect_relevant_triples(_iter_lines_in_range(f, start, end))
+
+def _merge_partial_results(partials):
+    # 依區段順序合併，保持與單行程串流相同的出現順序 (影響每個 TreeNumber 的主要 Descriptor)
+    tree_number_to_descriptor = {}
+    descriptor_labels = {}
+    line_count = 0
+    for partial_tns, partial_labels, partial_lines in partials:
+        for tn, uris in partial_tns.items():
+            tree_number_to_descriptor.setdefault(tn, []).extend(uris)
+        for desc, labels in partial_labels.items():
+            descriptor_labels.setdefault(desc, []).extend(labels)
+        line_count += partial_lines
+    return tree_number_to_descriptor, descriptor_labels, line_count
+
+def parallel_stream_mesh_nt(nt_file, workers, chunks_per_worker=4):
+    """
+    以多個行程平行解析未壓縮的 .nt 檔案。
+
+    檔案依行邊界切成 workers * chunks_per_worker 個區段，各行程只過濾需要的述詞，
+    最後依區段順序合併部分結果。回傳值與 stream_mesh_nt 相同。
+    """
+    if nt_file.endswith(".gz"):
+        raise ValueError(f"gzip 串流無法依位元組切割，請改用解壓縮後的 .nt 檔案: {nt_file}")
+    if workers <= 1:
+        return stream_mesh_nt(nt_file)
+
+    chunks = compute_line_aligned_chunks(nt_file, workers * chunks_per_worker)
+    tasks = [(nt_file, start, end) for start, end in chunks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partials = list(executor.map(_collect_chunk, tasks))
+    tree_number_to_descriptor, descriptor_labels, line_count = _merge_partial_results(partials)
+    return tree_number_to_descriptor, _keep_descriptors_with_tree_number(tree_number_to_descriptor, descriptor_labels), line_count
+
+def benchmark_scaling(nt_file, worker_counts=(1, 2, 4, 8)):
+    """對不同的行程數量計時，並印出加速比報告。"""
+    print(f"--- 平行解析擴展性測試: {nt_file} ---")
+    print(f"CPU 核心數: {os.cpu_count()}")
+    results = []
+    for workers in worker_counts:
+        start_time = time.perf_counter()
+        tree_number_to_descriptor, _, line_count = parallel_stream_mesh_nt(nt_file, workers)
+        elapsed = time.perf_counter() - start_time
+        results.append((workers, elapsed, line_count, len(tree_number_to_descriptor)))
+
+    base_time = results[0][1]
+    print(f"{'workers':>8} {'秒數':>10} {'加速比':>8} {'行數/秒':>14} {'TreeNumbers':>12}")
+    for workers, elapsed, line_count, tn_count in results:
+        speedup = base_time / elapsed if elapsed > 0 else float('inf')
+        lines_per_sec = line_count / elapsed if elapsed > 0 else float('inf')
+        print(f"{workers:>8} {elapsed:>10.2f} {speedup:>8.2f} {lines_per_sec:>14,.0f} {tn_count:>12}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MeSH N-Triples 平行解析擴展性測試")
+    parser.add_argument("nt_file", nargs="?", default="nt_data/mesh2026.nt", help="未壓縮的 .nt 檔案")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="要測試的行程數量")
+    args = parser.parse_args()
+    benchmark_scaling(args.nt_file, args.workers)
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 為選用套件，只有輸出/讀取 Parquet 時才需要
+    pa = None
+    pq = None
+
+DEFAULT_ROW_GROUP_SIZE = 262144
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("輸出或讀取 Parquet 需要 pyarrow，請先執行: pip install pyarrow")
+
+def _dictionary_column(ids, table):
+    # 每個 row group 只保留實際用到的字典項目，避免把整個術語表重複寫入每個 row group
+    used_ids, indices = np.unique(ids, return_inverse=True)
+    dictionary = pa.array([table[i] for i in used_ids], type=pa.string())
+    return pa.DictionaryArray.from_arrays(pa.array(indices.astype(np.int32), type=pa.int32()), dictionary)
+
+class ParquetPairWriter:
+    """
+    以 row group 為單位逐批寫出術語配對的 Parquet 檔案。
+
+    word_i / word_j (以及選用的 tree_number_i / tree_number_j) 以字典編碼的類別欄位儲存，
+    wup_similarity 以 float32 儲存。取樣器每產生一批配對就可以呼叫 write_batch，不必等全部取樣完成。
+    """
+
+    def __init__(self, output_file, term_table, tree_numbers=None, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        _require_pyarrow()
+        self.output_file = output_file
+        self.term_table = term_table
+        self.tree_numbers = tree_numbers
+        self.row_group_size = row_group_size
+        dictionary_type = pa.dictionary(pa.int32(), pa.string())
+        fields = [
+            pa.field("word_i", dictionary_type),
+            pa.field("word_j", dictionary_type),
+            pa.field("wup_similarity", pa.float32()),
+        ]
+        if tree_numbers is not None:
+            fields += [pa.field("tree_number_i", dictionary_type), pa.field("tree_number_j", dictionary_type)]
+        self.schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(output_file, self.schema)
+        self._pending = []
+        self._pending_rows = 0
+        self.rows_written = 0
+
+    def write_batch(self, batch):
+        """寫入取樣器產生的一批配對 (dict: term_a, term_b, wup_similarity，以及 node_a / node_b)。"""
+        if len(batch["term_a"]) == 0:
+            return
+        self._pending.append(batch)
+        self._pending_rows += len(batch["term_a"])
+        if self._pending_rows >= self.row_group_size:
+            self._flush()
+
+    def write_dataframe(self, df):
+        """寫入 word_i / word_j / wup_similarity 欄位的 DataFrame (原始迴圈取樣器使用)。"""
+        words, codes = np.unique(np.concatenate([df["word_i"].to_numpy(dtype=object), df["word_j"].to_numpy(dtype=object)]), return_inverse=True)
+        # 待寫入的配對使用原本的術語表，換表之前先全部寫出
+        self._flush(final=True)
+        previous_table, self.term_table = self.term_table, list(words)
+        self.write_batch({
+            "term_a": codes[:len(df)],
+            "term_b": codes[len(df):],
+            "wup_similarity": df["wup_similarity"].to_numpy(),
+        })
+        self._flush(final=True)
+        self.term_table = previous_table
+
+    def _flush(self, final=False):
+        """只寫出完整的 row group，不足 row_group_size 的餘數留到下一批；final=True 時連最後不完整的部分一起寫出。"""
+        if not self._pending:
+            return
+        merged = {name: np.concatenate([b[name] for b in self._pending]) for name in self._pending[0]}
+        num_rows = len(merged["term_a"])
+        end = num_rows if final else num_rows - num_rows % self.row_group_size
+        for start in range(0, end, self.row_group_size):
+            part = {name: values[start:min(start + self.row_group_size, end)] for name, values in merged.items()}
+            columns = [
+                _dictionary_column(part["term_a"], self.term_table),
+                _dictionary_column(part["term_b"], self.term_table),
+                pa.array(part["wup_similarity"].astype(np.float32), type=pa.float32()),
+            ]
+            if self.tree_numbers is not None:
+                columns += [
+                    _dictionary_column(part["node_a"], self.tree_numbers),
+                    _dictionary_column(part["node_b"], self.tree_numbers),
+                ]
+            self._writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+            self.rows_written += len(part["term_a"])
+        self._pending = [{name: values[end:] for name, values in merged.items()}] if end < num_rows else []
+        self._pending_rows = num_rows - end
+
+    def close(self):
+        self._flush(final=True)
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def load_mesh_pairs(path, columns=None):
+    """
+    讀取術語配對資料集。.parquet 只讀取需要的欄位 (字典編碼欄位會成為 pandas 類別欄位)，其他格式以 CSV 讀取。
+
+    Args:
+        path (str): mesh_dataset.parquet 或 mesh_dataset.csv 的路徑 / URL。
+        columns (list[str] | None): 只讀取這些欄位；None 代表全部。
+    """
+    if str(path).endswith(".parquet"):
+        _require_pyarrow()
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+def preview_pairs(path, num_rows=5):
+    """讀取 Parquet 輸出的前 num_rows 列 (不讀取整個檔案)。"""
+    _require_pyarrow()
+    batches = pq.ParquetFile(path).iter_batches(batch_size=num_rows)
+    first = next(batches, None)
+    return first.to_pandas() if first is not None else pd.DataFrame()
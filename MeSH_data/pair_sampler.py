@@ -0,0 +1,286 @@
+import numpy as np
+
+def pack_pair_keys(term_a, term_b):
+    """將無序的術語 id 配對打包成 64 位元整數 (較小的 id 放在高 32 位元)。"""
+    low = np.minimum(term_a, term_b).astype(np.uint64)
+    high = np.maximum(term_a, term_b).astype(np.uint64)
+    return (low << np.uint64(32)) | high
+
+def round_similarity(similarity, ndigits=2):
+    """
+    與 Python 內建 round(x, 2) 結果完全相同的四捨五入。
+
+    WUP 相似度只有少數幾種不同的值，先取唯一值再逐一呼叫 round，避免 np.round 的 x * 100 誤差。
+    """
+    unique_values, inverse = np.unique(similarity, return_inverse=True)
+    rounded = np.array([round(float(v), ndigits) for v in unique_values], dtype=np.float64)
+    return rounded[inverse]
+
+class PairSampler:
+    """
+    向量化的術語配對取樣器，取代 create_dataset.main() 中逐次嘗試的 while 迴圈。
+
+    取樣分佈與原本的迴圈相同：先從有術語的節點中均勻 (可重複) 抽出兩個節點，再各自均勻抽出一個術語。
+    限制條件也相同：兩個術語必須不同，且無序的術語配對不可重複。
+    所有 (節點, 術語) 項目只在建立時攤平一次，之後以大批次抽樣、以打包的 64 位元鍵值去除重複。
+    """
+
+    def __init__(self, tree, seed=None):
+        self.tree = tree
+        self.rng = np.random.default_rng(seed)
+        term_counts = tree.term_counts()
+        self.sampling_nodes = np.flatnonzero(term_counts > 0).astype(np.int64)
+        self.term_offsets = tree.term_offsets.astype(np.int64)
+        self.term_counts = term_counts.astype(np.int64)
+        self.seen_keys = np.empty(0, dtype=np.uint64)
+
+    def _draw_terms(self, node_ids):
+        # 在每個節點自己的術語區段 [offset, offset + count) 中均勻抽一個
+        picks = (self.rng.random(len(node_ids)) * self.term_counts[node_ids]).astype(np.int64)
+        return self.tree.term_ids[self.term_offsets[node_ids] + picks]
+
+    def draw_candidates(self, batch_size):
+        """抽出一批候選配對，回傳 (node_a, node_b, term_a, term_b)。"""
+        node_a = self.sampling_nodes[self.rng.integers(0, len(self.sampling_nodes), batch_size)]
+        node_b = self.sampling_nodes[self.rng.integers(0, len(self.sampling_nodes), batch_size)]
+        return node_a, node_b, self._draw_terms(node_a), self._draw_terms(node_b)
+
+    def accept_unique(self, node_a, node_b, term_a, term_b):
+        """
+        過濾掉相同術語、批次內重複與先前已接受的配對 (保留最先抽到的那一組)，並記錄為已接受。
+
+        Returns:
+            np.ndarray: 被接受的候選位置 (依抽樣順序)。
+        """
+        candidates = np.flatnonzero(term_a != term_b)
+        keys = pack_pair_keys(term_a[candidates], term_b[candidates])
+        _, first_positions = np.unique(keys, return_index=True)
+        first_positions.sort()
+        candidates = candidates[first_positions]
+        keys = keys[first_positions]
+        is_new = ~np.isin(keys, self.seen_keys, assume_unique=True)
+        accepted = candidates[is_new]
+        self.seen_keys = np.union1d(self.seen_keys, keys[is_new])
+        return accepted
+
+    def _accepted_batch(self, accepted, node_a, node_b, term_a, term_b):
+        batch = {"node_a": node_a[accepted], "node_b": node_b[accepted],
+                 "term_a": term_a[accepted], "term_b": term_b[accepted]}
+        if len(accepted):
+            batch["wup_similarity"] = round_similarity(self.tree.wup_similarity_batch(batch["node_a"], batch["node_b"]))
+        else:
+            batch["wup_similarity"] = np.empty(0)
+        return batch
+
+    @staticmethod
+    def _concat_batches(batches, names):
+        return {name: np.concatenate([b[name] for b in batches]) if batches else np.empty(0, dtype=np.int64) for name in names}
+
+    def sample(self, num_samples, max_attempts=None, batch_size=None, progress_every=100000, batch_callback=None, keep_pairs=True):
+        """
+        取樣 num_samples 組唯一的術語配對並計算 WUP 相似度。
+
+        Args:
+            num_samples (int): 目標樣本數。
+            max_attempts (int | None): 最多抽出的候選配對數 (預設為 num_samples * 20，與原本的迴圈相同)。
+            batch_size (int | None): 每批抽出的候選數量。
+            batch_callback (callable | None): 每產生一批配對就以該批的 dict 呼叫一次 (例如逐批寫入輸出檔案)。
+            keep_pairs (bool): False 時不保留已交給 batch_callback 的配對，回傳的 id 陣列為空 (串流輸出時節省記憶體)。
+        Returns:
+            dict: node_a, node_b, term_a, term_b (id 陣列), wup_similarity (四捨五入到小數點後兩位), num_samples, attempts
+        """
+        if max_attempts is None:
+            max_attempts = num_samples * 20
+        if batch_size is None:
+            batch_size = max(65536, num_samples // 4)
+
+        batches = []
+        num_collected = 0
+        attempts = 0
+        next_report = progress_every
+        while num_collected < num_samples and attempts < max_attempts and len(self.sampling_nodes) >= 2:
+            current_batch = min(batch_size, max_attempts - attempts)
+            node_a, node_b, term_a, term_b = self.draw_candidates(current_batch)
+            accepted = self.accept_unique(node_a, node_b, term_a, term_b)
+            # 只保留需要的數量；超出的部分從已接受集合中移除，讓下一次呼叫仍可抽到它們
+            overflow = accepted[num_samples - num_collected:]
+            accepted = accepted[:num_samples - num_collected]
+            if len(overflow):
+                self.seen_keys = np.setdiff1d(self.seen_keys, pack_pair_keys(term_a[overflow], term_b[overflow]), assume_unique=True)
+                attempts += int(accepted[-1]) + 1 if len(accepted) else current_batch
+            else:
+                attempts += current_batch
+            batch = self._accepted_batch(accepted, node_a, node_b, term_a, term_b)
+            if keep_pairs:
+                batches.append(batch)
+            if batch_callback is not None and len(accepted):
+                batch_callback(batch)
+            num_collected += len(accepted)
+            while progress_every and num_collected >= next_report:
+                print(f"  已產生 {min(next_report, num_samples)}/{num_samples} 個樣本...")
+                next_report += progress_every
+
+        result = self._concat_batches(batches, ("node_a", "node_b", "term_a", "term_b", "wup_similarity"))
+        result["num_samples"] = num_collected
+        result["attempts"] = attempts
+        return result
+
+def parse_strata(spec):
+    """解析 '2:50000,3:50000' 形式的分層設定，回傳 {LCS 深度: 目標數量}。"""
+    strata = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        depth, count = item.split(':')
+        strata[int(depth)] = int(count)
+    return strata
+
+class StratifiedPairSampler(PairSampler):
+    """
+    依 LCS 深度分層取樣：使用者指定每個 LCS 深度要幾組配對，直接在共同子樹中產生符合條件的配對，
+    不靠隨機抽樣後再拒絕，因此高相似度 (深 LCS) 的稀有分層也能快速填滿。
+
+    (WUP = 2 * depth(LCS) / (depth(a) + depth(b))，分子只由 LCS 深度決定，因此以 LCS 深度分層。)
+
+    LCS 恰好為節點 v 的 (有序) 節點配對共有 S_v^2 - sum(S_c^2) 組 (S 為子樹大小、c 為 v 的子節點)：
+        - (v, x)，x 為 v 子樹中任一節點 (含 v 本身)
+        - (x, v)，x 為 v 的真子孫
+        - (x, y)，x、y 分屬 v 的不同子樹
+    先依這個數量加權抽出 v，再在上述集合中均勻抽出一組，所有步驟都以 NumPy 批次完成。
+    """
+
+    def __init__(self, tree, seed=None):
+        super().__init__(tree, seed)
+        self._build_preorder()
+        self._build_lca_weights()
+
+    def _build_preorder(self):
+        tree = self.tree
+        n = len(tree)
+        self.subtree_sizes = np.ones(n, dtype=np.int64)
+        # 節點 id 依深度排序，反向累加即可得到子樹大小
+        for node_id in range(n - 1, -1, -1):
+            parent_id = tree.parents[node_id]
+            if parent_id >= 0:
+                self.subtree_sizes[parent_id] += self.subtree_sizes[node_id]
+
+        self.preorder = np.empty(n, dtype=np.int64)
+        self.preorder_start = np.empty(n, dtype=np.int64)
+        position = 0
+        stack = [int(i) for i in np.flatnonzero(tree.parents < 0)[::-1]]
+        while stack:
+            node_id = stack.pop()
+            self.preorder[position] = node_id
+            self.preorder_start[node_id] = position
+            position += 1
+            stack.extend(int(c) for c in tree.children(node_id)[::-1])
+
+    def _build_lca_weights(self):
+        tree = self.tree
+        sizes = self.subtree_sizes
+        child_parents = np.repeat(np.arange(len(tree)), np.diff(tree.child_offsets))
+        descendant_counts = sizes - 1
+        # 子節點 c 作為配對第一個元素所在子樹的權重: S_c * (S_v - 1 - S_c)
+        child_weights = sizes[tree.child_ids] * (descendant_counts[child_parents] - sizes[tree.child_ids])
+        self.child_weight_cumsum = np.concatenate([[0], np.cumsum(child_weights)])
+        split_pair_counts = self.child_weight_cumsum[tree.child_offsets[1:]] - self.child_weight_cumsum[tree.child_offsets[:-1]]
+        self.lca_pair_counts = 2 * sizes - 1 + split_pair_counts
+
+    def draw_candidates_with_lcs_depth(self, lcs_depth, batch_size):
+        """抽出一批 LCS 深度恰好為 lcs_depth 的候選配對，回傳 (node_a, node_b, term_a, term_b)。"""
+        tree = self.tree
+        lca_nodes = np.flatnonzero(tree.depths == lcs_depth)
+        weights = self.lca_pair_counts[lca_nodes].astype(np.float64)
+        if len(lca_nodes) == 0 or weights.sum() == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty, empty
+
+        v = lca_nodes[self.rng.choice(len(lca_nodes), batch_size, p=weights / weights.sum())]
+        sizes = self.subtree_sizes[v]
+        starts = self.preorder_start[v]
+        u = np.minimum((self.rng.random(batch_size) * self.lca_pair_counts[v]).astype(np.int64), self.lca_pair_counts[v] - 1)
+        node_a = v.copy()
+        node_b = v.copy()
+
+        # (v, x): x 為子樹中第 u 個節點
+        with_v_first = u < sizes
+        node_b[with_v_first] = self.preorder[starts[with_v_first] + u[with_v_first]]
+
+        # (x, v): x 為第 (u - S_v) 個真子孫
+        with_v_second = ~with_v_first & (u < 2 * sizes - 1)
+        node_a[with_v_second] = self.preorder[starts[with_v_second] + 1 + u[with_v_second] - sizes[with_v_second]]
+
+        # (x, y): 依權重選出 x 所在的子樹 c1，y 在 v 的其他子樹中均勻抽出
+        split = ~with_v_first & ~with_v_second
+        if split.any():
+            v_split = v[split]
+            targets = self.child_weight_cumsum[tree.child_offsets[v_split]] + (u[split] - (2 * sizes[split] - 1))
+            c1 = tree.child_ids[np.searchsorted(self.child_weight_cumsum, targets, side='right') - 1]
+            c1_sizes = self.subtree_sizes[c1]
+            c1_starts = self.preorder_start[c1]
+            node_a[split] = self.preorder[c1_starts + (self.rng.random(len(c1)) * c1_sizes).astype(np.int64)]
+            others = (self.rng.random(len(c1)) * (sizes[split] - 1 - c1_sizes)).astype(np.int64)
+            positions = starts[split] + 1 + others
+            positions[positions >= c1_starts] += c1_sizes[positions >= c1_starts]
+            node_b[split] = self.preorder[positions]
+
+        has_terms = (self.term_counts[node_a] > 0) & (self.term_counts[node_b] > 0)
+        node_a, node_b = node_a[has_terms], node_b[has_terms]
+        return node_a, node_b, self._draw_terms(node_a), self._draw_terms(node_b)
+
+    def sample_strata(self, strata, max_attempts_factor=20, batch_size=65536, batch_callback=None, keep_pairs=True):
+        """
+        依 {LCS 深度: 目標數量} 分層取樣。每個分層最多抽出目標數量 * max_attempts_factor 組候選，
+        唯一配對不足時提前結束並回報實際數量。
+
+        每批的候選數量由尚缺的數量與上一批的接受率估計：第一批為尚缺數量的兩倍，之後至少為尚缺數量的兩倍，
+        接受率下降 (唯一配對漸少) 時依比例放大，整批都被拒絕時加倍；最多 batch_size 組。
+        因此 attempts 接近實際需要的候選數，與原始迴圈的嘗試次數意義相同。
+
+        Returns:
+            dict: 與 PairSampler.sample 相同的欄位，另外包含 lcs_depth 陣列與每層的 attempts。
+        """
+        batches = []
+        total_collected = 0
+        attempts_per_stratum = {}
+        for lcs_depth, target in sorted(strata.items()):
+            num_collected = 0
+            attempts = 0
+            max_attempts = target * max_attempts_factor
+            next_batch = 2 * target
+            while num_collected < target and attempts < max_attempts:
+                current_batch = min(next_batch, batch_size, max_attempts - attempts)
+                node_a, node_b, term_a, term_b = self.draw_candidates_with_lcs_depth(lcs_depth, current_batch)
+                if len(node_a) == 0:
+                    attempts += current_batch
+                    break
+                accepted = self.accept_unique(node_a, node_b, term_a, term_b)
+                overflow = accepted[target - num_collected:]
+                accepted = accepted[:target - num_collected]
+                if len(overflow):
+                    self.seen_keys = np.setdiff1d(self.seen_keys, pack_pair_keys(term_a[overflow], term_b[overflow]), assume_unique=True)
+                    # 與 PairSampler.sample 相同：只計算到最後一個被接受的候選為止
+                    attempts += int(accepted[-1]) + 1 if len(accepted) else current_batch
+                else:
+                    attempts += current_batch
+                batch = self._accepted_batch(accepted, node_a, node_b, term_a, term_b)
+                batch["lcs_depth"] = np.full(len(accepted), lcs_depth, dtype=np.int16)
+                if keep_pairs:
+                    batches.append(batch)
+                if batch_callback is not None and len(accepted):
+                    batch_callback(batch)
+                num_collected += len(accepted)
+                remaining = target - num_collected
+                if len(accepted) == 0:
+                    next_batch = 2 * current_batch
+                else:
+                    acceptance_rate = len(accepted) / current_batch
+                    next_batch = max(2 * remaining, int(np.ceil(1.25 * remaining / acceptance_rate)))
+            attempts_per_stratum[lcs_depth] = attempts
+            total_collected += num_collected
+            print(f"  LCS 深度 {lcs_depth}: 已產生 {num_collected}/{target} 個樣本 (候選 {attempts} 組)")
+
+        result = self._concat_batches(batches, ("node_a", "node_b", "term_a", "term_b", "wup_similarity", "lcs_depth"))
+        result["num_samples"] = total_collected
+        result["attempts"] = attempts_per_stratum
+        return result
@@ -1,9 +1,12 @@
-import pandas as pd
+import sys
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# 讀取資料
-df = pd.read_csv('mesh_dataset.csv')
+from pair_parquet import load_mesh_pairs
+
+# 讀取資料 (可傳入 mesh_dataset.parquet 或 mesh_dataset.csv)
+DATA_FILE = sys.argv[1] if len(sys.argv) > 1 else 'mesh_dataset.csv'
+df = load_mesh_pairs(DATA_FILE)
 
 # 1. 基本資訊與統計
 print("--- 基本資訊 ---")
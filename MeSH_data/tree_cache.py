@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# 樹狀結構的建立邏輯 (build_disease_tree / preprocess_term / get_depth) 有變動時請遞增此版本，
+# 舊的快取會因為鍵值不符而自動失效
+TREE_CACHE_VERSION = 1
+DEFAULT_TREE_CACHE_FILE = "nt_data/disease_tree_cache.npz"
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def compute_cache_key(nt_file, cache_file=None):
+    """
+    以來源檔案的 SHA-256、檔案大小與程式版本組成快取鍵值 (另記錄修改時間，只用於略過雜湊)。
+
+    若提供 cache_file，且快取中記錄的檔案大小、修改時間與版本都和來源檔案相同，
+    直接沿用快取中的 SHA-256，不必重新讀取整個來源檔案；任何一項不同時才計算雜湊。
+    """
+    stat = os.stat(nt_file)
+    stored_key = read_cache_key(cache_file) if cache_file else None
+    if (stored_key and stored_key.get("source_size") == stat.st_size
+            and stored_key.get("source_mtime_ns") == stat.st_mtime_ns
+            and stored_key.get("version") == TREE_CACHE_VERSION):
+        source_sha256 = stored_key["source_sha256"]
+    else:
+        source_sha256 = file_sha256(nt_file)
+    return {
+        "source_sha256": source_sha256,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+        "version": TREE_CACHE_VERSION,
+    }
+
+def _same_source(stored_key, cache_key):
+    # 修改時間不同但內容相同 (例如重新下載同一份檔案) 時，快取仍然有效
+    ignored = ("source_mtime_ns",)
+    return ({k: v for k, v in stored_key.items() if k not in ignored}
+            == {k: v for k, v in cache_key.items() if k not in ignored})
+
+def _pack_strings(strings):
+    # 將字串串接成單一 UTF-8 位元組區塊 + 偏移量，避免固定寬度 unicode 陣列浪費空間
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+def _unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+def flatten_tree(nodes):
+    """
+    將 {tree_number: MeshNode} 攤平成陣列。節點依 (深度, tree number) 排序，確保父節點排在子節點之前。
+
+    Returns:
+        dict: tree_numbers, parents (int32，根節點為 -1), depths (int16),
+              descriptor_uris (無 descriptor 為空字串), term_table (排序後的唯一術語),
+              term_offsets / term_ids (每個節點術語的 CSR 索引)
+    """
+    ordered = sorted(nodes.values(), key=lambda n: (n.depth, n.tree_number))
+    index_of = {node.tree_number: i for i, node in enumerate(ordered)}
+    term_table = sorted({term for node in ordered for term in node.terms})
+    term_index = {term: i for i, term in enumerate(term_table)}
+
+    term_offsets = np.zeros(len(ordered) + 1, dtype=np.int32)
+    term_ids = []
+    for i, node in enumerate(ordered):
+        term_ids.extend(sorted(term_index[t] for t in node.terms))
+        term_offsets[i + 1] = len(term_ids)
+
+    return {
+        "tree_numbers": [node.tree_number for node in ordered],
+        "parents": np.array([index_of[node.parent.tree_number] if node.parent else -1 for node in ordered], dtype=np.int32),
+        "depths": np.array([node.depth for node in ordered], dtype=np.int16),
+        "descriptor_uris": [str(node.descriptor_uri) if node.descriptor_uri else "" for node in ordered],
+        "term_table": term_table,
+        "term_offsets": term_offsets,
+        "term_ids": np.array(term_ids, dtype=np.int32),
+    }
+
+def save_tree_cache(cache_file, tree_arrays, cache_key):
+    """將 flatten_tree 的結果寫入 .npz 快取 (先寫暫存檔再取代，避免中斷時留下損壞的快取)。"""
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    tn_blob, tn_offsets = _pack_strings(tree_arrays["tree_numbers"])
+    uri_blob, uri_offsets = _pack_strings(tree_arrays["descriptor_uris"])
+    term_blob, term_table_offsets = _pack_strings(tree_arrays["term_table"])
+    meta = np.frombuffer(json.dumps(cache_key, sort_keys=True).encode('utf-8'), dtype=np.uint8)
+
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        np.savez(
+            f,
+            meta=meta,
+            tn_blob=tn_blob, tn_offsets=tn_offsets,
+            uri_blob=uri_blob, uri_offsets=uri_offsets,
+            term_blob=term_blob, term_table_offsets=term_table_offsets,
+            parents=tree_arrays["parents"],
+            depths=tree_arrays["depths"],
+            term_offsets=tree_arrays["term_offsets"],
+            term_ids=tree_arrays["term_ids"],
+        )
+    os.replace(tmp_file, cache_file)
+
+def read_cache_key(cache_file):
+    """讀取快取檔中儲存的鍵值；檔案不存在或損壞時回傳 None。"""
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            return json.loads(data["meta"].tobytes().decode('utf-8'))
+    except (OSError, ValueError, KeyError):
+        return None
+
+def load_tree_cache(cache_file, cache_key=None):
+    """
+    載入樹狀結構快取。
+
+    Args:
+        cache_file (str): 快取檔路徑。
+        cache_key (dict | None): 預期的鍵值；提供時若與快取內容不符則視為失效。
+
+    Returns:
+        dict | None: 與 flatten_tree 相同格式的陣列；快取不存在、損壞或失效時回傳 None。
+    """
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            stored_key = json.loads(data["meta"].tobytes().decode('utf-8'))
+            if cache_key is not None and not _same_source(stored_key, cache_key):
+                return None
+            return {
+                "tree_numbers": _unpack_strings(data["tn_blob"], data["tn_offsets"]),
+                "parents": data["parents"],
+                "depths": data["depths"],
+                "descriptor_uris": _unpack_strings(data["uri_blob"], data["uri_offsets"]),
+                "term_table": _unpack_strings(data["term_blob"], data["term_table_offsets"]),
+                "term_offsets": data["term_offsets"],
+                "term_ids": data["term_ids"],
+            }
+    except (OSError, ValueError, KeyError) as e:
+        print(f"警告: 無法讀取樹狀結構快取 {cache_file}: {e}")
+        return None
+
+def invalidate_tree_cache(cache_file):
+    """刪除快取檔。回傳是否真的刪除了檔案。"""
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+        return True
+    return False
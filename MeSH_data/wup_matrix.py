@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from lca_index import LCAIndex
+
+# uint8 量化: 儲存 round(similarity * 255)，讀取時除以 UINT8_SCALE 還原
+UINT8_SCALE = 255
+SUPPORTED_DTYPES = ("float16", "uint8")
+
+def triangle_offsets(n):
+    """上三角 (含對角線) 依列攤平時，第 i 列的起始位置。"""
+    rows = np.arange(n + 1, dtype=np.int64)
+    return rows * n - rows * (rows - 1) // 2
+
+def triangle_index(i, j, n):
+    """上三角攤平陣列中 (i, j) 的位置；會自動交換成 i <= j。"""
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    return triangle_offsets(n)[i] + (j - i)
+
+def _progress_file(output_file):
+    return output_file + ".progress.json"
+
+def _meta_file(output_file):
+    return output_file + ".meta.json"
+
+def _atomic_write_json(path, payload):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def _quantize(similarity, dtype):
+    if dtype == "uint8":
+        return np.rint(similarity * UINT8_SCALE).astype(np.uint8)
+    return similarity.astype(np.float16)
+
+def export_wup_matrix(tree, output_file, dtype="float16", upper_triangle=False, block_size=256, resume=True):
+    """
+    逐區塊計算所有節點兩兩之間的 Wu-Palmer 相似度，寫入記憶體映射的 .npy 檔案。
+
+    節點順序與 MeshTree 的節點 id 相同 (tree number 列表寫在 <output>.meta.json)。
+    每完成一個列區塊就 flush 並更新 <output>.progress.json，中斷後重新執行會從下一個區塊接續。
+
+    Args:
+        tree (MeshTree): 'Diseases [C]' 樹。
+        output_file (str): 輸出的 .npy 路徑。
+        dtype (str): 'float16' 或 'uint8' (量化為 round(sim * 255))。
+        upper_triangle (bool): True 時只儲存上三角 (含對角線)，攤平為一維陣列。
+        block_size (int): 每個區塊的列數。
+        resume (bool): 是否從既有的進度檔接續。
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"不支援的 dtype: {dtype} (可用: {SUPPORTED_DTYPES})")
+
+    n = len(tree)
+    layout = "upper_triangle" if upper_triangle else "dense"
+    shape = (int(triangle_offsets(n)[n]),) if upper_triangle else (n, n)
+    params = {"n": n, "dtype": dtype, "layout": layout, "block_size": block_size,
+              "tree_fingerprint": _tree_fingerprint(tree)}
+
+    completed_blocks = 0
+    progress = _read_json(_progress_file(output_file)) if resume else None
+    if progress and progress.get("params") == params and os.path.exists(output_file):
+        completed_blocks = progress["completed_blocks"]
+        matrix = np.load(output_file, mmap_mode='r+')
+        print(f"從進度檔接續: 已完成 {completed_blocks} 個區塊。")
+    else:
+        # 重新開始時先移除舊的進度檔，避免中斷後誤從舊進度接續到新建立 (全為 0) 的檔案
+        if os.path.exists(_progress_file(output_file)):
+            os.remove(_progress_file(output_file))
+        matrix = np.lib.format.open_memmap(output_file, mode='w+', dtype=np.dtype(dtype), shape=shape)
+        _atomic_write_json(_meta_file(output_file), {
+            **params,
+            "shape": list(shape),
+            "uint8_scale": UINT8_SCALE if dtype == "uint8" else None,
+            "tree_numbers": tree.tree_numbers,
+        })
+
+    index = LCAIndex(tree)
+    offsets = triangle_offsets(n) if upper_triangle else None
+    num_blocks = (n + block_size - 1) // block_size
+    all_ids = np.arange(n, dtype=np.int64)
+    start_time = time.perf_counter()
+
+    for block in range(completed_blocks, num_blocks):
+        row_start = block * block_size
+        row_end = min(row_start + block_size, n)
+        if upper_triangle:
+            # 每一列只計算 j >= i 的部分，依序串接後正好是攤平陣列中的連續區段
+            rows = np.repeat(np.arange(row_start, row_end), n - np.arange(row_start, row_end))
+            cols = np.concatenate([all_ids[i:] for i in range(row_start, row_end)])
+            matrix[offsets[row_start]:offsets[row_end]] = _quantize(index.wup_similarity_batch(rows, cols), dtype)
+        else:
+            rows = np.repeat(np.arange(row_start, row_end), n)
+            cols = np.tile(all_ids, row_end - row_start)
+            matrix[row_start:row_end] = _quantize(index.wup_similarity_batch(rows, cols), dtype).reshape(row_end - row_start, n)
+
+        matrix.flush()
+        _atomic_write_json(_progress_file(output_file), {"params": params, "completed_blocks": block + 1})
+
+        done = block + 1 - completed_blocks
+        elapsed = time.perf_counter() - start_time
+        remaining = elapsed / done * (num_blocks - block - 1)
+        print(f"  已完成區塊 {block + 1}/{num_blocks} (列 {row_end}/{n})，經過 {elapsed:.1f} 秒，預估剩餘 {remaining:.1f} 秒")
+
+    del matrix
+    print(f"WUP 相似度矩陣已寫入 {output_file} ({layout}, {dtype}, shape={shape})")
+
+def load_wup_matrix(output_file):
+    """
+    以唯讀記憶體映射開啟 export_wup_matrix 的輸出，不會把整個矩陣讀入記憶體。
+
+    Returns:
+        tuple: (np.memmap, meta dict)；meta 包含 layout、dtype、uint8_scale 與 tree_numbers。
+    """
+    meta = _read_json(_meta_file(output_file))
+    if meta is None:
+        raise FileNotFoundError(f"找不到 {_meta_file(output_file)}")
+    return np.load(output_file, mmap_mode='r'), meta
+
+def lookup_similarity(matrix, meta, i, j):
+    """依 meta 的 layout 與 dtype 取出 (i, j) 的相似度 (已還原 uint8 量化)。"""
+    if meta["layout"] == "upper_triangle":
+        value = matrix[triangle_index(i, j, meta["n"])]
+    else:
+        value = matrix[i, j]
+    if meta["dtype"] == "uint8":
+        return np.asarray(value, dtype=np.float32) / meta["uint8_scale"]
+    return np.asarray(value, dtype=np.float32)
+
+def _tree_fingerprint(tree):
+    # 用 tree numbers 的雜湊確認接續時使用的是同一棵樹 (內建 hash() 每個行程不同，不能用)
+    return hashlib.sha256("\n".join(tree.tree_numbers).encode('utf-8')).hexdigest()
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
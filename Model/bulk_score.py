@@ -0,0 +1,268 @@
+"""
+大量摘要的離線批次評分 (預測類別 / 機率 / CLS 向量)。
+
+task1.ipynb 的 get_embeddings 以 texts.iloc[i:i+batch_size] 逐批同步 tokenize，並把所有向量留在記憶體中最後再 np.vstack，
+無法處理數百萬筆的資料。這裡改為串流處理：
+    1. 輸入檔 (.csv / .parquet / .txt 每行一筆) 以 chunk 為單位讀取，不需要一次載入。
+    2. tokenize 在 worker pool 中進行；模型處理目前的 chunk 時，下一個 chunk 已經在 tokenize (最多預先處理 workers 個 chunk)。
+       chunk 內依長度排序後分批，每批只補齊到該批最長的長度。
+    3. 每個 chunk 的結果立即寫成 .npy 分片，並更新 checkpoint.json；程式中斷後以相同參數重新執行即可從下一個 chunk 繼續。
+    4. 全部完成後把分片合併成記憶體映射的欄式輸出：
+        <output_dir>/label_ids.npy (int16), probabilities.npy (float32, (筆數, 23)), embeddings.npy (選用), meta.json
+
+使用方式：
+    python bulk_score.py new_abstracts.csv scores/ --text-column abstract --head RoBERTa_based/classifier_head.pt --backend int8
+    scores = open_scores('scores/')   # {'label_ids': memmap, 'probabilities': memmap, 'embeddings': memmap, 'meta': dict}
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from inference import softmax
+
+CHECKPOINT_FILE = 'checkpoint.json'
+PARTS_DIR = 'parts'
+BULK_SCORE_VERSION = 1
+
+def iter_text_chunks(input_file, text_column='abstract', chunk_size=10000):
+    """依序讀出輸入檔的文字，每次 chunk_size 筆 (list[str])。"""
+    if input_file.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("讀取 Parquet 需要 pyarrow，請先執行: pip install pyarrow") from e
+        for batch in pq.ParquetFile(input_file).iter_batches(batch_size=chunk_size, columns=[text_column]):
+            yield [str(text) for text in batch.column(0).to_pylist()]
+    elif input_file.endswith('.txt'):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            chunk = []
+            for line in f:
+                chunk.append(line.rstrip('\n'))
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+    else:
+        for frame in pd.read_csv(input_file, usecols=[text_column], chunksize=chunk_size, dtype={text_column: str}, keep_default_na=False):
+            yield frame[text_column].tolist()
+
+_TOKENIZER = None
+
+def _init_tokenizer(tokenizer_path):
+    global _TOKENIZER
+    from transformers import RobertaTokenizer
+    _TOKENIZER = RobertaTokenizer.from_pretrained(tokenizer_path)
+
+def tokenize_chunk(texts, max_length=512, batch_size=32, tokenizer=None):
+    """
+    依長度排序後分批 tokenize，回傳 [(原本的位置, input_ids, attention_mask), ...] (np.int32，每批只補齊到該批最長的長度)。
+    在 worker 中執行時使用 _init_tokenizer 載入的 tokenizer。
+    """
+    tokenizer = tokenizer or _TOKENIZER
+    encoded = tokenizer(texts, truncation=True, max_length=max_length)['input_ids']
+    order = np.argsort([len(ids) for ids in encoded], kind='stable')
+    batches = []
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        width = max(len(encoded[i]) for i in indices)
+        input_ids = np.full((len(indices), width), tokenizer.pad_token_id, dtype=np.int32)
+        attention_mask = np.zeros((len(indices), width), dtype=np.int32)
+        for row, i in enumerate(indices):
+            columns = slice(width - len(encoded[i]), width) if tokenizer.padding_side == 'left' else slice(0, len(encoded[i]))
+            input_ids[row, columns] = encoded[i]
+            attention_mask[row, columns] = 1
+        batches.append((indices, input_ids, attention_mask))
+    return batches
+
+def score_chunk(engine, batches, num_rows, save_embeddings=True):
+    """對 tokenize_chunk 的結果推論，回傳 (label_ids, probabilities, embeddings | None)，順序與 chunk 原本的順序相同。"""
+    probabilities = embeddings = None
+    for indices, input_ids, attention_mask in batches:
+        logits, cls_output = engine.run_batch(input_ids, attention_mask)
+        if probabilities is None:
+            probabilities = np.empty((num_rows, logits.shape[1]), dtype=np.float32)
+            if save_embeddings:
+                embeddings = np.empty((num_rows, cls_output.shape[1]), dtype=np.float32)
+        probabilities[indices] = softmax(logits.astype(np.float64))
+        if save_embeddings:
+            embeddings[indices] = cls_output
+    return probabilities.argmax(axis=1).astype(np.int16), probabilities, embeddings
+
+def input_fingerprint(input_file):
+    stat = os.stat(input_file)
+    return {"path": os.path.abspath(input_file), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def _save_atomic(file_path, array):
+    tmp_file = file_path + '.tmp.npy'
+    np.save(tmp_file, array)
+    os.replace(tmp_file, file_path)
+
+def _write_json_atomic(file_path, payload):
+    tmp_file = file_path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, file_path)
+
+def load_checkpoint(output_dir, config):
+    """回傳已完成的 chunk 列表；設定不同 (輸入檔、模型、chunk_size ...) 時丟出 ValueError，避免混合兩次不同的執行結果。"""
+    checkpoint_file = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint_file):
+        return []
+    with open(checkpoint_file, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('config') != config:
+        raise ValueError(f"{checkpoint_file} 的設定與這次執行不同；請換一個輸出目錄或加上 --restart 重新開始")
+    return checkpoint['completed']
+
+def finalize(output_dir, completed, config, label_names=None):
+    """把每個 chunk 的分片合併成 label_ids.npy / probabilities.npy / embeddings.npy (記憶體映射)，再刪除分片。"""
+    parts_dir = os.path.join(output_dir, PARTS_DIR)
+    num_rows = sum(chunk['rows'] for chunk in completed)
+    columns = ['label_ids', 'probabilities'] + (['embeddings'] if config['save_embeddings'] else [])
+    for column in columns:
+        first = np.load(os.path.join(parts_dir, f"{column}-{completed[0]['chunk']:05d}.npy"), mmap_mode='r')
+        dtype = np.float16 if column == 'embeddings' and config['embedding_dtype'] == 'float16' else first.dtype
+        merged = np.lib.format.open_memmap(os.path.join(output_dir, f"{column}.npy"), mode='w+', dtype=dtype,
+                                           shape=(num_rows,) + first.shape[1:])
+        for chunk in completed:
+            part = np.load(os.path.join(parts_dir, f"{column}-{chunk['chunk']:05d}.npy"), mmap_mode='r')
+            merged[chunk['start']:chunk['start'] + chunk['rows']] = part
+        merged.flush()
+        del merged
+    _write_json_atomic(os.path.join(output_dir, 'meta.json'), {
+        **config, "num_rows": num_rows, "columns": columns,
+        "label_names": list(label_names) if label_names is not None else None,
+    })
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+def score_file(engine, input_file, output_dir, text_column='abstract', chunk_size=10000, batch_size=32, workers=2,
+               save_embeddings=True, embedding_dtype='float32', tokenizer_path='roberta-base', max_length=512,
+               model_id=None, restart=False):
+    """
+    串流評分 input_file 並寫入 output_dir；中斷後以相同參數重新呼叫會從下一個未完成的 chunk 繼續。
+
+    Args:
+        engine (inference.OhsumedClassifierEngine): 推論引擎。
+        workers (int): tokenize 的 process 數 (0 = 在主程序中依序 tokenize)。
+        embedding_dtype (str): 合併後 embeddings.npy 的型別 ('float32' 或 'float16')。
+        model_id (str | None): 模型識別字串 (寫入 checkpoint 的設定，換模型時不會接續舊的結果)。
+
+    Returns:
+        str: meta.json 的路徑。
+    """
+    config = {
+        "version": BULK_SCORE_VERSION,
+        "input": input_fingerprint(input_file),
+        "text_column": text_column,
+        "chunk_size": chunk_size,
+        "max_length": max_length,
+        "tokenizer": tokenizer_path,
+        "model_id": model_id,
+        "save_embeddings": save_embeddings,
+        "embedding_dtype": embedding_dtype,
+    }
+    if restart:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    parts_dir = os.path.join(output_dir, PARTS_DIR)
+    os.makedirs(parts_dir, exist_ok=True)
+    completed = load_checkpoint(output_dir, config)
+    if completed and os.path.exists(os.path.join(output_dir, 'meta.json')):
+        print(f"{output_dir} 已經完成 ({sum(chunk['rows'] for chunk in completed)} 筆)")
+        return os.path.join(output_dir, 'meta.json')
+    if completed:
+        print(f"從 checkpoint 繼續：已完成 {len(completed)} 個 chunk ({sum(chunk['rows'] for chunk in completed)} 筆)")
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_tokenizer, initargs=(tokenizer_path,)) if workers > 0 else None
+    in_flight = deque()
+    next_start = sum(chunk['rows'] for chunk in completed)
+    try:
+        chunks = enumerate(iter_text_chunks(input_file, text_column, chunk_size))
+        exhausted = False
+        while True:
+            # 先把 tokenize 工作排滿 (模型處理目前的 chunk 時，worker 同時 tokenize 後面的 chunk)；
+            # 多排一個，取出目前的 chunk 後每個 worker 仍有工作，workers=1 時 tokenize 與模型也能重疊
+            while not exhausted and len(in_flight) < workers + 1:
+                try:
+                    chunk_id, texts = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if chunk_id < len(completed):
+                    continue
+                if executor is not None:
+                    in_flight.append((chunk_id, len(texts), executor.submit(tokenize_chunk, texts, max_length, batch_size)))
+                else:
+                    in_flight.append((chunk_id, len(texts), tokenize_chunk(texts, max_length, batch_size, engine.tokenizer)))
+            if not in_flight:
+                break
+            chunk_id, num_rows, batches = in_flight.popleft()
+            if executor is not None:
+                batches = batches.result()
+            label_ids, probabilities, embeddings = score_chunk(engine, batches, num_rows, save_embeddings)
+            _save_atomic(os.path.join(parts_dir, f"label_ids-{chunk_id:05d}.npy"), label_ids)
+            _save_atomic(os.path.join(parts_dir, f"probabilities-{chunk_id:05d}.npy"), probabilities)
+            if save_embeddings:
+                _save_atomic(os.path.join(parts_dir, f"embeddings-{chunk_id:05d}.npy"), embeddings)
+            # 分片寫入完成後才更新 checkpoint
+            completed.append({"chunk": chunk_id, "start": next_start, "rows": num_rows})
+            next_start += num_rows
+            _write_json_atomic(os.path.join(output_dir, CHECKPOINT_FILE), {"config": config, "completed": completed})
+            print(f"chunk {chunk_id}: {num_rows} 筆 (累計 {next_start} 筆)")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if not completed:
+        raise ValueError(f"{input_file} 沒有任何資料")
+    finalize(output_dir, completed, config, engine.label_names)
+    print(f"完成：{next_start} 筆，結果在 {output_dir}")
+    return os.path.join(output_dir, 'meta.json')
+
+def open_scores(output_dir):
+    """以記憶體映射開啟 score_file 的輸出，回傳 {'label_ids', 'probabilities', ['embeddings'], 'meta'}。"""
+    with open(os.path.join(output_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    scores = {column: np.load(os.path.join(output_dir, f"{column}.npy"), mmap_mode='r') for column in meta['columns']}
+    scores['meta'] = meta
+    return scores
+
+def main():
+    from inference import BACKENDS, OhsumedClassifierEngine
+
+    parser = argparse.ArgumentParser(description="大量文字的串流批次評分 (可從 checkpoint 繼續)")
+    parser.add_argument("input_file", help=".csv / .parquet / .txt (每行一筆)")
+    parser.add_argument("output_dir")
+    parser.add_argument("--text-column", default="abstract")
+    parser.add_argument("--model-path", default="roberta-base", help="backbone 的模型名稱或路徑")
+    parser.add_argument("--head", required=True, help="save_classifier_head 產生的 classifier_head.pt")
+    parser.add_argument("--tokenizer", default="roberta-base")
+    parser.add_argument("--lora", default=None, help="LoRA adapter 資料夾 (會合併到 backbone)")
+    parser.add_argument("--backend", default="int8", choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2, help="tokenize 的 process 數 (0 = 依序 tokenize)")
+    parser.add_argument("--no-embeddings", action="store_true", help="不輸出 CLS 向量")
+    parser.add_argument("--embedding-dtype", default="float32", choices=("float32", "float16"))
+    parser.add_argument("--restart", action="store_true", help="刪除舊的輸出與 checkpoint，重新開始")
+    args = parser.parse_args()
+
+    engine = OhsumedClassifierEngine(args.model_path, args.head, args.tokenizer, args.lora, args.backend,
+                                     max_length=args.max_length, num_threads=args.threads)
+    with open(args.head, 'rb') as f:
+        head_sha256 = hashlib.sha256(f.read()).hexdigest()
+    model_id = f"{args.model_path}|{args.lora}|{head_sha256}|{args.backend}"
+    score_file(engine, args.input_file, args.output_dir, args.text_column, args.chunk_size, args.batch_size, args.workers,
+               not args.no_embeddings, args.embedding_dtype, args.tokenizer, args.max_length, model_id, args.restart)
+
+if __name__ == "__main__":
+    main()
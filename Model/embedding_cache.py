@@ -0,0 +1,169 @@
+"""
+凍結 backbone 時的 CLS embedding 快取。
+
+RobertaClassifier 預設 freeze_backbone=True，只訓練最上層的 nn.Linear(768, 23)，
+但 run_experiment 每個 epoch 都會對每個 batch 重新跑完整的 RoBERTa forward。
+這裡改為：train / val / test 的 CLS 向量只計算一次，存成 float32 的 .npy (以 memmap 讀取)，
+之後只在快取的向量上訓練分類層。
+
+快取鍵值 = backbone (路徑；本機資料夾另加檔案指紋) + tokenizer + LoRA adapter (路徑與檔案指紋) + 文字欄位 + max_length + 資料內容雜湊：
+    <cache_dir>/<key>/embeddings.npy, meta.json
+tokenize 的結果也寫在 cache_dir 之下 (<cache_dir>/tokens)；使用預設的 cache_dir 時沿用 token_cache 的預設目錄。
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+from length_bucketing import BucketBatchSampler, DynamicPaddingCollator, LengthAwareTextDataset
+from token_cache import DEFAULT_CACHE_DIR as DEFAULT_TOKEN_CACHE_DIR
+from token_cache import texts_sha256, tokenizer_name
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ohsumed', 'embeddings')
+EMBEDDING_CACHE_VERSION = 1
+
+def adapter_fingerprint(lora_path):
+    """
+    模型資料夾 (LoRA adapter 或本機的 backbone checkpoint) 的指紋 (檔名、大小與修改時間)；
+    重新訓練並存到相同路徑後快取會自動失效。不是本機資料夾 (例如 'roberta-base') 時回傳 None。
+    """
+    if not lora_path or not os.path.isdir(lora_path):
+        return None
+    entries = []
+    for root, _, files in os.walk(lora_path):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            entries.append(f"{os.path.relpath(os.path.join(root, name), lora_path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("\n".join(sorted(entries)).encode('utf-8')).hexdigest()
+
+def compute_cache_key(model_path, lora_path, text_column, max_length, data_hash, tokenizer=None):
+    payload = json.dumps({
+        "version": EMBEDDING_CACHE_VERSION,
+        "model_path": model_path,
+        # task2 的 MLM checkpoint 是本機資料夾，重新訓練後路徑不變，必須以檔案指紋區分
+        "model_fingerprint": adapter_fingerprint(model_path),
+        "tokenizer": tokenizer_name(tokenizer) if tokenizer is not None else None,
+        "lora_path": lora_path,
+        "lora_fingerprint": adapter_fingerprint(lora_path),
+        "text_column": text_column,
+        "max_length": max_length,
+        "data_hash": data_hash,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def compute_cls_embeddings(backbone, dataset, output_file, device, pad_token_id, batch_size=64):
+    """
+    以 eval 模式 (關閉 dropout) 計算 dataset 每一列的 CLS 向量，寫入 output_file (float32 .npy)。
+
+    batch 依長度分組並動態補齊，完成後依原本的資料列順序寫回。
+    """
+    collator = DynamicPaddingCollator(pad_token_id)
+    sampler = BucketBatchSampler(dataset.lengths, batch_size, shuffle=False)
+    embeddings = None
+    backbone.eval()
+    with torch.no_grad():
+        for indices in sampler:
+            batch = collator([dataset[i] for i in indices])
+            outputs = backbone(input_ids=batch['input_ids'].to(device), attention_mask=batch['attention_mask'].to(device))
+            cls_output = outputs.last_hidden_state[:, 0, :].float().cpu().numpy()
+            if embeddings is None:
+                embeddings = np.lib.format.open_memmap(output_file, mode='w+', dtype=np.float32, shape=(len(dataset), cls_output.shape[1]))
+            embeddings[indices] = cls_output
+    if embeddings is None:
+        raise ValueError("dataset 是空的，沒有可以計算 CLS embedding 的資料")
+    embeddings.flush()
+    del embeddings
+
+def cached_cls_embeddings(backbone, tokenizer, texts, model_path, lora_path=None, text_column='title', max_length=512,
+                          device=None, batch_size=64, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    回傳 texts 的 CLS 向量 (np.memmap, float32, 形狀 (筆數, hidden_size))；相同設定第二次呼叫時直接讀取快取。
+
+    Args:
+        backbone: RoBERTa 模型 (例如 RobertaClassifier.roberta，可以是掛上 LoRA 的 PeftModel)。
+        tokenizer: 對應的 tokenizer。
+        texts (list[str]): 文字，順序即為資料列順序。
+        model_path (str): backbone 的模型名稱或路徑 (寫入快取鍵值)。
+        lora_path (str | None): LoRA adapter 資料夾 (寫入快取鍵值)。
+        text_column (str): 文字欄位名稱。
+        cache_dir (str): 快取目錄；tokenize 的快取寫在其下的 tokens 子目錄 (預設目錄除外)。
+    """
+    texts = list(texts)
+    if not texts:
+        raise ValueError("texts 是空的，沒有可以計算 CLS embedding 的資料")
+    device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    key = compute_cache_key(model_path, lora_path, text_column, max_length, texts_sha256(texts), tokenizer)
+    cache_path = os.path.join(cache_dir, key)
+    embeddings_file = os.path.join(cache_path, 'embeddings.npy')
+    if not os.path.exists(os.path.join(cache_path, 'meta.json')):
+        print(f"計算 {len(texts)} 筆 '{text_column}' 的 CLS embedding 並寫入快取 {cache_path} ...")
+        token_cache_dir = DEFAULT_TOKEN_CACHE_DIR if cache_dir == DEFAULT_CACHE_DIR else os.path.join(cache_dir, 'tokens')
+        dataset = LengthAwareTextDataset(texts, np.zeros(len(texts), dtype=np.int64), tokenizer, max_len=max_length,
+                                         text_column=text_column, cache_dir=token_cache_dir)
+        tmp_path = cache_path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        compute_cls_embeddings(backbone, dataset, os.path.join(tmp_path, 'embeddings.npy'), device, tokenizer.pad_token_id, batch_size)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({"model_path": model_path, "lora_path": lora_path, "text_column": text_column,
+                       "max_length": max_length, "num_rows": len(texts)}, f, ensure_ascii=False)
+        shutil.rmtree(cache_path, ignore_errors=True)
+        os.replace(tmp_path, cache_path)
+    else:
+        print(f"使用 embedding 快取 {cache_path}")
+    return np.load(embeddings_file, mmap_mode='r')
+
+def _collate_embeddings(items):
+    return {'embeddings': torch.stack([e for e, _ in items]), 'labels': torch.stack([l for _, l in items])}
+
+def embedding_loader(embeddings, labels, batch_size=32, shuffle=False):
+    """把快取的向量與標籤包成 DataLoader (batch 為 {'embeddings', 'labels'})。"""
+    dataset = TensorDataset(torch.from_numpy(np.array(embeddings, dtype=np.float32)), torch.as_tensor(np.asarray(labels), dtype=torch.long))
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, collate_fn=_collate_embeddings)
+
+def train_head_on_embeddings(head, train_loader, val_loader, num_epochs, device, lr=5e-4):
+    """
+    只在快取的 CLS 向量上訓練分類層，回傳 (train_losses, val_losses)；訓練設定與 run_experiment 相同 (AdamW + CrossEntropyLoss)。
+    """
+    head.to(device)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=lr)
+    criterion = nn.CrossEntropyLoss()
+    train_losses, val_losses = [], []
+    for epoch in range(num_epochs):
+        head.train()
+        total_loss = 0
+        for batch in train_loader:
+            optimizer.zero_grad()
+            loss = criterion(head(batch['embeddings'].to(device)), batch['labels'].to(device))
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item()
+
+        head.eval()
+        val_total_loss = 0
+        with torch.no_grad():
+            for batch in val_loader:
+                val_total_loss += criterion(head(batch['embeddings'].to(device)), batch['labels'].to(device)).item()
+
+        avg_train = total_loss / len(train_loader)
+        avg_val = val_total_loss / len(val_loader)
+        train_losses.append(avg_train)
+        val_losses.append(avg_val)
+        print(f"Epoch {epoch+1} Training Loss: {avg_train:.4f} Validation Loss: {avg_val:.4f}")
+    return train_losses, val_losses
+
+def predict_head(head, loader, device):
+    """回傳 (all_labels, all_preds)，與 run_experiment 測試階段的輸出格式相同。"""
+    head.eval()
+    all_preds, all_labels = [], []
+    with torch.no_grad():
+        for batch in loader:
+            preds = torch.argmax(head(batch['embeddings'].to(device)), dim=1)
+            all_preds.extend(preds.cpu().numpy())
+            all_labels.extend(batch['labels'].numpy())
+    return all_labels, all_preds
@@ -0,0 +1,257 @@
+"""
+OHSUMED 分類器的 CPU 推論。
+
+run_experiment 訓練出的模型 = RoBERTa backbone (+ 選用的 LoRA adapter) + nn.Linear(768, 23) 分類層，
+原本只能在 notebook 中以 FP32 eager 模式執行。這裡把它整理成可以部署在沒有 GPU 的機器上的推論流程：
+    1. load_backbone: 載入 backbone，若有 LoRA adapter 則把 LoRA 權重合併 (merge_and_unload) 回原本的 Linear，推論時沒有額外的分支。
+    2. 三種執行方式 (backend)：
+        'eager': FP32 PyTorch (與 notebook 相同，作為比較基準)
+        'int8':  torch 動態量化 (所有 nn.Linear 的權重轉為 int8，activation 於執行時量化)
+        'onnx':  匯出 ONNX 後以 onnxruntime 執行 (需要 onnx / onnxruntime)
+    3. OhsumedClassifierEngine.predict(texts, batch_size): 依長度排序後分批 tokenize (每批只補齊到該批最長的長度)，結果依原本順序回傳。
+    4. benchmark: 比較各 backend 的延遲、吞吐量與準確率差異。
+
+分類層以 save_classifier_head 存成 <folder_name>/classifier_head.pt (run_experiment 結束時呼叫)。
+
+使用方式：
+    python inference.py --model-path roberta-base --head RoBERTa_based/classifier_head.pt --backends eager int8 onnx
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from transformers import RobertaModel, RobertaTokenizer
+
+HEAD_FILE = 'classifier_head.pt'
+BACKENDS = ('eager', 'int8', 'onnx')
+
+def save_classifier_head(classifier, folder_name, label_names=None):
+    """把分類層 (nn.Sequential(nn.Linear(768, num_labels))) 存成 <folder_name>/classifier_head.pt，回傳檔案路徑。"""
+    os.makedirs(folder_name, exist_ok=True)
+    head_file = os.path.join(folder_name, HEAD_FILE)
+    linear = classifier[0] if isinstance(classifier, nn.Sequential) else classifier
+    torch.save({
+        'state_dict': {k: v.detach().cpu() for k, v in linear.state_dict().items()},
+        'hidden_size': linear.in_features,
+        'num_labels': linear.out_features,
+        'label_names': list(label_names) if label_names is not None else None,
+    }, head_file)
+    return head_file
+
+def softmax(logits):
+    """每列 logits 的 softmax (np.ndarray)。"""
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def load_classifier_head(head_file):
+    """回傳 (nn.Linear, label_names)。"""
+    checkpoint = torch.load(head_file, map_location='cpu')
+    head = nn.Linear(checkpoint['hidden_size'], checkpoint['num_labels'])
+    head.load_state_dict(checkpoint['state_dict'])
+    return head.eval(), checkpoint.get('label_names')
+
+def load_backbone(model_path, lora_path=None):
+    """載入 RoBERTa；有 LoRA adapter 時把 LoRA 權重合併回 backbone (W + BA)，回傳一般的 RobertaModel。"""
+    backbone = RobertaModel.from_pretrained(model_path)
+    if lora_path:
+        from peft import PeftModel
+        backbone = PeftModel.from_pretrained(backbone, lora_path).merge_and_unload()
+    return backbone.eval()
+
+class CLSClassifier(nn.Module):
+    """backbone + 分類層，輸出 (logits, CLS 向量)；只接受 tensor 參數，方便量化與 ONNX 匯出。"""
+
+    def __init__(self, backbone, head):
+        super().__init__()
+        self.backbone = backbone
+        self.head = head
+
+    def forward(self, input_ids, attention_mask):
+        cls_output = self.backbone(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state[:, 0, :]
+        return self.head(cls_output), cls_output
+
+def quantize_int8(model):
+    """torch 動態量化：nn.Linear 的權重轉為 int8 (embedding 與 LayerNorm 維持 FP32)。"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def export_onnx(model, tokenizer, onnx_file, opset_version=17):
+    """把 CLSClassifier 匯出成 ONNX (batch 與序列長度為動態維度)。"""
+    dummy = tokenizer(["OHSUMED title", "a slightly longer OHSUMED title"], padding=True, return_tensors='pt')
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_file)), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (dummy['input_ids'], dummy['attention_mask']), onnx_file,
+            input_names=['input_ids', 'attention_mask'], output_names=['logits', 'cls_embedding'],
+            dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                          'attention_mask': {0: 'batch', 1: 'sequence'},
+                          'logits': {0: 'batch'},
+                          'cls_embedding': {0: 'batch'}},
+            opset_version=opset_version, dynamo=False,
+        )
+    return onnx_file
+
+class OhsumedClassifierEngine:
+    """
+    CPU 推論引擎。
+
+    Args:
+        model_path (str): backbone 的模型名稱或路徑 (例如 'roberta-base' 或 MLM 模型資料夾)。
+        head_file (str): save_classifier_head 產生的 classifier_head.pt。
+        lora_path (str | None): LoRA adapter 資料夾；載入後合併到 backbone。
+        backend (str): 'eager'、'int8' 或 'onnx'。
+        onnx_file (str | None): backend='onnx' 時的 ONNX 檔案；不存在時自動匯出 (預設放在 head_file 旁邊)。
+        num_threads (int | None): PyTorch / onnxruntime 使用的執行緒數。
+    """
+
+    def __init__(self, model_path, head_file, tokenizer_path='roberta-base', lora_path=None, backend='int8',
+                 onnx_file=None, max_length=512, num_threads=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"不支援的 backend: {backend} (可用: {', '.join(BACKENDS)})")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.backend = backend
+        self.max_length = max_length
+        self.tokenizer = RobertaTokenizer.from_pretrained(tokenizer_path)
+        head, self.label_names = load_classifier_head(head_file)
+        self.num_labels = head.out_features
+        self.model = CLSClassifier(load_backbone(model_path, lora_path), head).eval()
+
+        if backend == 'int8':
+            self.model = quantize_int8(self.model)
+        elif backend == 'onnx':
+            try:
+                import onnxruntime as ort
+            except ImportError as e:
+                raise ImportError("backend='onnx' 需要 onnx 與 onnxruntime (pip install onnx onnxruntime)") from e
+            onnx_file = onnx_file or os.path.join(os.path.dirname(os.path.abspath(head_file)), 'classifier.onnx')
+            if not os.path.exists(onnx_file):
+                print(f"匯出 ONNX 模型到 {onnx_file} ...")
+                export_onnx(self.model, self.tokenizer, onnx_file)
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self.session = ort.InferenceSession(onnx_file, options, providers=['CPUExecutionProvider'])
+
+    def run_batch(self, input_ids, attention_mask):
+        """對已經 tokenize 並補齊的 batch (torch.Tensor 或 np.ndarray) 推論，回傳 (logits, CLS 向量)，皆為 float32 np.ndarray。"""
+        if self.backend == 'onnx':
+            feeds = {'input_ids': np.asarray(input_ids, dtype=np.int64), 'attention_mask': np.asarray(attention_mask, dtype=np.int64)}
+            logits, embeddings = self.session.run(['logits', 'cls_embedding'], feeds)
+            return logits, embeddings
+        with torch.inference_mode():
+            logits, embeddings = self.model(torch.as_tensor(input_ids, dtype=torch.long), torch.as_tensor(attention_mask, dtype=torch.long))
+            return logits.float().numpy(), embeddings.float().numpy()
+
+    def predict_logits(self, texts, batch_size=32):
+        """回傳 logits (np.ndarray, 形狀 (筆數, num_labels))，順序與 texts 相同。"""
+        texts = [str(text) for text in texts]
+        if not texts:
+            return np.zeros((0, self.num_labels), dtype=np.float32)
+        lengths = [len(ids) for ids in self.tokenizer(texts, truncation=True, max_length=self.max_length)['input_ids']]
+        # 依長度排序後分批，每批只補齊到該批最長的長度
+        order = np.argsort(lengths, kind='stable')
+        logits = np.empty((len(texts), self.num_labels), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            encoded = self.tokenizer([texts[i] for i in indices], truncation=True, max_length=self.max_length,
+                                     padding=True, return_tensors='pt')
+            batch_logits, _ = self.run_batch(encoded['input_ids'], encoded['attention_mask'])
+            logits[indices] = batch_logits
+        return logits
+
+    def predict(self, texts, batch_size=32):
+        """回傳每筆文字的預測 label id (np.ndarray)；label 名稱為 label_names[id]。"""
+        return self.predict_logits(texts, batch_size).argmax(axis=1)
+
+def benchmark(engines, texts, labels=None, batch_size=32, warmup_batches=2, reference='eager'):
+    """
+    比較多個引擎的延遲、吞吐量與準確率。
+
+    Args:
+        engines (dict[str, OhsumedClassifierEngine]): 名稱 -> 引擎。
+        labels (array-like | None): 正確的 label id；有提供時計算準確率。
+        reference (str): 比較基準的引擎名稱 (計算與基準預測一致的比例與準確率差異)。
+
+    Returns:
+        list[dict]: 每個引擎一筆，含每批延遲的 p50 / p95 (毫秒)、每秒樣本數、準確率、與基準的一致率及準確率差異。
+    """
+    texts = [str(text) for text in texts]
+    results, predictions = [], {}
+    for name, engine in engines.items():
+        engine.predict(texts[:batch_size * warmup_batches], batch_size)
+        latencies, preds = [], []
+        start_time = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            batch_start = time.perf_counter()
+            preds.append(engine.predict(texts[start:start + batch_size], batch_size))
+            latencies.append((time.perf_counter() - batch_start) * 1000)
+        elapsed = time.perf_counter() - start_time
+        predictions[name] = np.concatenate(preds)
+        result = {
+            'engine': name,
+            'batch_p50_ms': float(np.percentile(latencies, 50)),
+            'batch_p95_ms': float(np.percentile(latencies, 95)),
+            'samples_per_sec': len(texts) / elapsed,
+        }
+        if labels is not None:
+            result['accuracy'] = float(np.mean(predictions[name] == np.asarray(labels)))
+        results.append(result)
+
+    if reference in predictions:
+        base = next(r for r in results if r['engine'] == reference)
+        for result in results:
+            result['agreement'] = float(np.mean(predictions[result['engine']] == predictions[reference]))
+            if 'accuracy' in result:
+                result['accuracy_delta'] = result['accuracy'] - base['accuracy']
+    return results
+
+def format_benchmark(results):
+    lines = []
+    for r in results:
+        line = (f"{r['engine']:>6}: p50 {r['batch_p50_ms']:8.1f} ms, p95 {r['batch_p95_ms']:8.1f} ms / batch, "
+                f"{r['samples_per_sec']:8.1f} samples/sec")
+        if 'accuracy' in r:
+            line += f", accuracy {r['accuracy']:.4f}"
+        if 'accuracy_delta' in r:
+            line += f" ({r['accuracy_delta']:+.4f})"
+        if 'agreement' in r:
+            line += f", 與基準預測一致 {r['agreement']:.2%}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 OHSUMED 分類器在 CPU 上的 eager / int8 / ONNX 推論")
+    parser.add_argument("--model-path", default="roberta-base", help="backbone 的模型名稱或路徑")
+    parser.add_argument("--head", required=True, help="save_classifier_head 產生的 classifier_head.pt")
+    parser.add_argument("--tokenizer", default="roberta-base")
+    parser.add_argument("--lora", default=None, help="LoRA adapter 資料夾 (會合併到 backbone)")
+    parser.add_argument("--data", default=None, help="ohsumed_dataset.csv 的路徑或網址 (預設為 ohsumed_loader 的預設來源)")
+    parser.add_argument("--num-samples", type=int, default=512, help="用於 benchmark 的標題數")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--backends", nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--onnx-file", default=None)
+    args = parser.parse_args()
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'classification_data'))
+    from ohsumed_loader import DEFAULT_DATA_URL, open_ohsumed
+    dataset = open_ohsumed(args.data or DEFAULT_DATA_URL)
+    indices = np.random.default_rng(42).choice(len(dataset), size=min(args.num_samples, len(dataset)), replace=False)
+    texts = dataset.texts('title', indices)
+    labels = np.asarray(dataset.label_ids)[indices]
+
+    engines = {
+        backend: OhsumedClassifierEngine(args.model_path, args.head, args.tokenizer, args.lora, backend,
+                                         onnx_file=args.onnx_file, num_threads=args.threads)
+        for backend in args.backends
+    }
+    print(format_benchmark(benchmark(engines, texts, labels, args.batch_size, reference=args.backends[0])))
+
+if __name__ == "__main__":
+    main()
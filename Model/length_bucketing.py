@@ -0,0 +1,145 @@
+"""
+依長度分組 (bucketing) 的動態補齊資料管線。
+
+TextDataset 以 padding='max_length' 把每個標題都補到 512 個 token，RoBERTa 大部分的計算都花在 pad token 上。
+這裡改為：
+    1. LengthAwareTextDataset: 以 token_cache 儲存未補齊的序列。
+    2. BucketBatchSampler: 依長度排序後切成 bucket，bucket 內打亂再組成 batch，batch 順序也打亂。
+    3. DynamicPaddingCollator: 每個 batch 只補齊到該 batch 中最長的序列。
+    4. ThroughputMeter: 統計每秒處理的 (非 pad) token 數與 padding 比例。
+"""
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset, Sampler
+
+from token_cache import DEFAULT_CACHE_DIR, tokenize_cached
+
+class LengthAwareTextDataset(Dataset):
+    """與 TextDataset 相同的介面，但 __getitem__ 回傳未補齊的 input_ids (由 DynamicPaddingCollator 補齊)。"""
+
+    def __init__(self, texts, labels, tokenizer, max_len=512, text_column='title', cache_dir=DEFAULT_CACHE_DIR):
+        self.encodings = tokenize_cached(tokenizer, texts, max_length=max_len, text_column=text_column, padding='none', cache_dir=cache_dir)
+        self.lengths = np.asarray(self.encodings.lengths)
+        self.labels = torch.tensor(labels, dtype=torch.long)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        return {
+            'input_ids': torch.from_numpy(self.encodings.sequence(idx).astype(np.int64)),
+            'labels': self.labels[idx]
+        }
+
+class BucketBatchSampler(Sampler):
+    """
+    產生長度相近的 batch (index 列表)，搭配 DataLoader(batch_sampler=...) 使用。
+
+    shuffle=True 時：先隨機打亂再依長度穩定排序 (相同長度的順序隨機)，每 bucket_size 筆切成一個 bucket，
+    bucket 內打亂後切成 batch，最後再打亂所有 batch 的順序；每個 epoch 的順序都不同，但可由 seed 重現。
+    shuffle=False 時依長度排序後直接切成 batch (驗證 / 測試用)。
+    """
+
+    def __init__(self, lengths, batch_size, bucket_size=None, shuffle=True, drop_last=False, seed=42):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size or batch_size * 50
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _batches(self):
+        if not self.shuffle:
+            order = np.argsort(self.lengths, kind='stable')
+            return [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+        rng = np.random.default_rng(self.seed + self.epoch)
+        permutation = rng.permutation(len(self.lengths))
+        order = permutation[np.argsort(self.lengths[permutation], kind='stable')]
+        batches = []
+        for start in range(0, len(order), self.bucket_size):
+            bucket = rng.permutation(order[start:start + self.bucket_size])
+            batches.extend(bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size))
+        rng.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        batches = self._batches()
+        self.epoch += 1
+        for batch in batches:
+            if self.drop_last and len(batch) < self.batch_size:
+                continue
+            yield batch.tolist()
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        if not self.shuffle:
+            return (len(self.lengths) + self.batch_size - 1) // self.batch_size
+        full_buckets, remainder = divmod(len(self.lengths), self.bucket_size)
+        per_bucket = (self.bucket_size + self.batch_size - 1) // self.batch_size
+        return full_buckets * per_bucket + (remainder + self.batch_size - 1) // self.batch_size
+
+class DynamicPaddingCollator:
+    """把一個 batch 的未補齊序列補齊到該 batch 中最長的長度，並產生 attention_mask。"""
+
+    def __init__(self, pad_token_id, padding_side='right'):
+        self.pad_token_id = pad_token_id
+        self.padding_side = padding_side
+
+    def __call__(self, items):
+        lengths = [len(item['input_ids']) for item in items]
+        width = max(lengths)
+        input_ids = torch.full((len(items), width), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(items), width), dtype=torch.long)
+        for row, (item, length) in enumerate(zip(items, lengths)):
+            columns = slice(width - length, width) if self.padding_side == 'left' else slice(0, length)
+            input_ids[row, columns] = item['input_ids']
+            attention_mask[row, columns] = 1
+        batch = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        for key in items[0]:
+            if key != 'input_ids':
+                batch[key] = torch.stack([item[key] for item in items])
+        return batch
+
+class ThroughputMeter:
+    """
+    統計訓練 / 推論的吞吐量。
+
+    每個 batch 呼叫 update(attention_mask)；report() 回傳每秒處理的實際 token 數 (不含 pad)、
+    每秒樣本數與 padding 比例 (pad token 佔全部 token 的比例)。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.real_tokens = 0
+        self.total_tokens = 0
+        self.samples = 0
+        self.start_time = time.perf_counter()
+
+    def update(self, attention_mask):
+        self.real_tokens += int(attention_mask.sum())
+        self.total_tokens += attention_mask.numel()
+        self.samples += attention_mask.shape[0]
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        return {
+            'tokens_per_sec': self.real_tokens / elapsed,
+            'samples_per_sec': self.samples / elapsed,
+            'padding_ratio': 1 - self.real_tokens / self.total_tokens if self.total_tokens else 0.0,
+            'seconds': elapsed,
+        }
+
+    def summary(self, name=''):
+        stats = self.report()
+        return (f"{name} {stats['tokens_per_sec']:,.0f} tokens/sec, {stats['samples_per_sec']:,.1f} samples/sec, "
+                f"padding ratio {stats['padding_ratio']:.1%} ({stats['seconds']:.1f} 秒)").strip()
@@ -0,0 +1,221 @@
+"""
+task1 Linear Probing baseline 的快速版本。
+
+task1.ipynb 每次執行都重新計算整個資料集的 CLS 向量，再以 LogisticRegression(max_iter=1000, solver='lbfgs') 訓練，在 CPU 上很慢。
+這裡改為：
+    1. CLS 向量以 embedding_cache.cached_cls_embeddings 計算一次並快取 (title 與 abstract 各一份 float32 memmap)。
+    2. SoftmaxProbe: 以 PyTorch 的 mini-batch 多類別 softmax 迴歸 (Adam) 取代 lbfgs，並以驗證集 Loss 提前停止 (early stopping)。
+       目標函數與 LogisticRegression 相同的尺度：平均 cross entropy + ||W||^2 / (2 * C * 訓練筆數)。
+    3. run_sweep: 以 process pool 平行掃描正則化強度 C 與文字欄位 (title / abstract)，
+       每個 worker 只透過 memmap 讀取快取的向量；依內部驗證集準確率選出最佳設定。
+    4. print_report: 與 task1.ipynb 相同格式的 Accuracy / Macro F1 / classification_report。
+
+使用方式：
+    python linear_probe.py --features title abstract --C 0.01 0.1 1 10 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from sklearn.metrics import accuracy_score, classification_report, f1_score
+from sklearn.model_selection import train_test_split
+
+class SoftmaxProbe:
+    """
+    多類別 softmax (multinomial logistic) 迴歸，介面與 sklearn 的 LogisticRegression 相同 (fit / predict / predict_proba)。
+
+    Args:
+        C (float): 正則化強度的倒數 (與 LogisticRegression 的 C 相同意義)。
+        lr (float): Adam 學習率。
+        batch_size (int): mini-batch 大小。
+        max_epochs (int): 最多訓練的 epoch 數。
+        patience (int): 驗證集 Loss 連續 patience 個 epoch 沒有改善 tol 以上就停止，並還原最佳權重。
+        validation_fraction (float): 從訓練資料分層切出的驗證集比例。
+    """
+
+    def __init__(self, C=1.0, lr=1e-2, batch_size=1024, max_epochs=200, patience=5, tol=1e-4, validation_fraction=0.1, seed=42):
+        self.C = C
+        self.lr = lr
+        self.batch_size = batch_size
+        self.max_epochs = max_epochs
+        self.patience = patience
+        self.tol = tol
+        self.validation_fraction = validation_fraction
+        self.seed = seed
+
+    def _standardize(self, X):
+        return torch.from_numpy((np.asarray(X, dtype=np.float32) - self.mean_) / self.scale_)
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float32)
+        self.classes_, y_index = np.unique(np.asarray(y), return_inverse=True)
+        # 標準化特徵 (CLS 向量各維度的尺度差異很大)，Adam 才能以相同學習率收斂
+        self.mean_ = X.mean(axis=0)
+        self.scale_ = X.std(axis=0) + 1e-6
+        train_rows, val_rows = train_test_split(np.arange(len(X)), test_size=self.validation_fraction,
+                                                random_state=self.seed, stratify=y_index)
+        X_train, y_train = self._standardize(X[train_rows]), torch.from_numpy(y_index[train_rows].astype(np.int64))
+        X_val, y_val = self._standardize(X[val_rows]), torch.from_numpy(y_index[val_rows].astype(np.int64))
+
+        generator = torch.Generator().manual_seed(self.seed)
+        weight = torch.zeros((X.shape[1], len(self.classes_)), requires_grad=True)
+        bias = torch.zeros(len(self.classes_), requires_grad=True)
+        optimizer = torch.optim.Adam([weight, bias], lr=self.lr)
+        l2 = 1.0 / (2 * self.C * len(X_train))
+        best_loss, best_state, wait = float('inf'), None, 0
+        self.history_ = []
+        for epoch in range(self.max_epochs):
+            for batch in torch.randperm(len(X_train), generator=generator).split(self.batch_size):
+                optimizer.zero_grad()
+                loss = F.cross_entropy(X_train[batch] @ weight + bias, y_train[batch]) + l2 * weight.pow(2).sum()
+                loss.backward()
+                optimizer.step()
+            with torch.no_grad():
+                val_logits = X_val @ weight + bias
+                val_loss = F.cross_entropy(val_logits, y_val).item()
+                val_accuracy = (val_logits.argmax(dim=1) == y_val).float().mean().item()
+            self.history_.append({'epoch': epoch + 1, 'val_loss': val_loss, 'val_accuracy': val_accuracy})
+            if val_loss < best_loss - self.tol:
+                best_loss, wait = val_loss, 0
+                best_state = (weight.detach().clone(), bias.detach().clone(), val_accuracy)
+            else:
+                wait += 1
+                if wait >= self.patience:
+                    break
+        if best_state is None:
+            # 驗證集 Loss 從第一個 epoch 就是 NaN / inf (學習率太大、C 太小使正則項過大，或特徵含 NaN / inf)
+            raise ValueError(f"SoftmaxProbe 發散：驗證集 Loss 為 {self.history_[0]['val_loss']} (lr={self.lr:g}, C={self.C:g})；"
+                             f"請降低 lr、增大 C，或檢查特徵是否含 NaN / inf")
+        self.coef_, self.intercept_, self.val_accuracy_ = best_state
+        self.val_loss_ = best_loss
+        self.n_epochs_ = len(self.history_)
+        return self
+
+    def decision_function(self, X):
+        with torch.no_grad():
+            return (self._standardize(X) @ self.coef_ + self.intercept_).numpy()
+
+    def predict_proba(self, X):
+        with torch.no_grad():
+            return torch.softmax(torch.from_numpy(self.decision_function(X)), dim=1).numpy()
+
+    def predict(self, X):
+        return self.classes_[self.decision_function(X).argmax(axis=1)]
+
+def feature_embeddings(backbone, tokenizer, texts_by_feature, model_path, lora_path=None, max_length=128, device=None, batch_size=64):
+    """
+    每個文字欄位的 CLS 向量 (以 cached_cls_embeddings 快取，第二次執行直接讀取)。
+
+    Returns:
+        dict[str, str]: 欄位名稱 -> 快取的 embeddings.npy 路徑 (交給 run_sweep 的 worker 以 memmap 讀取)。
+    """
+    from embedding_cache import cached_cls_embeddings
+    return {
+        feature: cached_cls_embeddings(backbone, tokenizer, texts, model_path, lora_path, feature, max_length, device, batch_size).filename
+        for feature, texts in texts_by_feature.items()
+    }
+
+def _fit_job(job):
+    torch.set_num_threads(job['threads'])
+    embeddings = np.load(job['embeddings_file'], mmap_mode='r')
+    start_time = time.perf_counter()
+    probe = SoftmaxProbe(C=job['C'], **job['probe_kwargs']).fit(embeddings[job['train_idx']], job['labels'][job['train_idx']])
+    y_pred = probe.predict(embeddings[job['test_idx']])
+    y_test = job['labels'][job['test_idx']]
+    return {
+        'feature': job['feature'],
+        'C': job['C'],
+        'val_accuracy': probe.val_accuracy_,
+        'accuracy': accuracy_score(y_test, y_pred),
+        'macro_f1': f1_score(y_test, y_pred, average='macro'),
+        'epochs': probe.n_epochs_,
+        'seconds': time.perf_counter() - start_time,
+        'y_test': y_test,
+        'y_pred': y_pred,
+    }
+
+def run_sweep(embedding_files, labels, train_idx, test_idx, Cs=(0.01, 0.1, 1.0, 10.0), workers=4, probe_kwargs=None):
+    """
+    以 process pool 平行訓練 (文字欄位 x C) 的所有組合。
+
+    Args:
+        embedding_files (dict[str, str]): 欄位名稱 -> embeddings.npy 路徑 (各欄位的資料列順序必須相同)。
+        labels (np.ndarray): 每一列的 label id。
+        train_idx / test_idx (np.ndarray): 訓練 / 測試資料列。
+
+    Returns:
+        list[dict]: 每個組合的結果 (val_accuracy、accuracy、macro_f1、epochs、seconds、y_test、y_pred)，依 val_accuracy 由高到低排序。
+    """
+    labels = np.asarray(labels)
+    threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+    jobs = [{'feature': feature, 'C': C, 'embeddings_file': embeddings_file, 'labels': labels,
+             'train_idx': train_idx, 'test_idx': test_idx, 'threads': threads, 'probe_kwargs': probe_kwargs or {}}
+            for feature, embeddings_file in embedding_files.items() for C in Cs]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_fit_job, jobs))
+    else:
+        results = [_fit_job(job) for job in jobs]
+    return sorted(results, key=lambda result: -result['val_accuracy'])
+
+def format_sweep(results):
+    lines = [f"{'feature':>10} {'C':>8} {'val_acc':>8} {'test_acc':>8} {'macro_f1':>8} {'epochs':>6} {'seconds':>8}"]
+    for r in results:
+        lines.append(f"{r['feature']:>10} {r['C']:>8g} {r['val_accuracy']:>8.4f} {r['accuracy']:>8.4f} {r['macro_f1']:>8.4f} {r['epochs']:>6} {r['seconds']:>8.1f}")
+    return "\n".join(lines)
+
+def print_report(y_test, y_pred, target_names, title="=== 學長 Baseline RoBERTa 重現報告 (Ohsumed 資料集) ==="):
+    """與 task1.ipynb 相同格式的評估報告。"""
+    print(f"\n{title}")
+    print(f"Accuracy: {accuracy_score(y_test, y_pred):.4f}")
+    print(f"Macro F1: {f1_score(y_test, y_pred, average='macro'):.4f}")
+    print("\n各類別詳細指標：")
+    print(classification_report(y_test, y_pred, target_names=target_names))
+
+def main():
+    parser = argparse.ArgumentParser(description="快取 CLS 向量 + mini-batch softmax 的 Linear Probing 掃描")
+    parser.add_argument("--data", default=None, help="ohsumed_dataset.csv 的路徑或網址 (預設為 ohsumed_loader 的預設來源)")
+    parser.add_argument("--model-path", default="roberta-base")
+    parser.add_argument("--tokenizer", default="roberta-base")
+    parser.add_argument("--lora", default=None, help="LoRA adapter 資料夾")
+    parser.add_argument("--features", nargs='+', default=['title', 'abstract'], choices=('title', 'abstract'))
+    parser.add_argument("--C", type=float, nargs='+', default=[0.01, 0.1, 1.0, 10.0])
+    parser.add_argument("--max-length", type=int, default=128, help="與 task1.ipynb 相同的截斷長度")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'classification_data'))
+    from ohsumed_loader import DEFAULT_DATA_URL, open_ohsumed
+    from transformers import RobertaModel, RobertaTokenizer
+
+    dataset = open_ohsumed(args.data or DEFAULT_DATA_URL)
+    labels = np.asarray(dataset.label_ids)
+    # 與 task1.ipynb 相同：分層抽樣 80/20 切分
+    train_idx, test_idx = train_test_split(np.arange(len(dataset)), test_size=0.2, random_state=42, stratify=labels)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    tokenizer = RobertaTokenizer.from_pretrained(args.tokenizer)
+    backbone = RobertaModel.from_pretrained(args.model_path)
+    if args.lora:
+        from peft import PeftModel
+        backbone = PeftModel.from_pretrained(backbone, args.lora)
+    backbone.to(device)
+    # 摘要內的換行與 task1.ipynb 一樣轉成空白
+    texts_by_feature = {feature: [text.replace('\n', ' ') for text in dataset.texts(feature)] for feature in args.features}
+    embedding_files = feature_embeddings(backbone, tokenizer, texts_by_feature, args.model_path, args.lora, args.max_length, device)
+
+    start_time = time.perf_counter()
+    results = run_sweep(embedding_files, labels, train_idx, test_idx, args.C, args.workers)
+    print(format_sweep(results))
+    print(f"掃描 {len(results)} 組設定，共 {time.perf_counter() - start_time:.1f} 秒")
+    best = results[0]
+    print_report(best['y_test'], best['y_pred'], dataset.label_names,
+                 title=f"=== Linear Probing 最佳設定: {best['feature']}, C={best['C']:g} (依驗證集準確率) ===")
+
+if __name__ == "__main__":
+    main()
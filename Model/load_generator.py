@@ -0,0 +1,148 @@
+"""
+serve.py 的本機壓力測試 (只使用 asyncio 標準函式庫，不需要網路)。
+
+以 concurrency 條 keep-alive 連線同時送出 POST /predict，統計用戶端看到的延遲 p50 / p95 / p99、
+吞吐量與被拒絕 (503) 的請求數，最後再讀取伺服器的 /metrics。
+延遲只統計成功 (200) 的請求；佇列已滿時很快回傳的 503 另外計算，不會拉低過載時的尾端延遲。
+
+使用方式：
+    python load_generator.py --url http://127.0.0.1:8000 --concurrency 32 --requests 2000 --texts-per-request 1
+    python load_generator.py --data ../classification_data/ohsumed_dataset.csv ...   # 以 OHSUMED 標題作為請求內容
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+SYNTHETIC_WORDS = ("acute", "chronic", "myocardial", "infarction", "renal", "failure", "pediatric", "tumor",
+                   "therapy", "patients", "clinical", "trial", "hepatitis", "diabetes", "respiratory", "infection")
+
+def synthetic_titles(num_titles, seed=42):
+    """產生長度不一的假標題 (不需要資料集即可測試)。"""
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(SYNTHETIC_WORDS, size=rng.integers(4, 24))) for _ in range(num_titles)]
+
+def load_titles(data, num_titles, seed=42):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'classification_data'))
+    from ohsumed_loader import open_ohsumed
+    dataset = open_ohsumed(data)
+    indices = np.random.default_rng(seed).choice(len(dataset), size=min(num_titles, len(dataset)), replace=False)
+    return dataset.texts('title', indices)
+
+class HTTPConnection:
+    """單一條 keep-alive 連線。"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        data = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, json.loads(data)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+async def run_load(url, titles, concurrency=16, num_requests=1000, texts_per_request=1):
+    """
+    Returns:
+        dict: 成功請求的用戶端延遲分位數 (毫秒)、每秒請求數與文字數、各 HTTP 狀態碼的次數、
+              被拒絕 (503) 的請求數與比例，以及伺服器的 /metrics。
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    latencies, status_counts = [], {}
+    next_request = 0
+
+    async def client():
+        nonlocal next_request
+        connection = HTTPConnection(host, port)
+        try:
+            while next_request < num_requests:
+                request_id = next_request
+                next_request += 1
+                start = request_id * texts_per_request
+                texts = [titles[(start + k) % len(titles)] for k in range(texts_per_request)]
+                request_start = time.perf_counter()
+                status, _ = await connection.request('POST', '/predict', {'texts': texts})
+                if status == 200:
+                    latencies.append((time.perf_counter() - request_start) * 1000)
+                status_counts[status] = status_counts.get(status, 0) + 1
+        finally:
+            await connection.close()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    metrics_connection = HTTPConnection(host, port)
+    _, server_metrics = await metrics_connection.request('GET', '/metrics')
+    await metrics_connection.close()
+
+    ok = status_counts.get(200, 0)
+    total = sum(status_counts.values())
+    rejected = status_counts.get(503, 0)
+    percentiles = np.percentile(latencies, [50, 95, 99]) if latencies else [0.0, 0.0, 0.0]
+    return {
+        'requests': total,
+        'status_counts': status_counts,
+        'rejected': rejected,
+        'rejected_rate': rejected / total if total else 0.0,
+        'latency_p50_ms': float(percentiles[0]),
+        'latency_p95_ms': float(percentiles[1]),
+        'latency_p99_ms': float(percentiles[2]),
+        'requests_per_sec': ok / elapsed,
+        'texts_per_sec': ok * texts_per_request / elapsed,
+        'seconds': elapsed,
+        'server_metrics': server_metrics,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="serve.py 的本機壓力測試")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=16, help="同時連線數")
+    parser.add_argument("--requests", type=int, default=1000, help="總請求數")
+    parser.add_argument("--texts-per-request", type=int, default=1)
+    parser.add_argument("--data", default=None, help="ohsumed_dataset.csv 的路徑或網址；未指定時使用假標題")
+    parser.add_argument("--output", default=None, help="把結果寫成 JSON 檔")
+    args = parser.parse_args()
+
+    titles = load_titles(args.data, 5000) if args.data else synthetic_titles(5000)
+    result = asyncio.run(run_load(args.url, titles, args.concurrency, args.requests, args.texts_per_request))
+    server = result['server_metrics']
+    print(f"{result['requests']} 個請求 (concurrency={args.concurrency}, 每個請求 {args.texts_per_request} 筆), "
+          f"狀態碼: {result['status_counts']}, 耗時 {result['seconds']:.2f} 秒")
+    print(f"被拒絕 (503): {result['rejected']} 個 ({result['rejected_rate']:.1%})")
+    print(f"用戶端延遲 (僅成功的請求): p50 {result['latency_p50_ms']:.1f} ms, p95 {result['latency_p95_ms']:.1f} ms, p99 {result['latency_p99_ms']:.1f} ms")
+    print(f"吞吐量: {result['requests_per_sec']:.1f} requests/sec, {result['texts_per_sec']:.1f} texts/sec")
+    print(f"伺服器: p50 {server['latency_p50_ms']:.1f} ms, p95 {server['latency_p95_ms']:.1f} ms, p99 {server['latency_p99_ms']:.1f} ms, "
+          f"平均 batch {server['mean_batch_size']:.1f}, 拒絕 {server['rejected']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+MeSH 語意相似度目標的批次驗證引擎。
+
+原本的驗證迴圈對每組配對跑兩次 forward，並經過 MeSHSemanticLoss.forward (其中約 1% 的機率會 print tensor，造成裝置同步)。
+SemanticEvaluator 改為：
+    1. 驗證集中不重複的術語只編碼一次 (依長度分組、動態補齊)，向量先正規化。
+    2. 所有驗證配對的 cosine 相似度與 WUP 誤差以一次向量化運算求出。
+    3. 回報 MSE (即 MeSHSemanticLoss 在所有配對上的平均)、MAE、Spearman 相關係數與依 LCS 深度分組的誤差。
+"""
+import numpy as np
+import pandas as pd
+import torch
+
+from length_bucketing import BucketBatchSampler, DynamicPaddingCollator
+from token_cache import tokenize_cached
+
+def lcs_depths_from_tree_numbers(nodes_a, nodes_b):
+    """
+    依 create_dataset.get_lcs_path_and_depth 的規則計算 LCS 深度：
+    共同的 tree number 區段數 k (以 '.' 分隔) -> 深度 k + 1 ('C' 根節點為 1)。
+    """
+    pairs = pd.DataFrame({'a': nodes_a, 'b': nodes_b})
+    unique_pairs = pairs.drop_duplicates()
+    unique_depths = []
+    for tn_a, tn_b in zip(unique_pairs['a'], unique_pairs['b']):
+        common = 0
+        for part_a, part_b in zip(tn_a.split('.'), tn_b.split('.')):
+            if part_a != part_b:
+                break
+            common += 1
+        unique_depths.append(common + 1)
+    unique_pairs = unique_pairs.assign(depth=unique_depths)
+    return pairs.merge(unique_pairs, on=['a', 'b'], how='left')['depth'].to_numpy(dtype=np.int16)
+
+def spearman_correlation(x, y):
+    """Spearman 等級相關係數 (相同值取平均等級，與 scipy.stats.spearmanr 相同)。"""
+    rank_x = pd.Series(x).rank(method='average').to_numpy()
+    rank_y = pd.Series(y).rank(method='average').to_numpy()
+    if rank_x.std() == 0 or rank_y.std() == 0:
+        return float('nan')
+    return float(np.corrcoef(rank_x, rank_y)[0, 1])
+
+class SemanticEvaluator:
+    """
+    Args:
+        pair_index (TermPairIndex): 驗證集配對 (unique_term_batching.TermPairIndex)。
+        tokenizer: Hugging Face tokenizer。
+        batch_size (int): 編碼術語時每個 batch 的術語數。
+        pair_chunk_size (int): 計算配對相似度時每次處理的配對數 (限制記憶體用量)。
+    """
+
+    def __init__(self, pair_index, tokenizer, max_length=512, batch_size=256, pair_chunk_size=65536):
+        self.pair_index = pair_index
+        self.term_tokens = tokenize_cached(tokenizer, pair_index.vocab, max_length=max_length, text_column='mesh_term', padding='none')
+        self.padder = DynamicPaddingCollator(tokenizer.pad_token_id, tokenizer.padding_side)
+        self.batch_size = batch_size
+        self.pair_chunk_size = pair_chunk_size
+        if pair_index.nodes_i is not None:
+            self.bucket_name = 'lcs_depth'
+            self.buckets = lcs_depths_from_tree_numbers(pair_index.nodes_i, pair_index.nodes_j)
+        else:
+            # 沒有 tree number 時，改以 WUP 目標值 (每 0.1 一組) 分組
+            self.bucket_name = 'wup_bin'
+            self.buckets = np.round(np.floor(pair_index.wup * 10) / 10, 1)
+
+    def encode_terms(self, model, device):
+        """以 eval 模式編碼所有不重複術語，回傳正規化後的 CLS 向量 (torch.Tensor, 形狀 (術語數, hidden))。"""
+        embeddings = None
+        sampler = BucketBatchSampler(np.asarray(self.term_tokens.lengths), self.batch_size, shuffle=False)
+        with torch.no_grad():
+            for term_ids in sampler:
+                batch = self.padder([{'input_ids': torch.from_numpy(self.term_tokens.sequence(t).astype(np.int64))} for t in term_ids])
+                cls_output = model(input_ids=batch['input_ids'].to(device),
+                                   attention_mask=batch['attention_mask'].to(device)).last_hidden_state[:, 0, :]
+                if embeddings is None:
+                    embeddings = torch.empty((len(self.pair_index.vocab), cls_output.shape[1]), dtype=torch.float32, device=device)
+                embeddings[torch.as_tensor(term_ids, device=device)] = cls_output.float()
+        # 與 F.cosine_similarity 相同，以 eps 避免除以 0
+        return embeddings / embeddings.norm(dim=1, keepdim=True).clamp_min(1e-8)
+
+    def evaluate(self, model, device):
+        """
+        Returns:
+            dict: mse、mae、spearman、num_pairs、num_terms 以及 buckets
+                  ({分組值: {'count', 'mse', 'mean_error'}}，mean_error = 平均 (cos - WUP))。
+        """
+        was_training = model.training
+        model.eval()
+        embeddings = self.encode_terms(model, device)
+        cosine = np.empty(len(self.pair_index), dtype=np.float32)
+        pair_i = torch.as_tensor(self.pair_index.pair_i, device=device)
+        pair_j = torch.as_tensor(self.pair_index.pair_j, device=device)
+        for start in range(0, len(cosine), self.pair_chunk_size):
+            end = start + self.pair_chunk_size
+            cosine[start:end] = (embeddings[pair_i[start:end]] * embeddings[pair_j[start:end]]).sum(dim=1).cpu().numpy()
+        if was_training:
+            model.train()
+
+        errors = cosine.astype(np.float64) - self.pair_index.wup
+        buckets = {}
+        frame = pd.DataFrame({'bucket': self.buckets, 'error': errors})
+        for bucket, group in frame.groupby('bucket'):
+            buckets[bucket.item() if hasattr(bucket, 'item') else bucket] = {
+                'count': len(group),
+                'mse': float((group['error'] ** 2).mean()),
+                'mean_error': float(group['error'].mean()),
+            }
+        return {
+            'mse': float(np.mean(errors ** 2)),
+            'mae': float(np.mean(np.abs(errors))),
+            'spearman': spearman_correlation(cosine, self.pair_index.wup),
+            'num_pairs': len(errors),
+            'num_terms': len(self.pair_index.vocab),
+            'bucket_name': self.bucket_name,
+            'buckets': buckets,
+        }
+
+def format_report(results):
+    lines = [f"驗證配對 {results['num_pairs']} 組 / 術語 {results['num_terms']} 個: "
+             f"MSE={results['mse']:.6f}, MAE={results['mae']:.4f}, Spearman={results['spearman']:.4f}"]
+    for bucket, stats in sorted(results['buckets'].items()):
+        lines.append(f"  {results['bucket_name']}={bucket}: {stats['count']} 組, MSE={stats['mse']:.6f}, 平均誤差={stats['mean_error']:+.4f}")
+    return "\n".join(lines)
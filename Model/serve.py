@@ -0,0 +1,338 @@
+"""
+OHSUMED 分類器的本機 HTTP 推論服務 (只使用 asyncio 標準函式庫)。
+
+同時進來的請求會被合併成動態的 micro-batch：
+    - 收到第一筆文字後最多再等 max_wait_ms，或湊滿 max_batch_size 筆就送進模型 (一次 forward)
+    - 模型在另一個執行緒執行，event loop 可以繼續接收請求
+    - 等待中的文字超過 max_queue 筆時直接回傳 503 (backpressure)，不會無限制地堆積
+    - 模型執行失敗時回傳 500；失敗的 batch 會逐筆重試，只有造成錯誤的請求失敗
+    - 無法解析的請求行或標頭回傳 400；Content-Length 超過 max_body_bytes 時回傳 413，不會讀取內容
+
+API:
+    POST /predict   {"texts": ["...", ...]} 或 {"text": "..."}
+                    -> {"predictions": [{"label": "C04", "label_id": 3, "probabilities": {"C01": 0.01, ...}}, ...]}
+    GET  /metrics   -> 延遲 p50 / p95 / p99 (毫秒)、每秒請求數與文字數、平均 batch 大小、被拒絕的請求數
+    GET  /health    -> {"status": "ok"}
+
+使用方式：
+    python serve.py --model-path roberta-base --head RoBERTa_based/classifier_head.pt --backend int8 --port 8000
+    python load_generator.py --url http://127.0.0.1:8000 --concurrency 32 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from inference import softmax
+
+# OHSUMED 的 23 個疾病類別；label id 依類別名稱排序編碼 (C01 -> 0, ..., C23 -> 22)
+DEFAULT_LABEL_NAMES = [f"C{i:02d}" for i in range(1, 24)]
+
+DEFAULT_MAX_BODY_BYTES = 1 << 20
+
+class QueueFullError(Exception):
+    """等待中的文字超過 max_queue (回傳 503)。"""
+
+class BadRequestError(Exception):
+    """請求行、標頭或 Content-Length 無法解析 (回傳 400)，或請求內容超過 max_body_bytes (回傳 413)。"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class LatencyMetrics:
+    """最近 window 筆請求的延遲分位數與服務啟動後的吞吐量。"""
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.start_time = time.perf_counter()
+        self.requests = 0
+        self.texts = 0
+        self.rejected = 0
+
+    def record_request(self, latency_seconds, num_texts):
+        self.latencies.append(latency_seconds * 1000)
+        self.requests += 1
+        self.texts += num_texts
+
+    def record_batch(self, batch_size):
+        self.batch_sizes.append(batch_size)
+
+    def snapshot(self):
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        latencies = np.asarray(self.latencies, dtype=np.float64)
+        percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [0.0, 0.0, 0.0]
+        return {
+            'requests': self.requests,
+            'texts': self.texts,
+            'rejected': self.rejected,
+            'latency_p50_ms': float(percentiles[0]),
+            'latency_p95_ms': float(percentiles[1]),
+            'latency_p99_ms': float(percentiles[2]),
+            'requests_per_sec': self.requests / elapsed,
+            'texts_per_sec': self.texts / elapsed,
+            'mean_batch_size': float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            'uptime_sec': elapsed,
+        }
+
+class MicroBatcher:
+    """
+    把同時進來的文字合併成 micro-batch。
+
+    Args:
+        predict_fn: 同步函式 list[str] -> np.ndarray (每筆文字的 logits)，在獨立的執行緒中執行。
+        max_batch_size (int): 每個 batch 最多的文字數。
+        max_wait_ms (float): 收到 batch 的第一筆文字後，最多等待多久再送進模型。
+        max_queue (int): 等待中的文字上限；超過時 submit 會丟出 QueueFullError。
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=10, max_queue=1024, metrics=None):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.metrics = metrics or LatencyMetrics()
+        self.queue = asyncio.Queue()
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.worker = None
+
+    def start(self):
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, texts):
+        """送出一組文字並等待結果 (np.ndarray, 每筆文字的 logits)。"""
+        if self.pending + len(texts) > self.max_queue:
+            self.metrics.rejected += 1
+            raise QueueFullError(f"等待中的文字已達上限 {self.max_queue}")
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in texts]
+        self.pending += len(texts)
+        for text, future in zip(texts, futures):
+            self.queue.put_nowait((text, future))
+        # 等待所有文字完成 (避免其他失敗的 future 沒被取出而產生警告)，再丟出第一個錯誤
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return np.stack(results)
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # 已經在佇列中的文字不必再等待
+        while len(batch) < self.max_batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                logits = await loop.run_in_executor(self.executor, self.predict_fn, texts)
+            except Exception as e:
+                if len(batch) == 1:
+                    self._resolve(batch[0][1], exception=e)
+                else:
+                    # 逐筆重試，只有造成錯誤的文字所屬的請求會失敗，同一個 batch 的其他請求不受影響
+                    for text, future in batch:
+                        try:
+                            row = (await loop.run_in_executor(self.executor, self.predict_fn, [text]))[0]
+                        except Exception as text_error:
+                            self._resolve(future, exception=text_error)
+                        else:
+                            self._resolve(future, row)
+            else:
+                for (_, future), row in zip(batch, logits):
+                    self._resolve(future, row)
+            finally:
+                self.pending -= len(batch)
+                self.metrics.record_batch(len(batch))
+
+    @staticmethod
+    def _resolve(future, result=None, exception=None):
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+class InferenceServer:
+    """極簡的 HTTP/1.1 伺服器 (支援 keep-alive)，把 /predict 的文字交給 MicroBatcher。"""
+
+    def __init__(self, batcher, label_names=None, max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+        self.batcher = batcher
+        self.label_names = label_names
+        self.max_body_bytes = max_body_bytes
+
+    def _format_predictions(self, logits):
+        probabilities = softmax(logits.astype(np.float64))
+        names = self.label_names or [str(i) for i in range(probabilities.shape[1])]
+        predictions = []
+        for row in probabilities:
+            label_id = int(row.argmax())
+            predictions.append({
+                'label': names[label_id],
+                'label_id': label_id,
+                'probabilities': {name: round(float(p), 6) for name, p in zip(names, row)},
+            })
+        return predictions
+
+    async def _handle_predict(self, body):
+        try:
+            payload = json.loads(body or b'{}')
+            texts = payload['texts'] if 'texts' in payload else [payload['text']]
+            if not isinstance(texts, list) or not texts:
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': '請求格式應為 {"texts": ["...", ...]} 或 {"text": "..."}'}
+        start_time = time.perf_counter()
+        try:
+            logits = await self.batcher.submit([str(text) for text in texts])
+        except QueueFullError as e:
+            return 503, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f"推論失敗: {type(e).__name__}: {e}"}
+        self.batcher.metrics.record_request(time.perf_counter() - start_time, len(texts))
+        return 200, {'predictions': self._format_predictions(logits)}
+
+    async def _route(self, method, path, body):
+        if method == 'POST' and path == '/predict':
+            return await self._handle_predict(body)
+        if method == 'GET' and path == '/metrics':
+            return 200, self.batcher.metrics.snapshot()
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        return 404, {'error': f'{method} {path} not found'}
+
+    @staticmethod
+    async def _readline(reader):
+        try:
+            return await reader.readline()
+        except ValueError:  # 超過 StreamReader 的單行長度上限
+            raise BadRequestError(400, '請求行或標頭過長')
+
+    async def _read_request(self, reader):
+        """讀取一個請求，回傳 (method, path, version, headers, body)；連線已關閉時回傳 None。"""
+        request_line = await self._readline(reader)
+        if not request_line:
+            return None
+        try:
+            method, path, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise BadRequestError(400, f'無法解析的請求行: {request_line[:100]!r}')
+        headers = {}
+        while True:
+            line = await self._readline(reader)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, separator, value = line.decode('latin-1').partition(':')
+            if not separator or not name.strip():
+                raise BadRequestError(400, f'無法解析的標頭: {line[:100]!r}')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            content_length = int(headers.get('content-length', 0))
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            raise BadRequestError(400, 'Content-Length 必須是非負整數')
+        # 先檢查長度再讀取，避免單一用戶端讓伺服器緩衝任意大小的內容
+        if content_length > self.max_body_bytes:
+            raise BadRequestError(413, f'請求內容 {content_length} bytes 超過上限 {self.max_body_bytes} bytes')
+        body = await reader.readexactly(content_length)
+        return method, path, version, headers, body
+
+    @staticmethod
+    async def _write_response(writer, status, payload, keep_alive):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+                  500: 'Internal Server Error', 503: 'Service Unavailable'}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except BadRequestError as e:
+                    # 無法確定下一個請求從哪裡開始，回覆錯誤後關閉連線
+                    await self._write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, version, headers, body = request
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(predict_fn, host='127.0.0.1', port=8000, max_batch_size=32, max_wait_ms=10, max_queue=1024, label_names=None,
+                max_body_bytes=DEFAULT_MAX_BODY_BYTES):
+    batcher = MicroBatcher(predict_fn, max_batch_size, max_wait_ms, max_queue)
+    batcher.start()
+    server = InferenceServer(batcher, label_names, max_body_bytes)
+    tcp_server = await asyncio.start_server(server.handle_connection, host, port)
+    print(f"OHSUMED 推論服務: http://{host}:{port} (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms}, max_queue={max_queue})")
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        await batcher.stop()
+
+def main():
+    from inference import BACKENDS, OhsumedClassifierEngine
+
+    parser = argparse.ArgumentParser(description="OHSUMED 分類器的本機 micro-batching HTTP 服務")
+    parser.add_argument("--model-path", default="roberta-base", help="backbone 的模型名稱或路徑")
+    parser.add_argument("--head", required=True, help="save_classifier_head 產生的 classifier_head.pt")
+    parser.add_argument("--tokenizer", default="roberta-base")
+    parser.add_argument("--lora", default=None, help="LoRA adapter 資料夾 (會合併到 backbone)")
+    parser.add_argument("--backend", default="int8", choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--max-queue", type=int, default=1024, help="等待中的文字上限，超過時回傳 503")
+    parser.add_argument("--max-body-bytes", type=int, default=DEFAULT_MAX_BODY_BYTES, help="請求內容的上限 (bytes)，超過時回傳 413")
+    args = parser.parse_args()
+
+    engine = OhsumedClassifierEngine(args.model_path, args.head, args.tokenizer, args.lora, args.backend, num_threads=args.threads)
+    predict_fn = lambda texts: engine.predict_logits(texts, batch_size=args.max_batch_size)
+    try:
+        asyncio.run(serve(predict_fn, args.host, args.port, args.max_batch_size, args.max_wait_ms, args.max_queue,
+                          engine.label_names or DEFAULT_LABEL_NAMES, args.max_body_bytes))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+MeSH 術語向量的近似最近鄰 (ANN) 索引。
+
+task3 以 LoRA 訓練後，希望把任意的疾病描述對應到最接近的 MeSH 節點：
+    1. encode_tree_terms: 以 (合併 LoRA 後的) RoBERTa 編碼 MeshTree 共用術語表中的每個術語 (每個術語只編碼一次)，
+       CLS 向量正規化後存成記憶體映射的 float16 矩陣 term_embeddings.npy。
+    2. IVFIndex: 以球面 k-means (NumPy) 把向量分成 nlist 群；查詢時只比對最接近的 nprobe 群 (inverted file)。
+       BruteForceIndex 為完整的 cosine 比對，作為 recall 的基準。
+    3. TermSearcher.query: 回傳前 k 個術語、其所有 tree number，以及與參考節點的 Wu-Palmer 相似度。
+    4. benchmark_index: 比較 IVF 與暴力搜尋的 recall@k 與每秒查詢數。
+
+索引目錄：
+    <index_dir>/term_embeddings.npy, ivf.npz, meta.json
+
+使用方式 (需要 MeSH_data 的 mesh_tree.py / tree_cache.py 與樹狀結構快取)：
+    python term_index.py build --tree-cache ../MeSH_data/nt_data/disease_tree_cache.npz --lora roberta_semantic_lora --index-dir mesh_term_index
+    python term_index.py query --tree-cache ... --lora roberta_semantic_lora --index-dir mesh_term_index --reference C14 "heart attack"
+    python term_index.py benchmark --index-dir mesh_term_index --nprobe 1 4 16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from embedding_cache import adapter_fingerprint
+from length_bucketing import BucketBatchSampler, DynamicPaddingCollator
+from token_cache import texts_sha256, tokenize_cached
+
+TERM_INDEX_VERSION = 1
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-8)
+
+def _encode_batch(model, input_ids, attention_mask, device):
+    with torch.no_grad():
+        cls_output = model(input_ids=input_ids.to(device), attention_mask=attention_mask.to(device)).last_hidden_state[:, 0, :]
+    return _normalize(cls_output.float().cpu().numpy())
+
+def encode_texts(model, tokenizer, texts, device, batch_size=256, max_length=512, text_column='mesh_term', output=None):
+    """
+    以 eval 模式編碼 texts，回傳正規化後的 CLS 向量 (float32)；指定 output (可寫入的陣列，例如 float16 memmap) 時直接寫入 output。
+    tokenize 結果寫入 token_cache，batch 依長度分組並動態補齊。
+    """
+    tokens = tokenize_cached(tokenizer, texts, max_length=max_length, text_column=text_column, padding='none')
+    padder = DynamicPaddingCollator(tokenizer.pad_token_id, tokenizer.padding_side)
+    model.eval()
+    for indices in BucketBatchSampler(np.asarray(tokens.lengths), batch_size, shuffle=False):
+        batch = padder([{'input_ids': torch.from_numpy(tokens.sequence(i).astype(np.int64))} for i in indices])
+        vectors = _encode_batch(model, batch['input_ids'], batch['attention_mask'], device)
+        if output is None:
+            output = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        output[indices] = vectors
+    return output
+
+def encode_tree_terms(model, tokenizer, tree, index_dir, device=None, batch_size=256, max_length=512, model_id=None):
+    """
+    編碼 tree.term_table 的所有術語，寫入 <index_dir>/term_embeddings.npy (float16 memmap) 與 meta.json；
+    相同的模型與術語表已經編碼過時直接讀取。回傳記憶體映射的向量矩陣。
+    """
+    device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    meta = {
+        "version": TERM_INDEX_VERSION,
+        "model_id": model_id,
+        "terms_sha256": texts_sha256(tree.term_table),
+        "num_terms": len(tree.term_table),
+        "max_length": max_length,
+    }
+    embeddings_file = os.path.join(index_dir, 'term_embeddings.npy')
+    meta_file = os.path.join(index_dir, 'meta.json')
+    if os.path.exists(meta_file):
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            if json.load(f) == meta:
+                print(f"使用術語向量快取 {embeddings_file}")
+                return np.load(embeddings_file, mmap_mode='r')
+
+    os.makedirs(index_dir, exist_ok=True)
+    print(f"編碼 {len(tree.term_table)} 個 MeSH 術語 ...")
+    hidden_size = model.config.hidden_size
+    embeddings = np.lib.format.open_memmap(embeddings_file + '.tmp.npy', mode='w+', dtype=np.float16,
+                                           shape=(len(tree.term_table), hidden_size))
+    encode_texts(model, tokenizer, tree.term_table, device, batch_size, max_length, output=embeddings)
+    embeddings.flush()
+    del embeddings
+    os.replace(embeddings_file + '.tmp.npy', embeddings_file)
+    with open(meta_file, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return np.load(embeddings_file, mmap_mode='r')
+
+def read_embeddings_meta(index_dir):
+    """回傳 encode_tree_terms 寫入的 meta.json (沒有時回傳 None)。"""
+    meta_file = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _merge_top_k(best_ids, best_scores, new_ids, new_scores, k):
+    """把新的候選併入目前的前 k 名 (每列一個查詢)；回傳的前 k 名尚未排序。"""
+    scores = np.concatenate([best_scores, new_scores], axis=1)
+    ids = np.concatenate([best_ids, np.broadcast_to(new_ids, new_scores.shape)], axis=1)
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores, ids = np.take_along_axis(scores, top, axis=1), np.take_along_axis(ids, top, axis=1)
+    return ids, scores
+
+def _sort_top_k(ids, scores):
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+class BruteForceIndex:
+    """完整的 cosine 比對 (向量已正規化，cosine = 內積)。"""
+
+    def __init__(self, embeddings, block_size=65536):
+        self.embeddings = embeddings
+        self.block_size = block_size
+
+    def search(self, queries, k=10):
+        """回傳 (ids, scores)，形狀皆為 (查詢數, k)。"""
+        queries = _normalize(queries)
+        k = min(k, len(self.embeddings))
+        ids = np.zeros((len(queries), 0), dtype=np.int64)
+        scores = np.zeros((len(queries), 0), dtype=np.float32)
+        # 分區塊計算，只保留目前的前 k 名，不必把整個 float16 矩陣轉成 float32
+        for start in range(0, len(self.embeddings), self.block_size):
+            block = np.asarray(self.embeddings[start:start + self.block_size], dtype=np.float32)
+            ids, scores = _merge_top_k(ids, scores, np.arange(start, start + len(block)), queries @ block.T, k)
+        return _sort_top_k(ids, scores)
+
+class IVFIndex:
+    """
+    Inverted file 索引：球面 k-means 的 nlist 個中心，每個向量歸入最接近的中心。
+    查詢時只比對最接近查詢的 nprobe 群；nprobe 越大 recall 越高、速度越慢。
+
+    Attributes:
+        centroids (np.ndarray): float32，形狀 (nlist, hidden)，已正規化。
+        list_offsets / list_ids: 每一群成員的 CSR 索引。
+    """
+
+    def __init__(self, embeddings, centroids, list_offsets, list_ids, nprobe=8):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, num_iters=20, sample_size=100000, nprobe=8, seed=42, block_size=65536):
+        """以球面 k-means 建立索引；nlist 預設為 4 * sqrt(向量數)，且不超過 k-means 的樣本數。"""
+        rng = np.random.default_rng(seed)
+        num_vectors = len(embeddings)
+        if num_vectors == 0 or sample_size < 1:
+            raise ValueError(f"建立索引需要至少一個向量與 sample_size >= 1 (向量數 {num_vectors}, sample_size {sample_size})")
+        sample_ids = np.sort(rng.choice(num_vectors, size=min(sample_size, num_vectors), replace=False))
+        sample = np.asarray(embeddings[sample_ids], dtype=np.float32)
+        # 中心以不重複的樣本初始化，因此 nlist 不能超過樣本數
+        nlist = min(nlist or max(1, int(4 * np.sqrt(num_vectors))), len(sample))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(num_iters):
+            assignments = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=nlist) == 0
+            if empty.any():
+                # 沒有成員的中心改用隨機的樣本重新初始化
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+
+        assignments = np.empty(num_vectors, dtype=np.int32)
+        for start in range(0, num_vectors, block_size):
+            block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+            assignments[start:start + len(block)] = (block @ centroids.T).argmax(axis=1)
+        list_ids = np.argsort(assignments, kind='stable').astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=list_offsets[1:])
+        return cls(embeddings, centroids, list_offsets, list_ids, nprobe)
+
+    def save(self, index_file, embeddings_meta=None):
+        """embeddings_meta (term_embeddings 的 meta.json 內容) 會一併寫入，載入時用來確認索引對應的是同一份向量。"""
+        np.savez(index_file, centroids=self.centroids, list_offsets=self.list_offsets, list_ids=self.list_ids,
+                 embeddings_meta=np.array(json.dumps(embeddings_meta, sort_keys=True)))
+
+    @staticmethod
+    def read_embeddings_meta(index_file):
+        """回傳建立索引時的 embeddings_meta；舊格式或沒有記錄時回傳 None。"""
+        with np.load(index_file) as data:
+            return json.loads(str(data['embeddings_meta'])) if 'embeddings_meta' in data else None
+
+    @classmethod
+    def load(cls, index_file, embeddings, nprobe=8, embeddings_meta=None):
+        """載入索引；給定 embeddings_meta 時，與建立索引時的向量不同 (或向量數不同) 會丟出 ValueError。"""
+        if embeddings_meta is not None and cls.read_embeddings_meta(index_file) != embeddings_meta:
+            raise ValueError(f"{index_file} 是以不同的術語向量建立的，請重新執行 build")
+        with np.load(index_file) as data:
+            index = cls(embeddings, data['centroids'], data['list_offsets'], data['list_ids'], nprobe)
+        if len(index.list_ids) != len(embeddings):
+            raise ValueError(f"{index_file} 包含 {len(index.list_ids)} 個術語，但向量矩陣有 {len(embeddings)} 個，請重新執行 build")
+        return index
+
+    def search(self, queries, k=10, nprobe=None):
+        """回傳 (ids, scores)，形狀皆為 (查詢數, k)；候選數不足 k 時以 -1 / -inf 補齊。"""
+        queries = _normalize(queries)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        # 依群組處理：每一群的向量只讀取一次，並以一次矩陣乘法比對所有探查到這一群的查詢
+        query_rows = np.repeat(np.arange(len(queries)), nprobe)
+        probed_lists = probes.ravel()
+        order = np.argsort(probed_lists, kind='stable')
+        query_rows, probed_lists = query_rows[order], probed_lists[order]
+        boundaries = np.flatnonzero(np.diff(probed_lists)) + 1
+        for rows, lists in zip(np.split(query_rows, boundaries), np.split(probed_lists, boundaries)):
+            list_id = lists[0]
+            members = self.list_ids[self.list_offsets[list_id]:self.list_offsets[list_id + 1]]
+            if len(members) == 0:
+                continue
+            vectors = np.asarray(self.embeddings[members], dtype=np.float32)
+            ids[rows], scores[rows] = _merge_top_k(ids[rows], scores[rows], members, queries[rows] @ vectors.T, k)
+        return _sort_top_k(ids, scores)
+
+class TermSearcher:
+    """
+    把查詢文字對應到最接近的 MeSH 術語與節點。
+
+    Args:
+        tree (MeshTree): 'Diseases [C]' 樹 (提供術語表、tree number 與 Wu-Palmer 相似度)。
+        embeddings: encode_tree_terms 產生的術語向量。
+        index: IVFIndex 或 BruteForceIndex。
+        model / tokenizer: 用來編碼查詢文字 (與建立索引時相同的模型)。
+    """
+
+    def __init__(self, tree, embeddings, index, model, tokenizer, device=None, max_length=512):
+        self.tree = tree
+        self.embeddings = embeddings
+        self.index = index
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.max_length = max_length
+        # 術語 -> 所屬節點 (同一個術語可能出現在多個 tree number 下)
+        term_nodes = np.repeat(np.arange(len(tree), dtype=np.int64), np.diff(tree.term_offsets))
+        order = np.argsort(tree.term_ids, kind='stable')
+        self.term_node_ids = term_nodes[order]
+        self.term_node_offsets = np.zeros(len(tree.term_table) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tree.term_ids, minlength=len(tree.term_table)), out=self.term_node_offsets[1:])
+
+    def nodes_of_term(self, term_id):
+        return self.term_node_ids[self.term_node_offsets[term_id]:self.term_node_offsets[term_id + 1]]
+
+    def query(self, texts, k=10, reference=None, **search_kwargs):
+        """
+        Args:
+            texts (list[str]): 查詢文字。
+            reference (str | int | None): 參考節點 (tree number 或節點 id)；有指定時回傳每個 tree number 與參考節點的 WUP。
+
+        Returns:
+            list[list[dict]]: 每筆查詢的前 k 個術語：{'term', 'score', 'tree_numbers', 'wup' (有 reference 時)}。
+        """
+        # 查詢文字不寫入 token_cache
+        self.model.eval()
+        encoded = self.tokenizer([str(text) for text in texts], truncation=True, max_length=self.max_length, padding=True, return_tensors='pt')
+        vectors = _encode_batch(self.model, encoded['input_ids'], encoded['attention_mask'], self.device)
+        ids, scores = self.index.search(vectors, k, **search_kwargs)
+        results = []
+        for row_ids, row_scores in zip(ids, scores):
+            matches = []
+            for term_id, score in zip(row_ids, row_scores):
+                if term_id < 0:
+                    continue
+                node_ids = self.nodes_of_term(term_id)
+                match = {
+                    'term': self.tree.term_table[term_id],
+                    'score': float(score),
+                    'tree_numbers': [self.tree.tree_numbers[n] for n in node_ids],
+                }
+                if reference is not None:
+                    reference_ids = np.full(len(node_ids), self.tree.node_id(reference))
+                    match['wup'] = self.tree.wup_similarity_batch(node_ids, reference_ids).round(4).tolist()
+                matches.append(match)
+            results.append(matches)
+        return results
+
+def benchmark_index(index, brute_force, queries, k=10, nprobes=(1, 4, 16)):
+    """
+    以暴力搜尋為基準，比較不同 nprobe 的 recall@k 與每秒查詢數。
+
+    Returns:
+        list[dict]: 第一筆為暴力搜尋，之後每個 nprobe 一筆 ({'method', 'recall_at_k', 'queries_per_sec'})。
+    """
+    start_time = time.perf_counter()
+    exact_ids, _ = brute_force.search(queries, k)
+    results = [{'method': 'brute_force', 'recall_at_k': 1.0, 'queries_per_sec': len(queries) / (time.perf_counter() - start_time)}]
+    for nprobe in nprobes:
+        start_time = time.perf_counter()
+        ids, _ = index.search(queries, k, nprobe=nprobe)
+        elapsed = time.perf_counter() - start_time
+        hits = [len(np.intersect1d(found[found >= 0], exact)) for found, exact in zip(ids, exact_ids)]
+        results.append({'method': f'ivf nprobe={nprobe}', 'recall_at_k': float(np.mean(hits)) / exact_ids.shape[1],
+                        'queries_per_sec': len(queries) / elapsed})
+    return results
+
+def perturbed_queries(embeddings, num_queries=1000, noise=0.5, seed=42):
+    """從術語向量中抽樣並加上高斯雜訊 (相對於向量長度)，模擬與術語不完全相同的查詢。"""
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(embeddings[np.sort(rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False))], dtype=np.float32)
+    return _normalize(sample + rng.normal(scale=noise / np.sqrt(sample.shape[1]), size=sample.shape).astype(np.float32))
+
+def main():
+    parser = argparse.ArgumentParser(description="MeSH 術語向量的 ANN 索引")
+    parser.add_argument("command", choices=("build", "query", "benchmark"))
+    parser.add_argument("texts", nargs='*', help="query 的查詢文字")
+    parser.add_argument("--tree-cache", default=os.path.join('..', 'MeSH_data', 'nt_data', 'disease_tree_cache.npz'))
+    parser.add_argument("--model-path", default="roberta-base")
+    parser.add_argument("--tokenizer", default="roberta-base")
+    parser.add_argument("--lora", default=None, help="task3 訓練的 LoRA adapter 資料夾 (會合併到 backbone)")
+    parser.add_argument("--index-dir", default="mesh_term_index")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF 群數 (預設 4 * sqrt(術語數))")
+    parser.add_argument("--nprobe", type=int, nargs='+', default=[8], help="查詢時比對的群數 (benchmark 可給多個)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--reference", default=None, help="計算 WUP 的參考節點 tree number")
+    parser.add_argument("--queries", type=int, default=1000, help="benchmark 的查詢數")
+    parser.add_argument("--query-noise", type=float, default=0.5, help="benchmark 查詢向量的雜訊大小")
+    args = parser.parse_args()
+
+    index_file = os.path.join(args.index_dir, 'ivf.npz')
+
+    if args.command == 'benchmark':
+        embeddings = np.load(os.path.join(args.index_dir, 'term_embeddings.npy'), mmap_mode='r')
+        queries = perturbed_queries(embeddings, args.queries, args.query_noise)
+        index = IVFIndex.load(index_file, embeddings, embeddings_meta=read_embeddings_meta(args.index_dir))
+        results = benchmark_index(index, BruteForceIndex(embeddings), queries, args.k, args.nprobe)
+        for result in results:
+            print(f"{result['method']:>16}: recall@{args.k} {result['recall_at_k']:.4f}, {result['queries_per_sec']:,.1f} queries/sec")
+        return
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MeSH_data'))
+    from mesh_tree import MeshTree
+    tree = MeshTree.from_cache(args.tree_cache)
+    if tree is None:
+        raise SystemExit(f"找不到樹狀結構快取 {args.tree_cache}，請先執行 MeSH_data/create_dataset.py")
+
+    from inference import load_backbone
+    from transformers import RobertaTokenizer
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    tokenizer = RobertaTokenizer.from_pretrained(args.tokenizer)
+    model = load_backbone(args.model_path, args.lora).to(device)
+    model_id = json.dumps({"model_path": args.model_path, "lora": args.lora, "lora_fingerprint": adapter_fingerprint(args.lora)}, sort_keys=True)
+    embeddings = encode_tree_terms(model, tokenizer, tree, args.index_dir, device, model_id=model_id)
+    embeddings_meta = read_embeddings_meta(args.index_dir)
+
+    # 術語向量重新編碼過 (不同的 adapter 或術語表) 時，舊索引的分群已不適用，必須重建
+    stale = os.path.exists(index_file) and IVFIndex.read_embeddings_meta(index_file) != embeddings_meta
+    if args.command == 'build' or not os.path.exists(index_file) or stale:
+        if stale and args.command != 'build':
+            print(f"{index_file} 與目前的術語向量不一致，重新建立索引")
+        start_time = time.perf_counter()
+        index = IVFIndex.build(embeddings, nlist=args.nlist, nprobe=args.nprobe[0])
+        index.save(index_file, embeddings_meta)
+        print(f"IVF 索引: {len(index.centroids)} 群, {len(embeddings)} 個術語 ({time.perf_counter() - start_time:.1f} 秒) -> {index_file}")
+    if args.command == 'query':
+        index = IVFIndex.load(index_file, embeddings, args.nprobe[0], embeddings_meta)
+        searcher = TermSearcher(tree, embeddings, index, model, tokenizer, device)
+        for text, matches in zip(args.texts, searcher.query(args.texts, args.k, args.reference)):
+            print(f"\n{text}")
+            for match in matches:
+                wup = f", WUP={match['wup']}" if 'wup' in match else ''
+                print(f"  {match['score']:.4f}  {match['term']}  {match['tree_numbers']}{wup}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+預先 tokenize 的資料快取。
+
+把 tokenizer 的 input_ids / attention_mask 存成 int32 的 .npy 檔，之後以記憶體映射 (mmap) 讀取，
+同一份資料在不同實驗 (原版 RoBERTa / MLM / LoRA) 之間不需要重新 tokenize。
+
+快取鍵值 = tokenizer 名稱 + max_length + padding 方式 + 文字欄位名稱 + 資料內容雜湊，
+任何一項改變都會產生新的快取目錄：
+    <cache_dir>/<key>/input_ids.npy, attention_mask.npy, lengths.npy, meta.json
+padding='none' 時不補齊，改存攤平的 token 與位移 (flat_ids.npy, offsets.npy)，供動態補齊的 batch 使用。
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ohsumed', 'tokens')
+TOKEN_CACHE_VERSION = 1
+
+def texts_sha256(texts):
+    """資料內容雜湊 (依序雜湊每段文字，並加上長度前綴避免不同切法得到相同結果)。"""
+    digest = hashlib.sha256()
+    for text in texts:
+        encoded = str(text).encode('utf-8')
+        digest.update(len(encoded).to_bytes(8, 'little'))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+def tokenizer_name(tokenizer):
+    return f"{type(tokenizer).__name__}:{tokenizer.name_or_path}:{len(tokenizer)}:{tokenizer.padding_side}"
+
+def compute_cache_key(tokenizer, max_length, text_column, data_hash, padding):
+    payload = json.dumps({
+        "version": TOKEN_CACHE_VERSION,
+        "tokenizer": tokenizer_name(tokenizer),
+        "max_length": max_length,
+        "padding": padding,
+        "text_column": text_column,
+        "data_hash": data_hash,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+class TokenizedTexts:
+    """
+    記憶體映射的 tokenize 結果。
+
+    Attributes:
+        input_ids (np.memmap): int32，形狀 (筆數, 寬度)，以 tokenizer 的 pad token 補齊 (padding='none' 時為 None)。
+        attention_mask (np.memmap): int32，形狀同 input_ids (padding='none' 時為 None)。
+        lengths (np.memmap): int32，每筆資料實際 (未補齊) 的 token 數。
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        with open(os.path.join(cache_path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.lengths = np.load(os.path.join(cache_path, 'lengths.npy'), mmap_mode='r')
+        if self.meta["padding"] == 'none':
+            self.input_ids = self.attention_mask = None
+            self.flat_ids = np.load(os.path.join(cache_path, 'flat_ids.npy'), mmap_mode='r')
+            self.offsets = np.load(os.path.join(cache_path, 'offsets.npy'), mmap_mode='r')
+        else:
+            self.input_ids = np.load(os.path.join(cache_path, 'input_ids.npy'), mmap_mode='r')
+            self.attention_mask = np.load(os.path.join(cache_path, 'attention_mask.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def sequence(self, idx):
+        """第 idx 筆未補齊的 token id (int32)。"""
+        if self.input_ids is None:
+            return self.flat_ids[self.offsets[idx]:self.offsets[idx + 1]]
+        row = self.input_ids[idx]
+        length = self.lengths[idx]
+        return row[len(row) - length:] if self.meta["padding_side"] == 'left' else row[:length]
+
+def _write_cache(tokenizer, texts, max_length, padding, cache_path, meta, batch_size):
+    # 先以不補齊的方式分批 tokenize，存成攤平的 int32 陣列與每筆長度，最後再一次寫入補齊後的矩陣
+    flat_batches = []
+    lengths = np.zeros(len(texts), dtype=np.int32)
+    for start in range(0, len(texts), batch_size):
+        batch = [str(text) for text in texts[start:start + batch_size]]
+        encoded = tokenizer(batch, truncation=True, max_length=max_length, padding=False)["input_ids"]
+        lengths[start:start + len(encoded)] = [len(ids) for ids in encoded]
+        flat_batches.append(np.fromiter((token for ids in encoded for token in ids), dtype=np.int32))
+    flat_ids = np.concatenate(flat_batches) if flat_batches else np.zeros(0, dtype=np.int32)
+    tmp_path = cache_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, 'lengths.npy'), lengths)
+    meta = {**meta, "num_rows": len(texts), "padding_side": tokenizer.padding_side}
+
+    if padding == 'none':
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        np.save(os.path.join(tmp_path, 'flat_ids.npy'), flat_ids)
+        np.save(os.path.join(tmp_path, 'offsets.npy'), offsets)
+        _finish_cache(tmp_path, cache_path, {**meta, "width": None})
+        return
+
+    # padding='max_length' 與 tokenizer(..., padding='max_length') 相同；'longest' 與 padding=True 相同 (整份資料最長的長度)
+    width = max_length if padding == 'max_length' else int(lengths.max(initial=0))
+    input_ids = np.lib.format.open_memmap(os.path.join(tmp_path, 'input_ids.npy'), mode='w+', dtype=np.int32, shape=(len(texts), width))
+    attention_mask = np.lib.format.open_memmap(os.path.join(tmp_path, 'attention_mask.npy'), mode='w+', dtype=np.int32, shape=(len(texts), width))
+    input_ids[:] = tokenizer.pad_token_id
+    attention_mask[:] = 0
+    # 依 tokenizer 的 padding_side 放置 token (RoBERTa 為右側補齊)
+    positions = np.arange(width)
+    if tokenizer.padding_side == 'left':
+        mask = positions[None, :] >= (width - lengths)[:, None]
+    else:
+        mask = positions[None, :] < lengths[:, None]
+    input_ids[mask] = flat_ids
+    attention_mask[mask] = 1
+    input_ids.flush()
+    attention_mask.flush()
+    del input_ids, attention_mask
+    _finish_cache(tmp_path, cache_path, {**meta, "width": width})
+
+def _finish_cache(tmp_path, cache_path, meta):
+    # meta.json 最後寫入，再把暫存目錄換成正式目錄
+    with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+
+def tokenize_cached(tokenizer, texts, max_length=512, text_column='text', padding='max_length',
+                    cache_dir=DEFAULT_CACHE_DIR, batch_size=10000):
+    """
+    回傳 texts 的 tokenize 結果 (TokenizedTexts)；相同設定第二次呼叫時直接讀取快取。
+
+    Args:
+        tokenizer: Hugging Face tokenizer。
+        texts (list[str]): 要 tokenize 的文字 (順序即為資料列順序)。
+        max_length (int): 截斷長度。
+        text_column (str): 文字欄位名稱 (例如 'title'、'word_i')，寫入快取鍵值。
+        padding (str): 'max_length' (補齊到 max_length)、'longest' (補齊到整份資料中最長的長度)
+            或 'none' (不補齊，搭配 length_bucketing 的動態補齊)。
+        cache_dir (str): 快取目錄；在 Colab 可以指到 Google Drive 以便跨工作階段共用。
+    """
+    if padding not in ('max_length', 'longest', 'none'):
+        raise ValueError(f"不支援的 padding: {padding} (可用: 'max_length', 'longest', 'none')")
+    texts = list(texts)
+    data_hash = texts_sha256(texts)
+    key = compute_cache_key(tokenizer, max_length, text_column, data_hash, padding)
+    cache_path = os.path.join(cache_dir, key)
+    if not os.path.exists(os.path.join(cache_path, 'meta.json')):
+        print(f"Tokenizing {len(texts)} 筆 '{text_column}' 並寫入快取 {cache_path} ...")
+        os.makedirs(cache_dir, exist_ok=True)
+        meta = {
+            "version": TOKEN_CACHE_VERSION,
+            "tokenizer": tokenizer_name(tokenizer),
+            "max_length": max_length,
+            "padding": padding,
+            "text_column": text_column,
+            "data_hash": data_hash,
+        }
+        _write_cache(tokenizer, texts, max_length, padding, cache_path, meta, batch_size)
+    else:
+        print(f"使用 tokenize 快取 {cache_path}")
+    return TokenizedTexts(cache_path)
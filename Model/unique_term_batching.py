@@ -0,0 +1,117 @@
+"""
+MeSH 語意 LoRA 訓練的「唯一術語」編碼。
+
+20 萬組配對是由有限的疾病術語重複組合而成。原本每個 step 對 word_i 與 word_j 各跑一次模型 (2B 條序列)。
+這裡改為：
+    1. TermPairIndex: 把配對資料表轉成術語詞彙表 + 配對索引 (術語只 tokenize 一次)。
+    2. UniqueTermCollator: 每個 batch 只取出不重複的術語 (U <= 2B)，每個術語只編碼一次，
+       再以 index_i / index_j 收集 (gather) 出每組配對的向量，交給 MeSHSemanticLoss。
+    3. 選用 in_batch_pairs: 同一個 batch 內所有不同術語兩兩配對，以樹狀結構的 WUP 作為目標值，
+       同樣次數的 forward 可以得到更多監督配對 (需要 tree_number_i / tree_number_j 欄位與 wup_fn)。
+"""
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import Dataset
+
+from length_bucketing import DynamicPaddingCollator
+from token_cache import tokenize_cached
+
+class TermPairIndex:
+    """
+    術語配對資料表的索引形式。
+
+    Attributes:
+        vocab (list[str]): 不重複的術語。
+        pair_i / pair_j (np.ndarray): 每組配對兩個術語在 vocab 中的位置。
+        wup (np.ndarray): 每組配對的 WUP 相似度 (float32)。
+        nodes_i / nodes_j (np.ndarray | None): 每組配對的 tree number (資料表有 tree_number_i / tree_number_j 時)。
+    """
+
+    def __init__(self, dataframe):
+        words = pd.concat([dataframe['word_i'].astype(str), dataframe['word_j'].astype(str)], ignore_index=True)
+        codes, vocab = pd.factorize(words)
+        num_pairs = len(dataframe)
+        self.vocab = list(vocab)
+        self.pair_i = codes[:num_pairs].astype(np.int64)
+        self.pair_j = codes[num_pairs:].astype(np.int64)
+        self.wup = dataframe['wup_similarity'].to_numpy(dtype=np.float32)
+        if 'tree_number_i' in dataframe.columns and 'tree_number_j' in dataframe.columns:
+            self.nodes_i = dataframe['tree_number_i'].astype(str).to_numpy()
+            self.nodes_j = dataframe['tree_number_j'].astype(str).to_numpy()
+        else:
+            self.nodes_i = self.nodes_j = None
+
+    def __len__(self):
+        return len(self.wup)
+
+class PairIndexDataset(Dataset):
+    """只回傳配對的位置；真正的資料由 UniqueTermCollator 組成。"""
+
+    def __init__(self, pair_index):
+        self.pair_index = pair_index
+
+    def __len__(self):
+        return len(self.pair_index)
+
+    def __getitem__(self, idx):
+        return idx
+
+class UniqueTermCollator:
+    """
+    把一個 batch 的配對位置轉成「不重複術語的 token」+「配對索引」。
+
+    輸出:
+        input_ids / attention_mask: 不重複術語的 token，動態補齊到最長的術語。
+        index_i / index_j: 每組配對的兩個術語在上面那批術語中的位置。
+        wup_sim: 目標 WUP。
+        num_sampled_pairs: 前 num_sampled_pairs 組是資料集本身的配對，其餘為 in-batch 配對。
+    """
+
+    def __init__(self, pair_index, tokenizer, max_length=512, in_batch_pairs=False, wup_fn=None):
+        self.pair_index = pair_index
+        self.term_tokens = tokenize_cached(tokenizer, pair_index.vocab, max_length=max_length, text_column='mesh_term', padding='none')
+        self.padder = DynamicPaddingCollator(tokenizer.pad_token_id, tokenizer.padding_side)
+        self.in_batch_pairs = in_batch_pairs
+        self.wup_fn = wup_fn
+        if in_batch_pairs and (wup_fn is None or pair_index.nodes_i is None):
+            raise ValueError("in_batch_pairs 需要 wup_fn 以及含 tree_number_i / tree_number_j 欄位的資料集")
+
+    def __call__(self, pair_ids):
+        pair_ids = np.asarray(pair_ids, dtype=np.int64)
+        index = self.pair_index
+        batch_terms = np.concatenate([index.pair_i[pair_ids], index.pair_j[pair_ids]])
+        unique_terms, inverse = np.unique(batch_terms, return_inverse=True)
+        index_i, index_j = inverse[:len(pair_ids)], inverse[len(pair_ids):]
+        targets = index.wup[pair_ids]
+
+        if self.in_batch_pairs:
+            extra_i, extra_j, extra_targets = self._in_batch_pairs(pair_ids, inverse)
+            index_i = np.concatenate([index_i, extra_i])
+            index_j = np.concatenate([index_j, extra_j])
+            targets = np.concatenate([targets, extra_targets])
+
+        batch = self.padder([{'input_ids': torch.from_numpy(self.term_tokens.sequence(t).astype(np.int64))} for t in unique_terms])
+        batch['index_i'] = torch.from_numpy(index_i.astype(np.int64))
+        batch['index_j'] = torch.from_numpy(index_j.astype(np.int64))
+        batch['wup_sim'] = torch.from_numpy(np.asarray(targets, dtype=np.float32))
+        batch['num_sampled_pairs'] = len(pair_ids)
+        return batch
+
+    def _in_batch_pairs(self, pair_ids, inverse):
+        # 每個 (術語, tree number) 出現位置視為一個 slot；不同術語的 slot 兩兩配對，目標為兩個節點的 WUP
+        nodes = np.concatenate([self.pair_index.nodes_i[pair_ids], self.pair_index.nodes_j[pair_ids]])
+        slots = pd.DataFrame({'term': inverse, 'node': nodes}).drop_duplicates().to_numpy()
+        slot_a, slot_b = np.triu_indices(len(slots), k=1)
+        different = slots[slot_a, 0] != slots[slot_b, 0]
+        slot_a, slot_b = slot_a[different], slot_b[different]
+        targets = self.wup_fn(slots[slot_a, 1].tolist(), slots[slot_b, 1].tolist())
+        return slots[slot_a, 0].astype(np.int64), slots[slot_b, 0].astype(np.int64), np.asarray(targets, dtype=np.float32)
+
+def encode_pairs(model, batch, device):
+    """每個不重複術語只跑一次 forward，回傳 (emb_i, emb_j) 供 MeSHSemanticLoss 使用。"""
+    term_embeddings = model(input_ids=batch['input_ids'].to(device),
+                            attention_mask=batch['attention_mask'].to(device)).last_hidden_state[:, 0, :]
+    index_i = batch['index_i'].to(device)
+    index_j = batch['index_j'].to(device)
+    return term_embeddings[index_i], term_embeddings[index_j]
@@ -0,0 +1,116 @@
+"""
+效能測試用的合成資料 (不需要網路，也不需要真正的 MeSH / OHSUMED 檔案)。
+
+    - write_mesh_nt: 產生與 MeSH RDF 相同格式的 N-Triples 檔案
+      (Descriptor 的 vocab#treeNumber 與 rdfs:label，加上 Concept / 型別等不相關的三元組，以及 'C' 以外分類的 Descriptor)
+    - write_ohsumed_tree: 產生 classification_data/create_dataset.py 所需的 OHSUMED 資料夾結構
+      (C01 ~ C23 子資料夾，每個檔案第一行為標題，其餘為摘要)
+
+相同的參數與 seed 會產生完全相同的檔案。
+"""
+import gzip
+import os
+import random
+
+MESH_PREFIX = "http://id.nlm.nih.gov/mesh/2026/"
+TREE_NUMBER_PREDICATE = "<http://id.nlm.nih.gov/mesh/vocab#treeNumber>"
+CONCEPT_PREDICATE = "<http://id.nlm.nih.gov/mesh/vocab#preferredConcept>"
+LABEL_PREDICATE = "<http://www.w3.org/2000/01/rdf-schema#label>"
+TYPE_PREDICATE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+DESCRIPTOR_TYPE = "<http://id.nlm.nih.gov/mesh/vocab#TopicalDescriptor>"
+
+CATEGORIES = [f"C{i:02d}" for i in range(1, 24)]
+
+WORDS = [
+    "acute", "chronic", "cardiac", "renal", "hepatic", "pulmonary", "neoplasms", "infections", "syndrome",
+    "disease", "disorders", "failure", "insufficiency", "inflammation", "carcinoma", "lymphoma", "virus",
+    "bacterial", "congenital", "hereditary", "vascular", "cerebral", "spinal", "muscular", "skin", "bone",
+    "joint", "eye", "ear", "nose", "throat", "stomach", "intestinal", "colon", "pancreatic", "thyroid",
+    "adrenal", "pituitary", "ovarian", "prostatic", "breast", "lung", "heart", "kidney", "liver", "blood",
+    "anemia", "hypertension", "diabetes", "obesity", "fever", "pain", "edema", "fibrosis", "sclerosis",
+    "atrophy", "hyperplasia", "stenosis", "thrombosis", "embolism", "hemorrhage", "ulcer", "abscess",
+]
+
+def _label(rng):
+    words = rng.sample(WORDS, rng.randint(1, 3))
+    if len(words) > 1 and rng.random() < 0.3:
+        # MeSH 的倒裝標籤，例如 "Hearing Loss, Sudden"
+        return f"{' '.join(words[:-1]).title()}, {words[-1].title()}"
+    return " ".join(words).title()
+
+def generate_tree_numbers(num_tree_numbers, max_depth=7, seed=0):
+    """產生 'C' 分類的 tree number (C01 ~ C23 與其下的隨機子樹)，父節點必定先於子節點出現。"""
+    rng = random.Random(seed)
+    tree_numbers = list(CATEGORIES)
+    child_counts = {}
+    while len(tree_numbers) < num_tree_numbers:
+        parent = rng.choice(tree_numbers)
+        if parent.count('.') + 1 >= max_depth:
+            continue
+        child_counts[parent] = child_counts.get(parent, 0) + 1
+        tree_numbers.append(f"{parent}.{child_counts[parent]:03d}")
+    return tree_numbers
+
+def write_mesh_nt(nt_file, num_tree_numbers=5000, other_descriptors=2000, seed=0):
+    """
+    寫出合成的 MeSH N-Triples 檔案 (副檔名為 .gz 時以 gzip 壓縮)。
+
+    約 15% 的 Descriptor 擁有兩個 'C' tree number；另外 other_descriptors 個 Descriptor 只有 'A' 分類的 tree number。
+
+    Returns:
+        dict: 產生的 tree number 數、Descriptor 數與三元組數。
+    """
+    rng = random.Random(seed)
+    tree_numbers = generate_tree_numbers(num_tree_numbers, seed=seed)
+    descriptors = []
+    for tn in tree_numbers:
+        if descriptors and rng.random() < 0.15:
+            rng.choice(descriptors)[1].append(tn)
+        else:
+            descriptors.append([f"D{len(descriptors) + 1:06d}", [tn]])
+    for i in range(other_descriptors):
+        descriptors.append([f"D{len(descriptors) + 1:06d}", [f"A{i % 20 + 1:02d}.{i:03d}"]])
+    rng.shuffle(descriptors)
+
+    num_triples = 0
+    os.makedirs(os.path.dirname(os.path.abspath(nt_file)), exist_ok=True)
+    opener = gzip.open if nt_file.endswith(".gz") else open
+    with opener(nt_file, 'wt', encoding='utf-8') as f:
+        for descriptor_id, descriptor_tree_numbers in descriptors:
+            subject = f"<{MESH_PREFIX}{descriptor_id}>"
+            concept = f"<{MESH_PREFIX}M{descriptor_id[1:]}>"
+            lines = [f"{subject} {TYPE_PREDICATE} {DESCRIPTOR_TYPE} ."]
+            lines += [f"{subject} {TREE_NUMBER_PREDICATE} <{MESH_PREFIX}{tn}> ." for tn in descriptor_tree_numbers]
+            lines.append(f'{subject} {LABEL_PREDICATE} "{_label(rng)}"@en .')
+            lines.append(f"{subject} {CONCEPT_PREDICATE} {concept} .")
+            # Concept 也有 rdfs:label，但不是 Descriptor，應被忽略
+            lines.append(f'{concept} {LABEL_PREDICATE} "{_label(rng)}"@en .')
+            lines += [f'<{MESH_PREFIX}{tn}> {LABEL_PREDICATE} "{tn}" .' for tn in descriptor_tree_numbers]
+            f.write("\n".join(lines) + "\n")
+            num_triples += len(lines)
+    return {"tree_numbers": len(tree_numbers), "descriptors": len(descriptors), "triples": num_triples}
+
+def write_ohsumed_tree(root_dir, docs_per_category=200, seed=0):
+    """
+    寫出合成的 OHSUMED 資料夾 (root_dir/C01/0000001, ...)；約 2% 的檔案沒有摘要 (create_dataset 會略過)。
+
+    Returns:
+        dict: 產生的檔案數與總位元組數。
+    """
+    rng = random.Random(seed)
+    num_files = 0
+    num_bytes = 0
+    for c, category in enumerate(CATEGORIES):
+        category_dir = os.path.join(root_dir, category)
+        os.makedirs(category_dir, exist_ok=True)
+        for i in range(docs_per_category):
+            title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 15))).capitalize() + "."
+            sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 25))).capitalize() + "."
+                         for _ in range(rng.randint(3, 12))] if rng.random() >= 0.02 else []
+            # 摘要與原始資料一樣斷成多行
+            content = title + "\n" + "\n".join(" ".join(sentences[k:k + 2]) for k in range(0, len(sentences), 2)) + "\n"
+            with open(os.path.join(category_dir, f"{c * docs_per_category + i + 1:07d}"), 'w', encoding='latin-1') as f:
+                f.write(content)
+            num_files += 1
+            num_bytes += len(content)
+    return {"files": num_files, "bytes": num_bytes}
@@ -0,0 +1,463 @@
+"""
+資料與訓練流程熱點的離線效能測試。
+
+以 fixtures.py 產生的合成資料 (N-Triples 檔案與 OHSUMED 資料夾) 量測：
+    - MeSH_data/create_dataset.py: parse_mesh_rdf、extract_data_from_graph、extract_data_from_nt_stream、build_disease_tree、
+      逐對的 wup_similarity 與 MeshTree.wup_similarity_batch、main() 中的配對取樣 (原始迴圈與 PairSampler)
+    - classification_data/create_dataset.py: create_dataset
+    - 小型 RoBERTa 設定在 CPU 上的 forward 與 forward / backward / optimizer step
+
+每個項目在獨立的子行程中執行 (互不影響記憶體量測)：
+    - 先執行未計時的準備步驟，再計時 repeat 次 (記錄最短與中位數秒數)
+    - 另外以 tracemalloc 多執行一次，記錄 Python (含 NumPy) 配置的峰值記憶體
+    - peak_rss_mb 為子行程的最大常駐記憶體 (包含 import 與準備步驟)
+結果存成 JSON，並與儲存的基準 (baseline.json) 比較；最短秒數超過基準最慢一次的容許比例，
+或記憶體超過容許比例與最小差距即列為退步，疑似退步的項目會再執行一次確認。
+
+使用方式：
+    python run_benchmarks.py                                   # 執行並與 baseline.json 比較
+    python run_benchmarks.py --size quick --only mesh.wup_similarity_batch
+    python run_benchmarks.py --save-baseline                   # 以本次結果更新 baseline.json
+    python run_benchmarks.py --fail-on-regression              # 有退步或執行失敗時回傳非 0 的結束碼 (CI 用)
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'MeSH_data'))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import fixtures
+
+DEFAULT_BASELINE_FILE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# 資料規模；baseline.json 以 default 產生，只有相同規模的結果才能互相比較
+SIZES = {
+    'default': {
+        'mesh_tree_numbers': 5000, 'mesh_other_descriptors': 2000, 'wup_pairs': 100000, 'sample_pairs': 20000,
+        'ohsumed_docs_per_category': 200,
+        'model_batch_size': 16, 'model_seq_len': 128, 'model_steps': 5,
+    },
+    'quick': {
+        'mesh_tree_numbers': 1000, 'mesh_other_descriptors': 400, 'wup_pairs': 20000, 'sample_pairs': 4000,
+        'ohsumed_docs_per_category': 40,
+        'model_batch_size': 8, 'model_seq_len': 64, 'model_steps': 2,
+    },
+}
+
+# 小型 RoBERTa 設定 (結構與 roberta-base 相同，只是層數與寬度較小)
+SMALL_ROBERTA_CONFIG = {
+    'vocab_size': 8000, 'hidden_size': 256, 'num_hidden_layers': 4, 'num_attention_heads': 4,
+    'intermediate_size': 1024, 'max_position_embeddings': 514, 'type_vocab_size': 1,
+    'pad_token_id': 1, 'bos_token_id': 0, 'eos_token_id': 2,
+}
+NUM_LABELS = 23
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """
+    註冊一個效能測試項目。
+
+    被裝飾的函式接收 (fixture_paths, size)，執行未計時的準備步驟後回傳 (run, num_items)：
+    run 為要計時的無參數函式，num_items 用來換算每秒處理量。
+    """
+    def register(setup_fn):
+        BENCHMARKS[name] = setup_fn
+        return setup_fn
+    return register
+
+# --- MeSH_data ---
+
+def _mesh_maps(nt_file):
+    import create_dataset as mesh_create_dataset
+    g = mesh_create_dataset.parse_mesh_rdf(nt_file)
+    return g, mesh_create_dataset.extract_data_from_graph(g)
+
+def _mesh_tree(nt_file):
+    import create_dataset as mesh_create_dataset
+    g, maps = _mesh_maps(nt_file)
+    _, nodes = mesh_create_dataset.build_disease_tree(*maps, g)
+    return nodes
+
+def _wup_pairs(nodes, num_pairs):
+    from mesh_tree import MeshTree
+    tree = MeshTree.from_nodes(nodes)
+    rng = np.random.default_rng(0)
+    ids_a = rng.integers(0, len(tree), num_pairs)
+    ids_b = rng.integers(0, len(tree), num_pairs)
+    return tree, ids_a, ids_b
+
+@benchmark('mesh.parse_mesh_rdf')
+def bench_parse_mesh_rdf(paths, size):
+    import create_dataset as mesh_create_dataset
+    return lambda: mesh_create_dataset.parse_mesh_rdf(paths['nt_file']), paths['nt_triples']
+
+@benchmark('mesh.extract_data_from_graph')
+def bench_extract_data_from_graph(paths, size):
+    import create_dataset as mesh_create_dataset
+    g = mesh_create_dataset.parse_mesh_rdf(paths['nt_file'])
+    return lambda: mesh_create_dataset.extract_data_from_graph(g), paths['nt_triples']
+
+@benchmark('mesh.extract_data_from_nt_stream')
+def bench_extract_data_from_nt_stream(paths, size):
+    import create_dataset as mesh_create_dataset
+    return lambda: mesh_create_dataset.extract_data_from_nt_stream(paths['nt_file']), paths['nt_triples']
+
+@benchmark('mesh.build_disease_tree')
+def bench_build_disease_tree(paths, size):
+    import create_dataset as mesh_create_dataset
+    g, maps = _mesh_maps(paths['nt_file'])
+    return lambda: mesh_create_dataset.build_disease_tree(*maps, g), len(maps[0])
+
+@benchmark('mesh.wup_similarity_scalar')
+def bench_wup_similarity_scalar(paths, size):
+    import create_dataset as mesh_create_dataset
+    tree, ids_a, ids_b = _wup_pairs(_mesh_tree(paths['nt_file']), size['wup_pairs'])
+    pairs = [(tree.tree_numbers[a], tree.tree_numbers[b]) for a, b in zip(ids_a, ids_b)]
+    return lambda: [mesh_create_dataset.wup_similarity(a, b) for a, b in pairs], len(pairs)
+
+@benchmark('mesh.wup_similarity_batch')
+def bench_wup_similarity_batch(paths, size):
+    tree, ids_a, ids_b = _wup_pairs(_mesh_tree(paths['nt_file']), size['wup_pairs'])
+    return lambda: tree.wup_similarity_batch(ids_a, ids_b), len(ids_a)
+
+@benchmark('mesh.sample_pairs_loop')
+def bench_sample_pairs_loop(paths, size):
+    import create_dataset as mesh_create_dataset
+    nodes = _mesh_tree(paths['nt_file'])
+    # 與 main() 相同：只取有術語的節點，並固定亂數種子
+    valid_sampling_nodes = [node for node in nodes.values() if node.terms and len(node.terms) > 0]
+    def run():
+        random.seed(42)
+        return mesh_create_dataset.sample_pairs_with_loop(valid_sampling_nodes, size['sample_pairs'])
+    return run, size['sample_pairs']
+
+@benchmark('mesh.sample_pairs_vectorized')
+def bench_sample_pairs_vectorized(paths, size):
+    import create_dataset as mesh_create_dataset
+    from mesh_tree import MeshTree
+    tree = MeshTree.from_nodes(_mesh_tree(paths['nt_file']))
+    return lambda: mesh_create_dataset.sample_pairs_vectorized(tree, size['sample_pairs'], seed=42), size['sample_pairs']
+
+# --- classification_data ---
+
+@benchmark('classification.create_dataset')
+def bench_create_dataset(paths, size):
+    import importlib.util
+    # MeSH_data 也有 create_dataset.py，以檔案路徑載入避免模組名稱衝突
+    spec = importlib.util.spec_from_file_location('ohsumed_create_dataset', os.path.join(REPO_DIR, 'classification_data', 'create_dataset.py'))
+    ohsumed_create_dataset = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(ohsumed_create_dataset)
+    output_file = os.path.join(paths['work_dir'], 'ohsumed_dataset.csv')
+    return lambda: ohsumed_create_dataset.create_dataset(paths['ohsumed_dir'], output_file), paths['ohsumed_files']
+
+# --- Model ---
+
+def _small_roberta(size):
+    import torch
+    from transformers import RobertaConfig, RobertaModel
+    torch.manual_seed(0)
+    backbone = RobertaModel(RobertaConfig(**SMALL_ROBERTA_CONFIG), add_pooling_layer=False)
+    classifier = torch.nn.Linear(SMALL_ROBERTA_CONFIG['hidden_size'], NUM_LABELS)
+    generator = torch.Generator().manual_seed(0)
+    shape = (size['model_batch_size'], size['model_seq_len'])
+    input_ids = torch.randint(3, SMALL_ROBERTA_CONFIG['vocab_size'], shape, generator=generator)
+    attention_mask = torch.ones(shape, dtype=torch.long)
+    labels = torch.randint(0, NUM_LABELS, (shape[0],), generator=generator)
+    return backbone, classifier, input_ids, attention_mask, labels
+
+@benchmark('model.roberta_forward')
+def bench_roberta_forward(paths, size):
+    import torch
+    backbone, classifier, input_ids, attention_mask, _ = _small_roberta(size)
+    backbone.eval()
+    def run():
+        with torch.no_grad():
+            for _ in range(size['model_steps']):
+                classifier(backbone(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state[:, 0, :])
+    run()  # 暖機 (第一次呼叫的 kernel 選擇與記憶體配置)
+    return run, size['model_steps'] * input_ids.numel()
+
+@benchmark('model.roberta_train_step')
+def bench_roberta_train_step(paths, size):
+    import torch
+    backbone, classifier, input_ids, attention_mask, labels = _small_roberta(size)
+    backbone.train()
+    optimizer = torch.optim.AdamW(list(backbone.parameters()) + list(classifier.parameters()), lr=1e-5)
+    loss_fn = torch.nn.CrossEntropyLoss()
+    def run():
+        for _ in range(size['model_steps']):
+            optimizer.zero_grad()
+            logits = classifier(backbone(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state[:, 0, :])
+            loss_fn(logits, labels).backward()
+            optimizer.step()
+    run()
+    return run, size['model_steps'] * input_ids.numel()
+
+# --- 執行與量測 ---
+
+def prepare_fixtures(fixtures_dir, size):
+    """在 fixtures_dir 產生合成資料，回傳各檔案路徑與規模。"""
+    nt_file = os.path.join(fixtures_dir, 'mesh_synthetic.nt.gz')
+    nt_info = fixtures.write_mesh_nt(nt_file, size['mesh_tree_numbers'], size['mesh_other_descriptors'])
+    ohsumed_dir = os.path.join(fixtures_dir, 'ohsumed-all')
+    ohsumed_info = fixtures.write_ohsumed_tree(ohsumed_dir, size['ohsumed_docs_per_category'])
+    work_dir = os.path.join(fixtures_dir, 'work')
+    os.makedirs(work_dir, exist_ok=True)
+    return {
+        'nt_file': nt_file, 'nt_triples': nt_info['triples'], 'nt_tree_numbers': nt_info['tree_numbers'],
+        'ohsumed_dir': ohsumed_dir, 'ohsumed_files': ohsumed_info['files'], 'work_dir': work_dir,
+    }
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 回報，macOS 以 bytes 回報
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def measure(name, paths, size, repeat):
+    """執行單一項目並回傳量測結果；任何例外 (例如缺少 rdflib / transformers) 都記錄在 'error' 欄位。"""
+    try:
+        # 被測函式會印出大量進度訊息，量測時不輸出
+        with contextlib.redirect_stdout(io.StringIO()):
+            run, num_items = BENCHMARKS[name](paths, size)
+            times = []
+            for _ in range(repeat):
+                start_time = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start_time)
+            tracemalloc.start()
+            run()
+            _, python_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+    return {
+        'seconds_min': min(times),
+        'seconds_median': statistics.median(times),
+        'runs': times,
+        'items': num_items,
+        'items_per_sec': num_items / min(times) if min(times) > 0 else None,
+        'python_peak_mb': python_peak / (1 << 20),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def run_benchmarks(names, paths, size, repeat=3, isolate=True):
+    results = {}
+    for name in names:
+        print(f"  {name} ...", end=' ', flush=True)
+        if isolate:
+            # spawn 出全新的子行程，peak_rss_mb 與 tracemalloc 不受前一個項目影響
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(measure, name, paths, size, repeat).result()
+        else:
+            result = measure(name, paths, size, repeat)
+        results[name] = result
+        print(result['error'] if 'error' in result else f"{result['seconds_min']:.3f} 秒")
+    return results
+
+def machine_info():
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+    }
+    for module in ('torch', 'transformers', 'rdflib'):
+        try:
+            info[module] = __import__(module).__version__
+        except ImportError:
+            info[module] = None
+    return info
+
+def compare(results, baseline, time_tolerance=0.25, memory_tolerance=0.25, min_seconds=0.005, min_memory_mb=2.0):
+    """
+    與基準比較每個項目的最短秒數與峰值記憶體。
+
+    門檻以基準本身的量測範圍為準：本次最短秒數超過基準「最慢的一次」的 (1 + time_tolerance) 倍，
+    且相差超過 min_seconds 秒才列為時間退步 (基準的 runs 越分散，門檻越寬)。
+    記憶體多於基準 (1 + memory_tolerance) 倍且多出 min_memory_mb MB 以上才列為記憶體退步。
+
+    Returns:
+        list[dict]: 每個項目的 name、status ('ok' / 'regression' / 'improved' / 'new' / 'error')、time_ratio、memory_ratio、reasons。
+    """
+    rows = []
+    for name, current in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        row = {'name': name, 'time_ratio': None, 'memory_ratio': None, 'reasons': []}
+        if 'error' in current:
+            row['status'] = 'error'
+            row['reasons'].append(current['error'])
+        elif base is None or 'error' in base:
+            row['status'] = 'new'
+        else:
+            row['time_ratio'] = current['seconds_min'] / base['seconds_min']
+            base_max = max(base.get('runs') or [base['seconds_min']])
+            if current['seconds_min'] > base_max * (1 + time_tolerance) and current['seconds_min'] - base_max > min_seconds:
+                row['reasons'].append(f"時間 {base['seconds_min']:.3f} ~ {base_max:.3f} -> {current['seconds_min']:.3f} 秒")
+            for key in ('python_peak_mb', 'peak_rss_mb'):
+                if current.get(key) and base.get(key):
+                    ratio = current[key] / base[key]
+                    if key == 'python_peak_mb':
+                        row['memory_ratio'] = ratio
+                    if ratio > 1 + memory_tolerance and current[key] - base[key] > min_memory_mb:
+                        row['reasons'].append(f"{key} {base[key]:.1f} -> {current[key]:.1f} MB")
+            if row['reasons']:
+                row['status'] = 'regression'
+            elif current['seconds_min'] * (1 + time_tolerance) < base['seconds_min']:
+                row['status'] = 'improved'
+            else:
+                row['status'] = 'ok'
+        rows.append(row)
+    return rows
+
+def merge_runs(first, second):
+    """合併同一個項目兩次執行的量測 (取所有 runs 的最短與中位數，記憶體取較小值)。"""
+    if 'error' in first or 'error' in second:
+        return second
+    runs = first['runs'] + second['runs']
+    merged = dict(second, runs=runs, seconds_min=min(runs), seconds_median=statistics.median(runs))
+    merged['items_per_sec'] = merged['items'] / merged['seconds_min'] if merged['seconds_min'] > 0 else None
+    for key in ('python_peak_mb', 'peak_rss_mb'):
+        if first.get(key) is not None and second.get(key) is not None:
+            merged[key] = min(first[key], second[key])
+    return merged
+
+def format_results(results):
+    lines = [f"{'benchmark':<34} {'min 秒':>9} {'中位數 秒':>9} {'items/s':>12} {'py peak MB':>10} {'RSS MB':>8}"]
+    for name, r in results['benchmarks'].items():
+        if 'error' in r:
+            lines.append(f"{name:<34} 失敗: {r['error']}")
+            continue
+        rss = f"{r['peak_rss_mb']:>8.0f}" if r['peak_rss_mb'] is not None else f"{'-':>8}"
+        lines.append(f"{name:<34} {r['seconds_min']:>9.3f} {r['seconds_median']:>9.3f} {r['items_per_sec'] or 0:>12,.0f} {r['python_peak_mb']:>10.1f} {rss}")
+    return "\n".join(lines)
+
+def format_comparison(rows):
+    lines = [f"{'benchmark':<34} {'狀態':>10} {'時間比':>8} {'記憶體比':>8}  說明"]
+    for row in rows:
+        time_ratio = f"{row['time_ratio']:.2f}x" if row['time_ratio'] is not None else '-'
+        memory_ratio = f"{row['memory_ratio']:.2f}x" if row['memory_ratio'] is not None else '-'
+        lines.append(f"{row['name']:<34} {row['status']:>10} {time_ratio:>8} {memory_ratio:>8}  {'; '.join(row['reasons'])}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="資料與訓練流程熱點的離線效能測試 (合成資料)")
+    parser.add_argument("--size", choices=sorted(SIZES), default='default', help="合成資料規模")
+    parser.add_argument("--only", nargs='+', choices=sorted(BENCHMARKS), help="只執行指定的項目")
+    parser.add_argument("--repeat", type=int, default=7, help="每個項目計時的次數")
+    parser.add_argument("--output", default='benchmark_results.json', help="結果 JSON 檔案")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE, help="比較用的基準 JSON 檔案")
+    parser.add_argument("--save-baseline", action="store_true", help="以本次結果覆寫基準檔案")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="允許比基準慢的比例")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="允許比基準多用的記憶體比例")
+    parser.add_argument("--min-memory-mb", type=float, default=2.0, help="記憶體至少要多出幾 MB 才列為退步 (排除配置器的微小差異)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有退步或執行失敗的項目時以結束碼 1 結束")
+    parser.add_argument("--fixtures-dir", default=None, help="合成資料的存放位置 (預設為暫存資料夾，結束後刪除)")
+    parser.add_argument("--no-isolate", action="store_true", help="所有項目在同一個行程中執行 (記憶體量測會互相影響)")
+    args = parser.parse_args()
+
+    size = SIZES[args.size]
+    baseline = None
+    if not args.save_baseline:
+        if not os.path.exists(args.baseline):
+            print(f"找不到基準 {args.baseline}，只輸出結果 (以 --save-baseline 建立)。")
+        else:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            if baseline.get('size') != args.size:
+                print(f"基準的資料規模為 '{baseline.get('size')}'，與本次 '{args.size}' 不同，不進行比較。")
+                baseline = None
+
+    fixtures_dir = args.fixtures_dir or tempfile.mkdtemp(prefix='ohsumed_bench_')
+    try:
+        print(f"--- 產生合成資料: {fixtures_dir} ---")
+        paths = prepare_fixtures(fixtures_dir, size)
+        print(f"  N-Triples: {paths['nt_triples']:,} 個三元組 ({paths['nt_tree_numbers']:,} 個 'C' tree number)")
+        print(f"  OHSUMED: {paths['ohsumed_files']:,} 個檔案")
+        print(f"--- 執行效能測試 (size={args.size}, repeat={args.repeat}) ---")
+        names = args.only or list(BENCHMARKS)
+        benchmarks = run_benchmarks(names, paths, size, args.repeat, not args.no_isolate)
+        results = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'size': args.size,
+            'config': size,
+            'repeat': args.repeat,
+            'machine': machine_info(),
+            'benchmarks': benchmarks,
+        }
+        rows = None
+        if baseline is not None:
+            rows = compare(results, baseline, args.time_tolerance, args.memory_tolerance, min_memory_mb=args.min_memory_mb)
+            suspects = [row['name'] for row in rows if row['status'] == 'regression']
+            if suspects:
+                # 疑似退步的項目再執行一次並合併量測，排除一次性的雜訊 (例如其他行程搶用 CPU)
+                print(f"--- 重新執行疑似退步的項目: {', '.join(suspects)} ---")
+                rerun = run_benchmarks(suspects, paths, size, args.repeat, not args.no_isolate)
+                for name in suspects:
+                    benchmarks[name] = merge_runs(benchmarks[name], rerun[name])
+                rows = compare(results, baseline, args.time_tolerance, args.memory_tolerance, min_memory_mb=args.min_memory_mb)
+    finally:
+        if args.fixtures_dir is None:
+            shutil.rmtree(fixtures_dir, ignore_errors=True)
+
+    print()
+    print(format_results(results))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n結果已寫入 {args.output}")
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # 只執行部分項目時保留其他項目的基準
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+            if previous.get('size') == args.size:
+                results['benchmarks'] = {**previous['benchmarks'], **benchmarks}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"已更新基準 {args.baseline}")
+        return
+
+    if rows is None:
+        return
+    if baseline.get('machine', {}).get('processor') != results['machine']['processor'] or baseline.get('machine', {}).get('cpu_count') != results['machine']['cpu_count']:
+        print("注意: 基準是在不同的機器上產生的，時間比較僅供參考 (可在本機以 --save-baseline 重新建立)。")
+    print(f"\n--- 與基準比較 ({baseline.get('created')}) ---")
+    print(format_comparison(rows))
+    # 執行失敗 (例如熱點函式開始丟出例外) 與退步同樣視為失敗
+    failures = [row['name'] for row in rows if row['status'] in ('regression', 'error')]
+    if failures:
+        print(f"\n發現 {len(failures)} 個退步或失敗的項目: {', '.join(failures)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print("\n沒有發現退步。")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
 
 import os
+import io
 import csv
 import sys
+import json
+import stat
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+FIELDNAMES = ['title', 'abstract', 'label']
+MANIFEST_VERSION = 1
 
 def create_dataset(root_dir, output_file):
     """
@@ -14,25 +24,12 @@ def create_dataset(root_dir, output_file):
         root_dir (str): The path to the root directory containing category subdirectories.
         output_file (str): The name of the CSV file to be created.
     """
-    # Check if the root directory exists
-    if not os.path.isdir(root_dir):
-        print(f"Error: Root directory '{root_dir}' not found.")
-        sys.exit(1)
+    # Get sorted list of directories to ensure consistent order (exits if the root directory is missing)
+    category_dirs = list_category_dirs(root_dir)
 
     data_records = []
     print("Starting dataset creation...")
 
-    # Get sorted list of directories to ensure consistent order
-    try:
-        category_dirs = sorted([d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d)) and d.startswith('C')])
-    except OSError as e:
-        print(f"Error accessing directory {root_dir}: {e}")
-        sys.exit(1)
-
-    if not category_dirs:
-        print(f"No category directories (like C01, C02, ...) found in '{root_dir}'.")
-        sys.exit(1)
-
     # Iterate through each category directory
     for category in category_dirs:
         label = category
@@ -81,9 +78,7 @@ def create_dataset(root_dir, output_file):
     print(f"\nWriting {len(data_records)} records to {output_file}...")
     try:
         with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-            # Define column headers
-            fieldnames = ['title', 'abstract', 'label']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
 
             # Write header
             writer.writeheader()
@@ -97,11 +92,344 @@ def create_dataset(root_dir, output_file):
         print(f"Error writing to file {output_file}. Error: {e}")
 
 
+def list_category_dirs(root_dir):
+    """Returns the sorted category subdirectories (C01, C02, ...) of root_dir, exiting on error."""
+    if not os.path.isdir(root_dir):
+        print(f"Error: Root directory '{root_dir}' not found.")
+        sys.exit(1)
+    try:
+        category_dirs = sorted([d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d)) and d.startswith('C')])
+    except OSError as e:
+        print(f"Error accessing directory {root_dir}: {e}")
+        sys.exit(1)
+    if not category_dirs:
+        print(f"No category directories (like C01, C02, ...) found in '{root_dir}'.")
+        sys.exit(1)
+    return category_dirs
+
+
+def iter_sample_files(root_dir, category_dirs):
+    """Yields (label, file_path) for every file, sorted by category and then by filename."""
+    for category in category_dirs:
+        category_path = os.path.join(root_dir, category)
+        try:
+            filenames = sorted(os.listdir(category_path))
+        except OSError as e:
+            print(f"  - Warning: Could not access files in {category_path}. Error: {e}")
+            continue
+        print(f"Queueing directory: {category_path} as label '{category}' ({len(filenames)} files)")
+        for filename in filenames:
+            yield category, os.path.join(category_path, filename)
+
+
+def read_sample_file(task):
+    """
+    Reads one sample file and returns its record, or None if it should be skipped.
+
+    The first line is the title and the rest of the content is the abstract, exactly
+    as in create_dataset().
+
+    Args:
+        task (tuple): (label, file_path)
+    """
+    label, file_path = task
+    if not os.path.isfile(file_path):
+        return None
+    try:
+        with open(file_path, 'r', encoding='latin-1') as f:
+            title = f.readline().strip()
+            abstract = f.read().strip()
+    except (IOError, UnicodeDecodeError) as e:
+        print(f"  - Warning: Could not read or decode file {file_path}. Error: {e}")
+        return None
+    if title and abstract:
+        return {'title': title, 'abstract': abstract, 'label': label}
+    return None
+
+
+def ordered_parallel_map(executor, fn, tasks, max_in_flight):
+    """
+    Like executor.map, but keeps at most max_in_flight tasks submitted at a time so memory
+    stays bounded for very large inputs. Results are yielded in input order.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(fn, task))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def create_dataset_streaming(root_dir, output_file, workers=8, use_processes=False, max_in_flight=None):
+    """
+    Parallel, streaming version of create_dataset().
+
+    Files are read by a thread (or process) pool and rows are written to the CSV as soon
+    as they are ready, so memory stays bounded regardless of corpus size. Rows are always
+    ordered by category and then by filename, so repeated runs produce byte-identical output.
+
+    Args:
+        root_dir (str): The path to the root directory containing category subdirectories.
+        output_file (str): The name of the CSV file to be created.
+        workers (int): Number of worker threads/processes.
+        use_processes (bool): Use a process pool instead of a thread pool.
+        max_in_flight (int): Maximum number of files queued or being read at once.
+    """
+    category_dirs = list_category_dirs(root_dir)
+    if max_in_flight is None:
+        max_in_flight = workers * 64
+    print(f"Starting streaming dataset creation with {workers} {'processes' if use_processes else 'threads'}...")
+
+    tmp_file = output_file + '.tmp'
+    records_written = 0
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    try:
+        with open(tmp_file, 'w', newline='', encoding='utf-8') as csvfile, executor_cls(max_workers=workers) as executor:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            tasks = iter_sample_files(root_dir, category_dirs)
+            for record in ordered_parallel_map(executor, read_sample_file, tasks, max_in_flight):
+                if record is None:
+                    continue
+                writer.writerow(record)
+                records_written += 1
+                if records_written % 10000 == 0:
+                    print(f"  ...written {records_written} records")
+    except IOError as e:
+        print(f"Error writing to file {output_file}. Error: {e}")
+        return
+
+    if not records_written:
+        os.remove(tmp_file)
+        print("No data was collected. The output file will not be created.")
+        return
+    os.replace(tmp_file, output_file)
+    print(f"Successfully created dataset: {output_file} ({records_written} records)")
+
+
+def default_manifest_file(output_file):
+    return output_file + '.manifest.json'
+
+
+def read_and_hash_sample_file(task):
+    """
+    Returns (record or None, sha256 of the file) for one (label, file_path) task.
+
+    The file is read once, so the record and the hash always describe the same content.
+    Returns (None, None) if the file cannot be read; the caller leaves it out of the manifest
+    so that the next run tries it again.
+    """
+    label, file_path = task
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        print(f"  - Warning: Could not read file {file_path}. Error: {e}")
+        return None, None
+    # Same newline handling and decoding as read_sample_file()
+    with io.TextIOWrapper(io.BytesIO(data), encoding='latin-1') as f:
+        title = f.readline().strip()
+        abstract = f.read().strip()
+    record = {'title': title, 'abstract': abstract, 'label': label} if title and abstract else None
+    return record, hashlib.sha256(data).hexdigest()
+
+
+def load_manifest(manifest_file, output_file):
+    """
+    Loads the manifest written by create_dataset_incremental().
+
+    Returns None (meaning a full rebuild is needed) if the manifest is missing, has another
+    version, or no longer describes the current output file.
+    """
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        output_size = os.path.getsize(output_file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('output_size') != output_size:
+        return None
+    return manifest
+
+
+def manifest_sort_key(key):
+    # Keys are '<label>/<filename>'; this matches the (category, filename) order of the output rows
+    label, _, filename = key.partition('/')
+    return label, filename
+
+
+def create_dataset_incremental(root_dir, output_file, workers=8, use_processes=False, manifest_file=None, max_in_flight=None, force_full=False):
+    """
+    Incrementally rebuilds the dataset using a manifest of every source file.
+
+    The manifest (<output>.manifest.json by default) records the size, mtime, SHA-256 and
+    whether each file produced a row. On the next run, files whose size and mtime are unchanged
+    are not opened: their rows are copied from the existing output. Only new and changed files
+    are read (in parallel), and rows of deleted files are dropped. Rows are kept in the same
+    (category, filename) order as create_dataset_streaming(), so the result is byte-identical
+    to a full streaming build.
+
+    Args:
+        root_dir (str): The path to the root directory containing category subdirectories.
+        output_file (str): The name of the CSV file to be created or patched.
+        workers (int): Number of worker threads/processes used for changed files.
+        use_processes (bool): Use a process pool instead of a thread pool.
+        manifest_file (str): Path of the manifest file.
+        max_in_flight (int): Maximum number of files queued or being read at once.
+        force_full (bool): Ignore any existing manifest and reprocess every file.
+    """
+    category_dirs = list_category_dirs(root_dir)
+    manifest_file = manifest_file or default_manifest_file(output_file)
+    if max_in_flight is None:
+        max_in_flight = workers * 64
+
+    old_manifest = None if force_full else load_manifest(manifest_file, output_file)
+    if old_manifest is None:
+        print(f"No valid manifest found at {manifest_file}. Performing a full build...")
+    old_files = old_manifest['files'] if old_manifest else {}
+
+    current_files = {}
+    for label, file_path in iter_sample_files(root_dir, category_dirs):
+        try:
+            file_stat = os.stat(file_path)
+        except OSError as e:
+            print(f"  - Warning: Could not stat file {file_path}. Error: {e}")
+            continue
+        if stat.S_ISREG(file_stat.st_mode):
+            current_files[f"{label}/{os.path.basename(file_path)}"] = (label, file_path, file_stat)
+
+    # Each key becomes one action, in output order:
+    #   ('copy', key)   unchanged size and mtime -> reuse the existing row without opening the file
+    #   ('read', key)   new or changed file -> read and hash it in the worker pool
+    #   ('delete', key) no longer on disk -> drop its old row
+    def iter_actions():
+        for key in sorted(set(old_files) | set(current_files), key=manifest_sort_key):
+            if key not in current_files:
+                yield 'delete', key
+                continue
+            old_entry = old_files.get(key)
+            file_stat = current_files[key][2]
+            if old_entry and old_entry['size'] == file_stat.st_size and old_entry['mtime_ns'] == file_stat.st_mtime_ns:
+                yield 'copy', key
+            else:
+                yield 'read', key
+
+    def iter_results(executor):
+        # Like ordered_parallel_map(), but only 'read' actions are sent to the pool
+        pending = deque()
+        for action, key in iter_actions():
+            future = executor.submit(read_and_hash_sample_file, current_files[key][:2]) if action == 'read' else None
+            pending.append((action, key, future))
+            if len(pending) >= max_in_flight:
+                action, key, future = pending.popleft()
+                yield action, key, future.result() if future else None
+        while pending:
+            action, key, future = pending.popleft()
+            yield action, key, future.result() if future else None
+
+    counts = {'skipped': 0, 'new': 0, 'changed': 0, 'unchanged_content': 0, 'deleted': 0, 'unreadable': 0}
+    new_files = {}
+    records_written = 0
+    tmp_file = output_file + '.tmp'
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    old_csv = open(output_file, 'r', newline='', encoding='utf-8') if old_manifest else None
+    try:
+        old_rows = csv.reader(old_csv) if old_csv else None
+        if old_rows is not None:
+            next(old_rows, None)  # header
+        with open(tmp_file, 'w', newline='', encoding='utf-8') as csvfile, executor_cls(max_workers=workers) as executor:
+            writer = csv.writer(csvfile)
+            writer.writerow(FIELDNAMES)
+            for action, key, result in iter_results(executor):
+                old_entry = old_files.get(key)
+                old_row = None
+                if old_entry and old_entry['row']:
+                    old_row = next(old_rows, None)
+                    if old_row is None:
+                        raise ValueError(f"{output_file} has fewer rows than its manifest")
+
+                if action == 'delete':
+                    counts['deleted'] += 1
+                    continue
+
+                if action == 'copy':
+                    counts['skipped'] += 1
+                    row = old_row
+                    new_files[key] = old_entry
+                else:
+                    record, digest = result
+                    if digest is None:
+                        # Unreadable: no row and no manifest entry, so the next run retries it
+                        counts['unreadable'] += 1
+                        continue
+                    file_stat = current_files[key][2]
+                    if old_entry is None:
+                        counts['new'] += 1
+                    elif old_entry['sha256'] == digest:
+                        counts['unchanged_content'] += 1
+                    else:
+                        counts['changed'] += 1
+                    row = [record[field] for field in FIELDNAMES] if record else None
+                    new_files[key] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns,
+                                      'sha256': digest, 'row': record is not None}
+
+                if row is not None:
+                    writer.writerow(row)
+                    records_written += 1
+                    if records_written % 10000 == 0:
+                        print(f"  ...written {records_written} records")
+    except ValueError as e:
+        print(f"  - Warning: {e}. Falling back to a full build.")
+        old_csv.close()
+        old_csv = None
+        os.remove(tmp_file)
+        return create_dataset_incremental(root_dir, output_file, workers, use_processes, manifest_file, max_in_flight, force_full=True)
+    except IOError as e:
+        print(f"Error writing to file {output_file}. Error: {e}")
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+        return
+    finally:
+        if old_csv:
+            old_csv.close()
+
+    if not records_written:
+        os.remove(tmp_file)
+        print("No data was collected. The output file will not be created.")
+        return
+    os.replace(tmp_file, output_file)
+
+    manifest = {'version': MANIFEST_VERSION, 'output_size': os.path.getsize(output_file), 'files': new_files}
+    with open(manifest_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+    print(f"Successfully created dataset: {output_file} ({records_written} records)")
+    print(f"  Skipped {counts['skipped']} unchanged files; reprocessed {counts['new']} new, {counts['changed']} changed "
+          f"and {counts['unchanged_content']} touched-but-identical files; removed {counts['deleted']} deleted files.")
+    if counts['unreadable']:
+        print(f"  {counts['unreadable']} unreadable files were left out and will be retried on the next run.")
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create the OHSUMED CSV dataset from category directories.")
     # The script assumes it's run from the 'ohsumed-all' directory's parent,
     # or you can specify the path directly.
-    # We'll use '.' to indicate the current directory based on your context. 
-    current_directory = '.' 
-    csv_filename = 'ohsumed_dataset.csv' # Corrected from 'ohsumed_dataset.csv'
-    
-    create_dataset(current_directory, csv_filename)
+    parser.add_argument('root_dir', nargs='?', default='.', help="Directory containing the C01, C02, ... folders.")
+    parser.add_argument('--output', default='ohsumed_dataset.csv', help="Output CSV file.")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Read files with N parallel workers and stream rows to the output (0 = original sequential mode).")
+    parser.add_argument('--processes', action='store_true', help="Use worker processes instead of threads.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only reprocess new, changed or deleted files, using <output>.manifest.json.")
+    parser.add_argument('--full-rebuild', action='store_true', help="With --incremental, ignore the existing manifest.")
+    args = parser.parse_args()
+
+    if args.incremental:
+        create_dataset_incremental(args.root_dir, args.output, workers=max(args.workers, 1),
+                                   use_processes=args.processes, force_full=args.full_rebuild)
+    elif args.workers > 0:
+        create_dataset_streaming(args.root_dir, args.output, workers=args.workers, use_processes=args.processes)
+    else:
+        create_dataset(args.root_dir, args.output)
@@ -0,0 +1,264 @@
+"""
+Shared loader for ohsumed_dataset.csv.
+
+The CSV is parsed once with a real CSV parser (so titles keep their trailing period and
+multi-line abstracts are handled correctly) and stored as a binary columnar cache:
+
+    <cache_dir>/<source sha256[:16]>/
+        meta.json                       version, source hash / path / size / mtime, row count, label names
+        label_ids.npy                   int16 label id per row (ids follow the sorted label names)
+        <column>.blob.npy / .offsets.npy UTF-8 bytes of every text + row offsets into the blob
+
+Every array is opened with np.load(mmap_mode='r'), so loading the cache is nearly free and
+several notebooks / processes share the same pages. The cache key is the SHA-256 of the
+source CSV, so a changed dataset automatically gets a new cache. When the CSV's path, size
+and mtime match a cache's meta.json, the stored hash is reused and the CSV is not read at all.
+
+Usage:
+    from ohsumed_loader import load_ohsumed
+    df = load_ohsumed()                        # DataFrame with title / abstract / label / label_id
+    dataset = open_ohsumed()                   # memory-mapped OhsumedDataset
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DATA_URL = "https://media.githubusercontent.com/media/Heng1222/Ohsumed_classification/refs/heads/main/classification_data/ohsumed_dataset.csv"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ohsumed')
+CACHE_VERSION = 1
+TEXT_COLUMNS = ('title', 'abstract')
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def resolve_source(source=DEFAULT_DATA_URL, cache_dir=DEFAULT_CACHE_DIR, refresh=False):
+    """
+    Returns a local path for the dataset CSV.
+
+    Local paths are returned as is. URLs are downloaded once into cache_dir (keyed by the URL)
+    and reused afterwards; pass refresh=True to download again.
+    """
+    if not source.startswith(('http://', 'https://')):
+        if not os.path.isfile(source):
+            raise FileNotFoundError(f"Dataset file '{source}' not found.")
+        return source
+
+    os.makedirs(cache_dir, exist_ok=True)
+    url_key = hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+    local_path = os.path.join(cache_dir, f'download_{url_key}.csv')
+    if refresh or not os.path.exists(local_path):
+        print(f"Downloading dataset from {source} ...")
+        tmp_path = local_path + '.tmp'
+        with urllib.request.urlopen(source) as response, open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(response, f)
+        os.replace(tmp_path, local_path)
+    return local_path
+
+
+def _pack_texts(texts):
+    """Packs a sequence of strings into (uint8 UTF-8 blob, int64 offsets)."""
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def source_stat(csv_path):
+    """Path, size and mtime of the source CSV, stored in meta.json to skip re-hashing an unchanged file."""
+    stat = os.stat(csv_path)
+    return {'source_path': os.path.abspath(csv_path), 'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def read_meta(cache_path):
+    """Returns the meta.json of a cache directory, or None if it is missing, corrupt or from another version."""
+    try:
+        with open(os.path.join(cache_path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == CACHE_VERSION else None
+
+
+def write_meta(cache_path, meta):
+    tmp_file = os.path.join(cache_path, 'meta.json.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_file, os.path.join(cache_path, 'meta.json'))
+
+
+def find_cache_by_stat(cache_dir, stat):
+    """Returns the cache directory whose meta.json records the same source path, size and mtime, or None."""
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return None
+    for name in names:
+        cache_path = os.path.join(cache_dir, name)
+        if name.endswith('.tmp') or not os.path.isfile(os.path.join(cache_path, 'meta.json')):
+            continue
+        meta = read_meta(cache_path)
+        if meta and all(meta.get(key) == value for key, value in stat.items()):
+            return cache_path
+    return None
+
+
+def build_cache(csv_path, cache_path, source_sha256, stat=None):
+    """Parses the CSV once and writes the columnar cache directory (atomically via a temp dir)."""
+    print(f"Parsing '{csv_path}' and building the columnar cache...")
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    missing = [column for column in TEXT_COLUMNS + ('label',) if column not in df.columns]
+    if missing:
+        raise ValueError(f"'{csv_path}' is missing columns {missing} (is it a Git LFS pointer?)")
+    label_names = sorted(df['label'].unique())
+    label_to_id = {label: i for i, label in enumerate(label_names)}
+
+    tmp_path = cache_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, 'label_ids.npy'), df['label'].map(label_to_id).to_numpy(dtype=np.int16))
+    for column in TEXT_COLUMNS:
+        blob, offsets = _pack_texts(df[column].tolist())
+        np.save(os.path.join(tmp_path, f'{column}.blob.npy'), blob)
+        np.save(os.path.join(tmp_path, f'{column}.offsets.npy'), offsets)
+    write_meta(tmp_path, {
+        'version': CACHE_VERSION,
+        'source_sha256': source_sha256,
+        **(stat or {}),
+        'num_rows': len(df),
+        'label_names': label_names,
+    })
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+    print(f"Cached {len(df)} records to '{cache_path}'.")
+
+
+class OhsumedDataset:
+    """
+    Memory-mapped view of the columnar cache.
+
+    Attributes:
+        label_names (list[str]): Label names; label id i is label_names[i] (sorted, e.g. C01 -> 0).
+        label_ids (np.memmap): int16 label id of every row.
+    """
+
+    def __init__(self, cache_path):
+        with open(os.path.join(cache_path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.cache_path = cache_path
+        self.label_names = self.meta['label_names']
+        self.label_ids = np.load(os.path.join(cache_path, 'label_ids.npy'), mmap_mode='r')
+        self._blobs = {}
+        self._offsets = {}
+        for column in TEXT_COLUMNS:
+            self._blobs[column] = np.load(os.path.join(cache_path, f'{column}.blob.npy'), mmap_mode='r')
+            self._offsets[column] = np.load(os.path.join(cache_path, f'{column}.offsets.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return self.meta['num_rows']
+
+    @property
+    def label_to_id(self):
+        return {label: i for i, label in enumerate(self.label_names)}
+
+    def text(self, column, index):
+        """Returns the text of one row."""
+        offsets = self._offsets[column]
+        return self._blobs[column][offsets[index]:offsets[index + 1]].tobytes().decode('utf-8')
+
+    def texts(self, column, indices=None):
+        """Returns the texts of the given rows (all rows if indices is None) as a list of str."""
+        offsets = self._offsets[column]
+        if indices is None:
+            # One contiguous read of the whole blob, then slice it in Python
+            blob = self._blobs[column].tobytes()
+            return [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+        return [self.text(column, int(i)) for i in indices]
+
+    def labels(self, indices=None):
+        """Returns the label names of the given rows."""
+        label_ids = self.label_ids if indices is None else self.label_ids[np.asarray(indices)]
+        return np.asarray(self.label_names, dtype=object)[label_ids]
+
+    def to_dataframe(self, columns=('title', 'abstract', 'label', 'label_id'), flatten_newlines=False):
+        """
+        Builds a DataFrame with the requested columns.
+
+        Args:
+            columns (tuple): Any of 'title', 'abstract', 'label' (name) and 'label_id' (int).
+            flatten_newlines (bool): Replace newlines inside texts with spaces
+                (what the old regex loader did to abstracts).
+        """
+        data = {}
+        for column in columns:
+            if column in TEXT_COLUMNS:
+                values = self.texts(column)
+                data[column] = [v.replace('\n', ' ') for v in values] if flatten_newlines else values
+            elif column == 'label':
+                data[column] = self.labels()
+            elif column == 'label_id':
+                data[column] = np.asarray(self.label_ids, dtype=np.int64)
+            else:
+                raise KeyError(f"Unknown column '{column}'")
+        return pd.DataFrame(data)
+
+
+def open_ohsumed(source=DEFAULT_DATA_URL, cache_dir=DEFAULT_CACHE_DIR, refresh=False):
+    """
+    Returns a memory-mapped OhsumedDataset, building the cache if the source is new or changed.
+
+    Args:
+        source (str): Local path or URL of ohsumed_dataset.csv.
+        cache_dir (str): Directory for downloads and columnar caches.
+        refresh (bool): Download the source URL again before checking the cache.
+    """
+    csv_path = resolve_source(source, cache_dir, refresh)
+    stat = source_stat(csv_path)
+    # Unchanged path, size and mtime: reuse the stored hash instead of reading the whole CSV
+    cache_path = find_cache_by_stat(cache_dir, stat)
+    if cache_path is not None:
+        return OhsumedDataset(cache_path)
+
+    source_sha256 = file_sha256(csv_path)
+    cache_path = os.path.join(cache_dir, source_sha256[:16])
+    meta = read_meta(cache_path)
+    if not meta or meta.get('source_sha256') != source_sha256:
+        build_cache(csv_path, cache_path, source_sha256, stat)
+    else:
+        # Same content under a new path or mtime (e.g. re-downloaded): record it so the next open skips hashing
+        write_meta(cache_path, {**meta, **stat})
+    return OhsumedDataset(cache_path)
+
+
+def load_ohsumed(source=DEFAULT_DATA_URL, cache_dir=DEFAULT_CACHE_DIR, columns=('title', 'abstract', 'label', 'label_id'),
+                 flatten_newlines=False, refresh=False):
+    """Convenience wrapper: open_ohsumed(...).to_dataframe(columns, flatten_newlines)."""
+    return open_ohsumed(source, cache_dir, refresh).to_dataframe(columns, flatten_newlines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build (or verify) the columnar cache of ohsumed_dataset.csv.")
+    parser.add_argument('source', nargs='?', default=DEFAULT_DATA_URL, help="Local path or URL of the CSV.")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--refresh', action='store_true', help="Download the source URL again.")
+    args = parser.parse_args()
+
+    try:
+        dataset = open_ohsumed(args.source, args.cache_dir, args.refresh)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"{len(dataset)} records, {len(dataset.label_names)} labels, cache at '{dataset.cache_path}'.")
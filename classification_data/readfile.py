@@ -1,3 +1,5 @@
+import argparse
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 import matplotlib.pyplot as plt
@@ -10,6 +12,7 @@ CSV_FILE_PATH = 'ohsumed_dataset.csv'
 TRAIN_SET_RATIO = 1
 TEST_SET_RATIO = 0.0
 RANDOM_STATE = 42  # for reproducibility
+CHUNK_SIZE = 50000  # rows per chunk in streaming EDA mode
 
 def perform_eda(df: pd.DataFrame, dataset_name: str):
     """
@@ -92,16 +95,215 @@ def perform_eda(df: pd.DataFrame, dataset_name: str):
         print("[!] 'abstract' column not found. Skipping abstract length analysis.")
 
 
+class LengthSketch:
+    """
+    Mergeable sketch of text lengths for streaming EDA.
+
+    Lengths are integers, so the sketch is simply a frequency table (counts[length] = number
+    of rows with that length). Its size depends on the longest text, not on the number of rows,
+    two sketches merge by addition, and describe() / histograms computed from it are exact.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, lengths):
+        self.merge_counts(np.bincount(np.asarray(lengths, dtype=np.int64)))
+
+    def merge(self, other):
+        self.merge_counts(other.counts)
+
+    def merge_counts(self, counts):
+        if len(counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(counts) - len(self.counts)))
+        self.counts[:len(counts)] += counts
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def values_and_weights(self):
+        """Returns (distinct lengths, number of rows with each length)."""
+        values = np.flatnonzero(self.counts)
+        return values, self.counts[values]
+
+    def quantile(self, q):
+        # Same linear interpolation as pandas: position q * (n - 1) in the sorted lengths
+        values, weights = self.values_and_weights()
+        cumulative = np.cumsum(weights)
+        position = q * (self.total - 1)
+        lower, upper = int(np.floor(position)), int(np.ceil(position))
+        lower_value = values[np.searchsorted(cumulative, lower, side='right')]
+        upper_value = values[np.searchsorted(cumulative, upper, side='right')]
+        return lower_value + (upper_value - lower_value) * (position - lower)
+
+    def describe(self):
+        """Returns the same statistics as pd.Series.describe() on the raw lengths."""
+        values, weights = self.values_and_weights()
+        n = self.total
+        mean = float((values * weights).sum()) / n
+        std = float(np.sqrt((weights * (values - mean) ** 2).sum() / (n - 1))) if n > 1 else np.nan
+        stats = [n, mean, std, values.min(), self.quantile(0.25), self.quantile(0.5), self.quantile(0.75), values.max()]
+        return pd.Series(stats, index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'],
+                         name=self.name, dtype='float64')
+
+    def kde_bw_method(self):
+        """
+        Bandwidth factor that makes a count-weighted KDE identical to the KDE of the raw lengths.
+
+        scipy's gaussian_kde uses the effective sample size and a weighted covariance when
+        weights are given, so Scott's factor is rescaled to match the unweighted bandwidth.
+        """
+        values, weights = self.values_and_weights()
+        n = self.total
+        mean = (values * weights).sum() / n
+        squared_deviation = (weights * (values - mean) ** 2).sum()
+        raw_covariance = squared_deviation / (n - 1)
+        weighted_covariance = (squared_deviation / n) / (1 - ((weights / n) ** 2).sum())
+        return n ** (-1 / 5) * np.sqrt(raw_covariance / weighted_covariance)
+
+
+def scan_csv_in_chunks(csv_path: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Reads the dataset chunk by chunk and collects everything the EDA needs.
+
+    Memory stays flat regardless of the number of rows: only label counts, the length
+    sketches and the first few rows (for print_dataset_samples) are kept.
+
+    Returns:
+        dict: total_records, label_counts (pd.Series or None), title / abstract LengthSketch
+              (or None if the column is missing) and head (first rows of the file).
+    """
+    total_records = 0
+    label_counts = None
+    sketches = {}
+    head = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        total_records += len(chunk)
+        if head is None:
+            head = chunk.head(5)
+        if 'label' in chunk.columns:
+            chunk_counts = chunk['label'].value_counts()
+            label_counts = chunk_counts if label_counts is None else label_counts.add(chunk_counts, fill_value=0)
+        for column in ('title', 'abstract'):
+            if column in chunk.columns:
+                # Vectorized string lengths (same astype(str) semantics as perform_eda)
+                lengths = chunk[column].astype(str).str.len().to_numpy()
+                sketches.setdefault(column, LengthSketch(f'{column}_length')).update(lengths)
+    if label_counts is not None:
+        label_counts = label_counts.astype('int64').sort_values(ascending=False, kind='stable')
+        label_counts.index.name = 'label'
+        label_counts.name = 'count'
+    return {
+        'total_records': total_records,
+        'label_counts': label_counts,
+        'title': sketches.get('title'),
+        'abstract': sketches.get('abstract'),
+        'head': head if head is not None else pd.DataFrame(),
+    }
+
+
+def plot_length_sketch(sketch: LengthSketch, column_title: str, dataset_name: str, plot_filename: str):
+    """Draws the same histogram + KDE plot as perform_eda, from a LengthSketch instead of raw lengths."""
+    values, weights = sketch.values_and_weights()
+    plt.figure(figsize=(12, 6))
+    sns.histplot(x=values, weights=weights, bins=50, kde=True, kde_kws={'bw_method': sketch.kde_bw_method()})
+    plt.title(f'{column_title} Length Distribution in {dataset_name}', fontsize=16)
+    plt.xlabel(f'{column_title} Length (Characters)', fontsize=12)
+    plt.ylabel('Frequency', fontsize=12)
+    plt.tight_layout()
+    plt.savefig(plot_filename)
+    plt.close()
+
+
+def perform_eda_streaming(csv_path: str, dataset_name: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Streaming version of perform_eda: reads the CSV in chunks instead of loading it into a
+    dataframe, and produces the same printed statistics and PNG plots.
+
+    Args:
+        csv_path (str): Path of the dataset CSV.
+        dataset_name (str): The name of the dataset for titles and logging.
+        chunk_size (int): Number of rows read per chunk.
+
+    Returns:
+        pd.DataFrame: The first rows of the file (for print_dataset_samples).
+    """
+    stats = scan_csv_in_chunks(csv_path, chunk_size)
+
+    print("\n" + "="*50)
+    print(f"  Exploratory Data Analysis (EDA) for: {dataset_name}")
+    print("="*50 + "\n")
+
+    # 1. Basic Information
+    print(f"[*] Total number of records: {stats['total_records']}")
+    if stats['total_records'] == 0:
+        print("[!] The dataframe is empty. Skipping further analysis.")
+        return stats['head']
+
+    # 2. Label Distribution
+    print("\n[*] Label Distribution:")
+    label_counts = stats['label_counts']
+    if label_counts is not None:
+        print(label_counts)
+
+        # Plotting label distribution (bar heights are the merged counts, same as countplot)
+        plt.figure(figsize=(12, 8))
+        sns.barplot(x=label_counts.values, y=label_counts.index.astype(str), hue=label_counts.index.astype(str),
+                    order=label_counts.index.astype(str), palette='viridis', legend=False)
+        plt.title(f'Label Distribution in {dataset_name}', fontsize=16)
+        plt.xlabel('Count', fontsize=12)
+        plt.ylabel('Label', fontsize=12)
+        plt.tight_layout()
+        plot_filename_labels = f'img/eda_labels_{dataset_name.replace(" ", "_").lower()}.png'
+        plt.savefig(plot_filename_labels)
+        print(f"\n[+] Saved label distribution plot to: {plot_filename_labels}")
+        plt.close()
+    else:
+        print("[!] 'label' column not found. Skipping label analysis.")
+
+    # 3. / 4. Title and Abstract Length Analysis (in characters)
+    for step, column in ((3, 'title'), (4, 'abstract')):
+        column_title = column.capitalize()
+        print(f"\n[*] {column_title} Length Analysis (Number of Characters):")
+        sketch = stats[column]
+        if sketch is None:
+            print(f"[!] '{column}' column not found. Skipping {column} length analysis.")
+            continue
+        print(sketch.describe())
+        plot_filename_length = f'img/eda_{column}_length_{dataset_name.replace(" ", "_").lower()}.png'
+        plot_length_sketch(sketch, column_title, dataset_name, plot_filename_length)
+        print(f"[+] Saved {column} length distribution plot to: {plot_filename_length}")
+
+    return stats['head']
+
+
 def main():
     """
     Main function to read, split, and analyze the dataset.
     """
+    parser = argparse.ArgumentParser(description="EDA for the OHSUMED CSV dataset.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Read the CSV in chunks with flat memory instead of loading it all at once.")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows per chunk in streaming mode.")
+    args = parser.parse_args()
+
     # Check if the CSV file exists
     if not os.path.exists(CSV_FILE_PATH):
         print(f"Error: The file '{CSV_FILE_PATH}' was not found.")
         print("Please ensure you have run the 'create_dataset.py' script first.")
         sys.exit(1)
 
+    if args.streaming:
+        print(f"Streaming data from '{CSV_FILE_PATH}' in chunks of {args.chunk_size} rows...")
+        head = perform_eda_streaming(CSV_FILE_PATH, "Complete Dataset", args.chunk_size)
+        print("\n" + "="*50)
+        print("EDA process finished. Plots have been saved to PNG files.")
+        print("="*50)
+        print_dataset_samples(head)
+        return
+
     # 1. Read the CSV file
     print(f"Reading data from '{CSV_FILE_PATH}'...")
     try: